@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# Bike Count Data Cleaner - throughput benchmarks
+# Times the stages of the cleaner on synthetic workbooks (see supertue/synthetic.py),
+# so a change that slows the cleaner down is caught without the council's workbook.
+#
+#   python benchmarks/run_benchmarks.py                  compare the small scenario with its baseline
+#   python benchmarks/run_benchmarks.py --scenario all   every scenario
+#   python benchmarks/run_benchmarks.py --save           record the results as the new baselines
+#
+# Stages:
+#   extract     scrape every worksheet into a CountStore
+#   summary     write the count observation, summary and location .csv files
+#   rollup      write the all sites tables
+# For each stage: sheets/sec, blocks/sec (count blocks), peak memory (MB, python allocations
+# traced with tracemalloc, so python 3 only) and output bytes.
+# Timings depend on the machine, baselines.json holds the results of the machine that saved it.
+# The exit status is 1 if any stage is slower, or uses more memory or output, than its baseline
+# by more than the tolerance.
+# -----------------------------
+
+from __future__ import division, print_function
+
+import argparse
+import collections
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from supertue.batch import READERS
+from supertue.extract import extract_workbooks
+from supertue.output import GIS_DIR, RESULTS_DIR, SUMMARY_DIR, SiteWriter
+from supertue.rollup import ALLSITES_DIR, write_rollup
+from supertue.store import CountStore
+from supertue.synthetic import make_workbook
+
+
+BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# Workbooks to benchmark, arguments of synthetic.make_workbook()
+SCENARIOS = collections.OrderedDict([
+    ('small', {'sites': 95, 'blocks': 4, 'legacy_blocks': 1, 'na_density': 0.1, 'gender_split': 0.75}),
+    ('large', {'sites': 600, 'blocks': 7, 'legacy_blocks': 2, 'na_density': 0.1, 'gender_split': 0.75}),
+    ])
+
+STAGES = ['extract', 'summary', 'rollup']
+
+# Metrics that regress when they fall, and when they grow
+THROUGHPUT_METRICS = ['sheets_per_sec', 'blocks_per_sec']
+SIZE_METRICS = ['peak_mb', 'output_bytes']
+
+
+def directory_bytes(directories):
+    total = 0
+    for directory in directories:
+        for (path, dirs, files) in os.walk(directory):
+            total += sum(os.path.getsize(os.path.join(path, name)) for name in files)
+    return total
+
+
+class Quiet(object):
+    # Discard the cleaner's progress messages while a stage is timed
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *exc_info):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def run_stages(workbook, sheet_nums, reader, jobs):
+    """
+    Run each stage once. Returns {stage: (seconds, output bytes)} and the number of count blocks.
+    """
+    results = {}
+
+    start = time.time()
+    store = CountStore()
+    for record in extract_workbooks([workbook], sheet_nums, jobs=jobs, reader=reader):
+        store.add_record(record)
+    results['extract'] = (time.time() - start, 0)
+
+    start = time.time()
+    writer = SiteWriter()
+    for (countsite, site) in store.sites.items():
+        writer.write({'countsite': countsite, 'site': site, 'counts': store.select(site=countsite)})
+    writer.close()
+    results['summary'] = (time.time() - start, directory_bytes([RESULTS_DIR, SUMMARY_DIR, GIS_DIR]))
+
+    start = time.time()
+    write_rollup(store)
+    results['rollup'] = (time.time() - start, directory_bytes([ALLSITES_DIR]))
+
+    return results, len(store.counts)
+
+
+def _traced_peak(stage, *args):
+    # Peak python allocations made while running a stage
+    tracemalloc.start()
+    try:
+        stage(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def peak_memory(workbook, sheet_nums, reader):
+    # Peak traced memory of each stage, in a serial run (worker processes are not traced)
+    if tracemalloc is None:
+        return dict((stage, None) for stage in STAGES)
+    store = CountStore()
+
+    def extract():
+        for record in extract_workbooks([workbook], sheet_nums, reader=reader):
+            store.add_record(record)
+
+    def summary():
+        writer = SiteWriter()
+        for (countsite, site) in store.sites.items():
+            writer.write({'countsite': countsite, 'site': site, 'counts': store.select(site=countsite)})
+        writer.close()
+
+    peaks = {'extract': _traced_peak(extract),
+             'summary': _traced_peak(summary),
+             'rollup': _traced_peak(write_rollup, store)}
+    return dict((stage, round(peak / 2.0 ** 20, 1)) for (stage, peak) in peaks.items())
+
+
+def benchmark(name, reader='xlrd', jobs=1, repeat=3):
+    """
+    Benchmark one scenario in a scratch directory. Returns {stage: {metric: value}}
+    """
+    scenario = SCENARIOS[name]
+    cwd = os.getcwd()
+    scratch = tempfile.mkdtemp(prefix='supertue_benchmark_')
+    try:
+        # The cleaner writes to ./script_output/
+        os.chdir(scratch)
+        workbook = os.path.join(scratch, name + '.xlsx')
+        sheet_nums = make_workbook(workbook, **scenario)
+
+        best = {}
+        for _ in range(repeat):
+            shutil.rmtree('script_output', ignore_errors=True)
+            with Quiet():
+                (results, blocks) = run_stages(workbook, sheet_nums, reader, jobs)
+            for (stage, (seconds, output_bytes)) in results.items():
+                if stage not in best or seconds < best[stage][0]:
+                    best[stage] = (seconds, output_bytes)
+
+        shutil.rmtree('script_output', ignore_errors=True)
+        with Quiet():
+            peaks = peak_memory(workbook, sheet_nums, reader)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    metrics = collections.OrderedDict()
+    for stage in STAGES:
+        (seconds, output_bytes) = best[stage]
+        metrics[stage] = collections.OrderedDict([
+            ('sheets_per_sec', round(len(sheet_nums) / seconds, 1)),
+            ('blocks_per_sec', round(blocks / seconds, 1)),
+            ('peak_mb', peaks[stage]),
+            ('output_bytes', output_bytes)])
+    return metrics
+
+
+def regressions(metrics, baseline, tolerance):
+    # (stage, metric, value, baseline value) of every metric worse than its baseline by more than the tolerance
+    found = []
+    for stage in STAGES:
+        for metric in THROUGHPUT_METRICS + SIZE_METRICS:
+            value = metrics[stage][metric]
+            expected = baseline.get(stage, {}).get(metric)
+            if value is None or expected is None:
+                continue
+            if metric in THROUGHPUT_METRICS and value < expected * (1 - tolerance):
+                found.append((stage, metric, value, expected))
+            elif metric in SIZE_METRICS and value > expected * (1 + tolerance):
+                found.append((stage, metric, value, expected))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cleaner on synthetic workbooks')
+    parser.add_argument('--scenario', choices=list(SCENARIOS) + ['all'], default='small')
+    parser.add_argument('--reader', choices=READERS, default='xlrd')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each scenario, the fastest is kept (default 3)')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='allowed slow down or growth before a metric is a regression (default 0.3)')
+    parser.add_argument('--save', action='store_true', help='save the results as the baselines')
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINES_FILE):
+        with open(BASELINES_FILE) as baselines_file:
+            baselines = json.load(baselines_file)
+
+    names = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    failed = False
+    for name in names:
+        # Baselines are kept for each scenario, reader, number of jobs and python version
+        key = '%s/%s/jobs=%d/python%d' % (name, args.reader, args.jobs, sys.version_info[0])
+        metrics = benchmark(name, args.reader, args.jobs, args.repeat)
+
+        print(key)
+        print('  %-8s %15s %15s %10s %14s' % ('stage', 'sheets/sec', 'blocks/sec', 'peak MB', 'output bytes'))
+        for (stage, values) in metrics.items():
+            print('  %-8s %15s %15s %10s %14s' % (stage, values['sheets_per_sec'], values['blocks_per_sec'],
+                                                   values['peak_mb'], values['output_bytes']))
+
+        if args.save:
+            baselines[key] = metrics
+        elif key in baselines:
+            for (stage, metric, value, expected) in regressions(metrics, baselines[key], args.tolerance):
+                print('  REGRESSION', stage, metric + ':', value, 'baseline', expected)
+                failed = True
+        else:
+            print('  no baseline, save one with --save')
+
+    if args.save:
+        with open(BASELINES_FILE, 'w') as baselines_file:
+            json.dump(baselines, baselines_file, indent=1, sort_keys=True, separators=(',', ': '))
+        print('Saved', BASELINES_FILE)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
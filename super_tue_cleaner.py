@@ -20,463 +20,393 @@
 # In .csv format with filename /[Sheet_Name]/[Count_Date_YYYY_MM_DD]
 # Count location details in several header rows
 
-# ______________________________
-
-import os
-import collections
-from datetime import date,datetime,time
-
-try:
-    from xlrd import open_workbook,xldate_as_tuple
-except:
-    print("Install python module xlrd.  Available from https://pypi.python.org/pypi/xlrd")
-    exit()
-
-# - functions  -
-def sum_with_na (dic):
-    na_sum = 0
-    summation = 0
-    for k in dic:
-        try:
-            summation = summation + int(dic[k])
-        except:
-            na_sum = na_sum + 1
-        if na_sum == len(dic):
-            # If all cells contain NA, return NA, rather than 0
-            summation = 'NA'
-        else:
-            pass
-    return summation
-
-
-def sum_observations (direction_dic, countdic):
-    # 'direction' is a string, other imputs are dictionaries
-    # Returns a dictionary (direction[gender][timestamp], directionsum)
-
-    wholecount = {}
-    for gender in countdic:
-        genderdic = {}
-        for starttime in countdic[gender]:
-            turn_nacount = 0
-            turnsum = 0
-            # Count up the eight 15min bins in the 7 - 9 am observation period.
-            for v in direction_dic:
-                #Directions in a given 15min observation bin.
-                try:
-                    turnsum = turnsum + int(countdic[gender][starttime][v])
-                except:
-                    # bin contents is not a number (str 'NA')
-                    turn_nacount = turn_nacount +1
-
-                if turn_nacount == len(direction_dic):
-                    # The NAs are only intersting if every value = NA
-                    turnsum = 'NA'
-                else:
-                    pass
-                #turnsum here = total of all relevant turns in a 15min bin for a given gender (either an int or str 'NA')
-            genderdic[starttime] = turnsum
-
-            timesum = sum_with_na(genderdic)
-            wholecount[gender] = timesum
-    counttotal = sum_with_na(wholecount)
-    return counttotal
-
-# -  functions end --
-
-
-
+# Each stage of the cleaner can also be run on its own, as a subcommand:
+#   python super_tue_cleaner.py [all] [workbook ...]     every stage (the default)
+#   python super_tue_cleaner.py extract [workbook ...]   scrape the workbooks into the saved count store
+#   python super_tue_cleaner.py summarise                the count observation and summary .csv files
+#   python super_tue_cleaner.py locations                count_location_details.csv
+#   python super_tue_cleaner.py rollup                   the all sites tables
+#   python super_tue_cleaner.py geojson                  the GeoJSON map layer
+# extract takes --sites, summarise takes --sites and --years, to scrape or write only those sites (or years).
+# Options may be given before or after the subcommand.
+# The stages after extract read the count store saved by the last extract, not the workbook.
+# Each stage imports the modules it needs (xlrd, numpy, pandas) when it runs, so the script starts quickly.
 
+# ______________________________
 
-# Create a directory (if needed) for script output files
-resultsdir = "./script_output/count_observations/"
-if not os.path.exists(resultsdir):
-    os.makedirs(resultsdir)
+from __future__ import print_function
 
-# Create a directory (if needed) for location information
-gisdir = "./script_output/count_locations/"
-if not os.path.exists(gisdir):
-    os.makedirs(gisdir)
+import argparse
+import collections
+import os
+import sys
+import time
 
-# Create a directory (if needed) for summaries
-summarydir = "./script_output/summaries/"
-if not os.path.exists(summarydir):
-    os.makedirs(summarydir)
+from supertue import instrument
+from supertue.batch import READERS, find_workbooks, workbook_store_path
+from supertue.watch import WATCH_INTERVAL, watch
 
 
 # Open the source data excel spreadsheet
 inputfilename    = "Traffic Count - Bicycle Count - Bike count - \
 Morning Peak 7am to 9am - Weekday - Super ~ 2017.XLSX"
-workbook	= open_workbook(inputfilename, on_demand=True)
-print ' Opening ', inputfilename
-
-# Create a file for count details - potentially useful of GIS mapping.
-siteoutputfile = open(gisdir + "count_location_details.csv", "w")
-siteoutputfile.write('countsite, site_description, suburb, \
-dist_from_cbd, easting, northing, melway_ref, primary_road, secondary_road' + '\n')
-
-# Source file is a multiple worksheet excel file. One count site per sheet, mulitple counts on each sheet.
-# Count observations are recorded on work sheets (pythonic)6 'BW-CityLinkBrunswickRd' to 100 'MerriCrkTrailWestRingRdTrail'
-for worksheet_num in range(6, 101):  # From 6 to 101
-    sheet = workbook.sheet_by_index(worksheet_num)
-    countsite = sheet.name
-    print countsite
-
-    # Collect location information.
-    # Each worksheet contains a 'site details block' in (excel) rows 1 to 11
-
-    # site_description stored in excel cell C1 (pythonic 1,2). A text string that may contain commas
-    site_description = sheet.cell(1,2).value
-    site_description = site_description.replace(',', '')
-
-    # suburb stored in excel cell C2 (pythonic 2,2). A text string without commas
-    suburb = sheet.cell(2,2).value
-
-    # Distance from CBD is stored in excel cell C4 (pythonic 4,2). A decimal number with no more than 2 significant figures.
-    dist_from_cbd = str(sheet.cell(4,2).value)
-
-    #  GIS reference (Coordinate Reference System = GDA 94 MGA Zone 55 http://spatialreference.org/ref/epsg/gda94-mga-zone-55/)
-    # Easting is stored in excel cell H4 (pythonic 3,7). A decimal number with no more than 2 significant figures.
-    easting = str(sheet.cell(3,7).value)
-    # Northing (GDA 94 MGA Zone 55 Coordinate Reference System) is stored in excel cell L4 (pythonic 3,11) . A decimal number with no more than 2 significant figures.
-    northing = str(sheet.cell(3,11).value)
-
-    # Melway Map Grid Reference is stored in excel cell C4 (pythonic 3,2). A sting no longer than 7 characters.
-    # Note: Some spreadsheets may attempt to render a Melway grid reference like "24 E10" as a number in exponential notation.
-    melway_ref = sheet.cell(3,2).value
-
-    # The primary road is stored in excel cell D6 (pythonic 5,3). A string that may contain commas
-    primary_road = sheet.cell(5,3).value
-    primary_road = primary_road.replace(',', '')
-
-    # The secondary road is stored in excel cell M6 (pythonic 5,12). A string that may contain commas
-    secondary_road = sheet.cell(5,12).value
-    secondary_road = secondary_road.replace(',', '')
-
-    sitedic = collections.OrderedDict()
-
-
-    # Write site details to file
-    siteoutputfile.write(countsite + ", " + site_description + ", " + suburb \
-    + ", " + dist_from_cbd + ", " + easting + ", " + northing + ", " \
-    + melway_ref + ", " + primary_road + ", " + secondary_road + '\n')
-
-    # Collect details from each count.
-    for count_row in (92, 124, 156, 188, 221, 253, 285):
-        # The counts are recorded in blocks commencing on (excel)rows  93, 125, 157, 189, 221, 253, 285
-
-        # Collect count date
-        excel_format_count_date = ""
-        try:
-            #    The Count Date field is (first row of data block, column c)
-            excel_format_count_date = float(sheet.cell(count_row,2).value)
-        except:
-            pass
-
-        if excel_format_count_date != "":
-            #   A count data block only contains bin data if the Count Date field is populated
-            #   Skip a block if there is not value in Count Date
-
-            # Excel has its own date format, convert to YYYY-MM-DD
-            preformatted_date = xldate_as_tuple(excel_format_count_date,workbook.datemode)
-            formatted_date = date(*preformatted_date[0:3])
-            str_formatted_date = str(formatted_date)
-            survey_year = preformatted_date[0]
-
-            # Create directory (if needed) and empty text file for details of this day's count.
-            savepoint = resultsdir + countsite + "/" + str(formatted_date) + "/"
-
-            if not os.path.exists(savepoint):
-                os.makedirs(savepoint)
-            output_file = open(savepoint + countsite + str_formatted_date + ".csv", "w")
-
-            # Collect details specific to an given count date.
-            # Collect bin duration. Stored in second row, colunn K. An integer.
-            try:
-                bin_duration = int(sheet.cell(count_row+1,10).value)
-            except:
-                # Values should be either 15 or 120. Data source contains errors.
-                # Some bin_duration fields that should contain the value 15 have been left blank.
-                # Specify bin_duration as 15 if data is missing
-                bin_duration = 15
-
-            # Collect gender split. Stored in second row, column O. A Booleen string, either Y or N
-            gender_split = sheet.cell(count_row+1,14).value
-
-            # Collect Counter details (where provided).  Stored in first row column U. A string, may contain non alpha characters including commas.
-            counter_name = sheet.cell(count_row,20).value
-            counter_name = counter_name.replace(',', '')
-
-            # Specify that you are counting bicycles, other counts condcuted by Council record a mix of bicycles and pedestrians.
-            counting = "bicycle riders"
-
-            # Sixth line of results file, a header for count specific information
-#            output_file.write('countsite, count_date, bin_duration, counting, gender_split, counter' + '\n')
-
-            # Seventh line of results file, the count specific information
-#            output_file.write(
-#                countsite + ", " + str(formatted_date) + ", " \
-#                + str(bin_duration) + ", " + counting + ", "\
-#                + gender_split + ", " + counter_name + '\n'
-#                )
-#            output_file.write('\n')
-
-            countdic = {}
-
-            # Collect movement bin and turn details from this year's count
-            output_file.write('countsite, time, bin_duration, counting, gender, north_turn_left, north_through, north_turn_right, east_turn_left, east_through, east_turn_right, south_turn_left, south_through, south_turn_right, west_turn_left, west_through, west_turn_right' + '\n')
-
-            # A full data block has bin_duration = "15", gender_split = "Y"
-            # There are no counts that have have a gender count without a 15min breakdown
-            # However, a few 15min counts do not have gender breakdowns.
-
-            # Desired Data output order female cyclists, 7:00 to 9:00 a line break, new header row then male cyclists, 7:00 to 9:00
-            if gender_split == 'Y':
-                genders = ('F','M')
-            else:
-                genders = ('NA',)
-
-            for gender in genders:
-
-                genderdic = {}
-
-
-
-                # Collect each of the 15 minute observations
-                for obs_row in range(5,13):
-                    # Data in a full block has movement observations recorded in the sixth to thirteen rows
-
-                    # The first column contains the start time in excel time format.
-                    excel_start_time = sheet.cell(count_row + obs_row,0).value
-
-                    # Convert start time to YYYY-MM-DD HH:MM:SS format  TODO: Can we change the formating to lose the seconds?
-                    preformatted_start_time	= xldate_as_tuple(excel_start_time,workbook.datemode)
-                    formatted_time = time(*preformatted_start_time[3:5])
-                    start_datetime = datetime.combine(formatted_date,formatted_time)
-
-                    # Collect observation data (how many people made what turn)
-                    # The movements of male cyclists (or NA gender) are recorded in columns C, E, G, I, K, M, O, Q, S, U, W, Y
-
-
-                    male_movements = [
-                                    ('north_turn_right', 2), ('north_through', 4), ('north_turn_left',6),\
-                                    ('east_turn_right',8),('east_through',10),('east_turn_left',12),\
-                                    ('south_turn_right',14),('south_through',16),('south_turn_left',18),\
-                                    ('west_turn_right',20),('west_through',22),('west_turn_left',24)\
-                                    ]
-
-                    turndic = {}
-                    for (turn, turn_col) in male_movements:
-                        if gender == 'F':
-                            turn_col = turn_col+1
-                            # The movments of female cyclists are recorded in next column (i,e columns D, F, H, J, L, N, P, R, T, V, X, Z)
-
-                        try:
-                            turnscrape = int(sheet.cell(count_row + obs_row,turn_col).value)
-                        except:
-                            turnscrape = "NA"
-
-                        turndic[turn] = turnscrape
-
-                    output_file.write(
-                        countsite + ", " + str(start_datetime) + ", " \
-                        + str(bin_duration) + ", " + counting + ", " + gender + ", " \
-                        + str(turndic['north_turn_left']) + ", " + str(turndic['north_through']) + ", " + str(turndic['north_turn_right']) + ", " \
-                        + str(turndic['east_turn_left']) + ", " + str(turndic['east_through']) + ", " + str(turndic['east_turn_right']) + ", " \
-                        + str(turndic['south_turn_left']) + ", " + str(turndic['south_through']) + ", " + str(turndic['south_turn_right']) + ", " \
-                        + str(turndic['west_turn_left']) + ", " + str(turndic['west_through']) + ", "   + str(turndic['west_turn_right']) + '\n' \
-                        )
-
-
-                    # ------------------------------------------------------------------------------
-                    # Step 2
-                    # Sum observations to develop useful information
-                    # Also, scrape excel spreadsheet for old super tuesday ( bin_duration = 120 counts ) data.
-
-                    # Create a .csv file reporting each metric suitable for plotting change over time (and calcuating annualised growth for each site.
-                    # ------------------------------------------------------------------------------
-
-                    # Store all the count observations made on a specified count date for calculations
-                    genderdic[start_datetime] = turndic
-                countdic[gender] = genderdic
-
-            countsummary = {}
-            countsummary['countsite'] = countsite
-            countsummary['dist_from_cbd'] = dist_from_cbd
-            countsummary['time'] = min(countdic[gender])
-            countsummary['bin_duration'] = 120 # Hard coded, it would be better if it were summed from consituent rows.
-            countsummary['counting'] = 'bicycle riders'
-            countsummary['gender'] = 'NA'
-
-            all_moves_dic = ['north_turn_right', 'north_through', 'north_turn_left', \
-                            'east_turn_right', 'east_through', 'east_turn_left',\
-                            'south_turn_right','south_through','south_turn_left',\
-                            'west_turn_right','west_through','west_turn_left']
-            all_moves = sum_observations(all_moves_dic, countdic)
-            countsummary['total'] = all_moves
-#            print countsite, all_moves, 'All bike movements'
-
-            from_north_dic  = ['north_turn_left', 'north_through','north_turn_right']
-            from_north = sum_observations(from_north_dic, countdic);
-            countsummary['from_north'] = from_north
-#            print countsite, from_north, "From North"
-
-            from_east_dic   = ['east_turn_left', 'east_through', 'east_turn_right']
-            from_east = sum_observations(from_east_dic, countdic)
-            countsummary['from_east'] = from_east
-#            print countsite, from_east, "From East"
-
-            from_south_dic  = ['south_turn_left', 'south_through', 'south_turn_right']
-            from_south = sum_observations(from_south_dic, countdic)
-            countsummary['from_south'] = from_south
-#            print countsite, from_south, "From South"
-
-            from_west_dic   = ['west_turn_left', 'west_through', 'west_turn_right']
-            from_west = sum_observations(from_west_dic, countdic)
-            countsummary['from_west'] = from_west
-#            print countsite, from_west, "From West"
-
-            to_north_dic    = ['east_turn_right', 'south_through', 'west_turn_left']
-            to_north = sum_observations(to_north_dic, countdic)
-            countsummary['to_north'] = to_north
-#            print countsite, to_north, "To North"
-
-            to_east_dic     = ['north_turn_left', 'west_through', 'south_turn_right']
-            to_east  = sum_observations(to_east_dic, countdic)
-            countsummary['to_east'] = to_east
-#            print countsite, to_east, "To East"
-
-            to_south_dic    = ['north_through', 'east_turn_left', 'west_turn_right']
-            to_south  = sum_observations(to_south_dic, countdic)
-            countsummary['to_south'] = to_east
-#            print countsite, to_south, "To South"
-
-            to_west_dic     = ['north_turn_right', 'east_through', 'south_turn_left']
-            to_west   = sum_observations(to_west_dic, countdic)
-            countsummary['to_west'] = to_west
-#            print countsite, to_west, "To West"
-
-            sitedic[str_formatted_date] = countsummary
-        # ------------------------------------------------------------------------------
-        # Old Super Tuesday counts
 
+# Modules to install, besides the standard library (pandas is optional)
+REQUIRED_MODULES = ('numpy', 'xlrd')
+
+# Subcommands, the first runs every stage
+COMMANDS = ['all', 'extract', 'summarise', 'locations', 'rollup', 'geojson']
+# Options that take a value, the argument after one of them is not the subcommand
+VALUE_OPTIONS = ('--report', '-j', '--jobs', '--reader', '--interval', '--sites', '--years')
+
+
+def _count_outputs(paths):
+    instrument.count('files_written', len(paths))
+    instrument.count('bytes_written', sum(os.path.getsize(path) for path in paths))
+
+
+def extract(args, workbooks, models=None, full=False, sites=None):
+    """
+    Scrape the workbooks (in order of precedence) into the count store of each workbook, merge them
+    and save the merged count store. Only the worksheets of the named sites are read if sites is given.
+    models holds the count store of each workbook from an earlier run in this process (watch mode),
+    other workbooks start from the count store saved by the last run, or from nothing if full is set.
+    Returns (the count store of each workbook, the merged count store).
+    """
+    from supertue.extract import extract_workbooks
+    from supertue.store import CountStore, merge_stores
+
+    for workbook in workbooks:
+        print(' Opening ', workbook)
+
+    # Worksheets may be scraped in parallel. Worksheets that have not changed since the last run
+    # are skipped, their counts come from the count store of that workbook saved by the last run
+    # (or kept in memory, in watch mode).
+    sources = collections.OrderedDict()
+    for workbook in workbooks:
+        if full:
+            sources[workbook] = CountStore()
+        elif workbook in (models or {}):
+            sources[workbook] = models[workbook]
+        else:
+            sources[workbook] = CountStore.load(workbook_store_path(workbook))
+    known_hashes = dict((workbook, store.hashes) for (workbook, store) in sources.items())
+
+    seen = dict((workbook, set()) for workbook in workbooks)
+    for record in extract_workbooks(workbooks, jobs=args.jobs, known_hashes=known_hashes, reader=args.reader,
+                                    sites=sites):
+        seen[record['workbook']].add(record['countsite'])
+        if record['unchanged']:
+            sources[record['workbook']].sites[record['countsite']].worksheet_num = record['worksheet_num']
+        else:
+            sources[record['workbook']].add_record(record)
+
+    for (workbook, store) in sources.items():
+        # A site that was read and not found is no longer in the workbook, the other sites were not read
+        for countsite in list(store.sites):
+            if countsite not in seen[workbook] and (sites is None or countsite in sites):
+                store.remove_site(countsite)
+        with instrument.timer('store'):
+            store.save(workbook_store_path(workbook))
+
+    # One set of counts from every workbook
+    with instrument.timer('merge'):
+        count_store = merge_stores(list(sources.values()))
+    with instrument.timer('store'):
+        count_store.save()
+    return sources, count_store
+
+
+def summarise(count_store, full=False, sites=None, years=None):
+    """
+    Write the count observation and summary .csv files of every site, and count_location_details.csv.
+    Sites that have not changed since the last run (and whose files are all still there) are not written again,
+    unless full is set. Given sites or years, only the files of those sites, or of the counts in those years,
+    are written (whether or not they have changed), the files of the other sites are left as they are.
+    Returns the manifest of the run.
+    """
+    from supertue.manifest import Manifest
+    from supertue.output import SiteWriter
+
+    filtered = sites is not None or years is not None
+    # Every file is written here, in worksheet order. The details of the sites that are not written come from the manifest.
+    writer = SiteWriter()
+    manifest = Manifest(full=full and not filtered)
+    known_hashes = {} if filtered else manifest.known_hashes()
+    for (countsite, site) in count_store.sites.items():
+        record = {'worksheet_num': site.worksheet_num,
+                  'countsite': countsite,
+                  'site': site,
+                  'counts': count_store.select(site=countsite),
+                  'hash': count_store.hashes[countsite]}
+        selected = ((sites is None or countsite in sites) and
+                    (years is None or any(count.year in years for count in record['counts'])))
+        if filtered and not selected:
+            if countsite in manifest.sheets:
+                manifest.keep(record)
+            writer.add_location(site.location())
+        elif known_hashes.get(countsite) == record['hash']:
+            manifest.keep(record)
+            writer.add_location(manifest.location(countsite))
+        elif years is not None:
+            manifest.add_outputs(record, writer.write(record, years))
+        else:
+            manifest.update(record, writer.write(record))
+    writer.close()
+    manifest.finish()
+    manifest.save()
+    return manifest
+
+
+def locations(count_store):
+    # count_location_details.csv on its own. Returns the path written.
+    from supertue.output import write_locations
+
+    path = write_locations([site.location() for site in count_store.sites.values()])
+    _count_outputs([path])
+    return path
+
+
+def rollup(count_store, full=False):
+    """
+    Tables comparing every site across the count years, from every count in the store.
+    The growth fits are kept between runs, only the counts that changed are applied to them.
+    Returns the paths written.
+    """
+    from supertue.growth import GrowthEngine
+    from supertue.rollup import write_rollup
+
+    with instrument.timer('rollup'):
+        growth = GrowthEngine() if full else GrowthEngine.load()
+        instrument.count('growth_points', growth.update(count_store))
+        outputs = write_rollup(count_store, growth=growth)
+    with instrument.timer('store'):
+        growth.save()
+    _count_outputs(outputs)
+    return outputs
+
+
+def geojson(count_store):
+    # The count sites as a GeoJSON map layer, with each site's riders and growth. Returns the path written.
+    # The growth comes from the growth fits saved by the rollup, brought up to date with the store.
+    from supertue.geo import write_geojson
+    from supertue.growth import GrowthEngine
+
+    with instrument.timer('geojson'):
+        growth = GrowthEngine.load()
+        growth.update(count_store)
+        path = write_geojson(count_store, growth=growth)
+    _count_outputs([path])
+    return path
+
+
+def write_observation_store(count_store, create=False):
+    # The columnar observation store, written by --store (create) and kept up to date by every later run
+    # (the query service reads it), unless it already holds these counts
+    from supertue.columnar import STORE_DIR, ObservationStore, write_store
+
+    if not create and not os.path.exists(os.path.join(STORE_DIR, 'index.json')):
+        return
+    if not ObservationStore.exists() or ObservationStore().hashes != count_store.hashes:
+        with instrument.timer('store'):
+            write_store(count_store)
+
+
+def _report(args, started, settings, manifest=None):
+    if instrument.PROFILE:
+        run = instrument.report(started, time.time() - started, manifest=manifest, settings=settings)
+        instrument.print_report(run)
+        if args.report:
+            instrument.save_report(run, args.report)
+
+
+def clean(args, workbooks, models=None, full=False):
+    """
+    One run of every stage of the cleaner over a list of workbooks (in order of precedence), with the settings of args.
+    models holds the count store of each workbook from an earlier run in this process (watch mode),
+    other workbooks start from the count store saved by the last run, or from nothing if full is set.
+    Returns the count store of each workbook.
+    """
+    started = time.time()
+    # The timings and counters of this run only
+    instrument.STATS.pop()
+
+    (sources, count_store) = extract(args, workbooks, models, full)
+    manifest = summarise(count_store, full)
+    rollup(count_store, full)
+    geojson(count_store)
+    write_observation_store(count_store, create=args.store)
+    manifest.report()
+
+    _report(args, started, {'workbooks': workbooks, 'jobs': args.jobs, 'reader': args.reader,
+                            'store': args.store, 'full': full}, manifest)
+    return sources
+
+
+def _names(text):
+    # A comma separated list of count sites
+    return set(name.strip() for name in text.split(',') if name.strip())
+
+
+def _years(text):
+    # A comma separated list of count years
+    try:
+        return set(int(year) for year in text.split(',') if year.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError('count years are numbers, e.g. 2016,2017')
+
+
+def _command_first(argv):
+    # The arguments with the subcommand moved to the front, so options may also come before it.
+    # The subcommand is the first argument that is not an option (or an option's value), every stage if that is not one.
+    skip = False
+    for (index, arg) in enumerate(argv):
+        if skip:
+            skip = False
+        elif arg == '--':
+            break
+        elif arg.startswith('-') and arg != '-':
+            skip = arg in VALUE_OPTIONS
         else:
-            #   Old Super Tuesday counts contain a value in 'Count Year' but nothing in 'Count Date'
-
-            try:
-                countyear_test = int(sheet.cell(count_row,13).value)
-            except:
-                countyear_test = 0
-
-            #   The earlist super tuesday count in this dataset was conducted in 2006.
-            #   If the Count Date field contains a date value less than 2005, the data block is blank
-
-            if countyear_test > 2000:
-                print 'Countyear_test =', countyear_test, 'Historic Super Tue Data'
-                countsummary = {}
-                countsummary['countsite'] = countsite
-                countsummary['dist_from_cbd'] = dist_from_cbd
-                countsummary['bin_duration'] = 120
-                countsummary['counting'] = 'bicycle riders'
-                countsummary['gender'] = 'NA'
-
-                #   Since no count date is specified we will need to add this data.
-                #   Count assumed to occur on First tuesday of March.
-                #   First Tuesday: 1 March 2005; 7 March 2006; 6 March 2007; 4 March 2008; 3 March 2009;
-                first_tue = {
-                    2005 : date(2005, 3, 1), 2006 : date(2006, 3, 7), \
-                    2007 : date(2007, 3, 6), 2008 : date(2008, 3, 4), \
-                    2009 : date(2009, 3, 3)
-                            }
-
-                countsummary['time'] = datetime.combine(first_tue[countyear_test], time(07,00,00))
-
-                #   In a historic super tuesday count results are recorded in the 28th row of the data block:
-                #   7-9am all bicycle movements                         column C
-                all_moves = int(sheet.cell(count_row+27,2).value)
-                countsummary['total'] = all_moves
-#                print "Total all movements 7-9am", formatted_date, "=", all_moves
-
-                #   7-9am all bicycle movements entering from North,    column G
-                try:
-                    from_north = int(sheet.cell(count_row+27,6).value)
-                except:
-                    from_north = "NA"
-                countsummary['from_north'] = from_north
-#                print "From North 7-9am", formatted_date, "=", from_north
-
-                #   7-9am all bicycle movements entering from East,     column H
-                try:
-                    from_east = int(sheet.cell(count_row+27,7).value)
-                except:
-                    from_east = "NA"
-                countsummary['from_east'] = from_east
-#                print "From East 7-9am", formatted_date, "=", from_east
-
-                #   7-9am all bicycle movements entering from South,    column I
-                try:
-                    from_south = int(sheet.cell(count_row+27,8).value)
-                except:
-                    from_south = "NA"
-                countsummary['from_south'] = from_south
-#                print "From South 7-9am", formatted_date, "=", from_south
-
-                #   7-9am all bicycle movements entering from West,     column J
-                try:
-                    from_west = int(sheet.cell(count_row+27,9).value)
-                except:
-                    from_west = "NA"
-                countsummary['from_west'] = from_west
-#                print "From West 7-9am", formatted_date, "=", from_west
-
-                #   7-9am all bicycle movements departing via North,    column K
-                try:
-                    to_north = int(sheet.cell(count_row+27,10).value)
-                except:
-                    to_north = "NA"
-                countsummary['to_north'] = to_north
-#                print "To North 7-9am", formatted_date, "=", to_north
-
-                #   7-9am all bicycle movements departing via East,     column L
-                try:
-                    to_east = int(sheet.cell(count_row+27,11).value)
-                except:
-                    to_east = "NA"
-                countsummary['to_east'] = to_east
-#                print "To East 7-9am", formatted_date, "=", to_east
-
-                #   7-9am all bicycle movements departing via South,    column M
-                try:
-                    to_south = int(sheet.cell(count_row+27,12).value)
-                except:
-                    to_south = "NA"
-                countsummary['to_south'] = to_south
-#                print "To South 7-9am", formatted_date, "=", to_south
-
-                #   7-9am all bicycle movements departing via West,     column N
-                try:
-                    to_west = int(sheet.cell(count_row+27,13).value)
-                except:
-                    to_west = "NA"
-                countsummary['to_west'] = to_west
-#                print "To West 7-9am", formatted_date, "=", to_west
-
-                sitedic[str_formatted_date] = countsummary
-
-        print sitedic
-        summary_list = ['countsite', 'dist_from_cbd', 'time', 'bin_duration', 'counting', 'gender', 'total', \
-                        'from_north', 'from_east', 'from_south', 'from_west', \
-                        'to_north', 'to_east', 'to_south', 'to_west']
-
-        output_file = open(summarydir + countsite + "_summary7am-9am.csv", "w")
-        for field in summary_list:
-            output_file.write(field + ', ')
-        output_file.write('\n')
-
-        for countdate in sitedic:
-            for field in summary_list:
-                output_file.write(str(sitedic[countdate][field]) + ', ')
-            output_file.write('\n')
-
-        # TODO: Output Summarised count to a file one file for each count site
-        # [countdate 07:00:00][bin_duration = 120][gender = NA][total][from north][from east]\
-        # [from south][from west][to north][to east][to south][to west]
+            if arg in COMMANDS:
+                return [arg] + argv[:index] + argv[index + 1:]
+            break
+    if argv[:1] in (['-h'], ['--help']):
+        return argv
+    return ['all'] + argv
+
+
+def _parser():
+    # Options of every subcommand
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--profile', action='store_true',
+                        help='time each stage of the run and print the timings, counters and slowest sheets')
+    common.add_argument('--report', metavar='RUN_JSON',
+                        help='save the timings and counters of the run as json (implies --profile)')
+    common.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print the site name and counts of every sheet')
+    # Options of the commands that read the workbooks
+    scrape = argparse.ArgumentParser(add_help=False)
+    scrape.add_argument('workbooks', nargs='*', default=[inputfilename],
+                        help='workbooks, directories of workbooks or glob patterns (default the 2017 workbook). '
+                             'Where workbooks hold the same count, the last workbook listed takes precedence')
+    scrape.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes scraping worksheets (default 1, a serial run)')
+    scrape.add_argument('--reader', choices=READERS, default='xlrd',
+                        help='workbook reader: xlrd (default) or stream, which reads one .xlsx worksheet at a time')
+    scrape.add_argument('--store', action='store_true',
+                        help='also write every observation to the columnar observation store')
+
+    parser = argparse.ArgumentParser(description='Convert the Moreland Super Tuesday Excel Data into .csv files. '
+                                                 'Runs every stage unless a stage is given.')
+    commands = parser.add_subparsers(dest='command', metavar='{' + ','.join(COMMANDS) + '}')
+
+    command = commands.add_parser('all', parents=[common, scrape], help='every stage (the default)')
+    command.add_argument('--full', action='store_true',
+                         help='ignore the manifest of the last run, scrape and write every worksheet')
+    command.add_argument('--watch', action='store_true',
+                         help='keep running, and clean the workbooks again whenever they change')
+    command.add_argument('--interval', type=float, default=WATCH_INTERVAL, metavar='SECONDS',
+                         help='how often --watch checks the workbooks (default %g seconds)' % WATCH_INTERVAL)
+
+    command = commands.add_parser('extract', parents=[common, scrape],
+                                  help='scrape the workbooks into the count store (./script_output/count_store.pkl)')
+    command.add_argument('--full', action='store_true', help='scrape every worksheet, changed or not')
+    command.add_argument('--sites', type=_names, metavar='SITE[,SITE...]', help='only scrape these count sites')
+
+    command = commands.add_parser('summarise', parents=[common],
+                                  help='write the count observation and summary .csv files from the count store')
+    command.add_argument('--full', action='store_true', help='write every site, changed or not')
+    command.add_argument('--sites', type=_names, metavar='SITE[,SITE...]', help='only write these count sites')
+    command.add_argument('--years', type=_years, metavar='YEAR[,YEAR...]',
+                         help='only write the observations of the counts in these years')
+
+    commands.add_parser('locations', parents=[common], help='write count_location_details.csv from the count store')
+    command = commands.add_parser('rollup', parents=[common], help='write the all sites tables from the count store')
+    command.add_argument('--full', action='store_true', help='fit the growth of every site again')
+    commands.add_parser('geojson', parents=[common], help='write the GeoJSON map layer from the count store')
+    return parser
+
+
+def main(argv=None):
+    argv = _command_first(sys.argv[1:] if argv is None else list(argv))
+    parser = _parser()
+    args = parser.parse_args(argv)
+    instrument.configure(profile=args.profile or bool(args.report), quiet=args.quiet)
+    try:
+        _run(parser, args)
+    except ImportError as error:
+        # The stages import xlrd and numpy as they need them
+        module = getattr(error, 'name', None) or str(error).split()[-1]
+        if module not in REQUIRED_MODULES:
+            raise
+        print("Install python module " + module + ".  Available from https://pypi.python.org/pypi/" + module)
+        sys.exit(1)
+
+
+def _run(parser, args):
+    if args.command == 'all':
+        if not args.watch:
+            workbooks = find_workbooks(args.workbooks)
+            if not workbooks:
+                parser.error('no workbooks found in ' + ', '.join(args.workbooks))
+            clean(args, workbooks, full=args.full)
+            return
+
+        # Watch mode: the count store of each workbook stays in memory between runs,
+        # and a run only scrapes the sheets that have changed
+        models = {}
+        def run(workbooks):
+            full = args.full and not models
+            models.update(clean(args, workbooks, models, full))
+        watch(args.workbooks, run, args.interval)
+        return
+
+    started = time.time()
+    instrument.STATS.pop()
+    if args.command == 'extract':
+        workbooks = find_workbooks(args.workbooks)
+        if not workbooks:
+            parser.error('no workbooks found in ' + ', '.join(args.workbooks))
+        if args.sites:
+            from supertue.discover import sheet_names
+            from supertue.layout import FIRST_DATA_SHEET
+            known = set(name for workbook in workbooks for name in sheet_names(workbook)[FIRST_DATA_SHEET:])
+            unknown = sorted(args.sites - known)
+            if unknown:
+                parser.error('no count site ' + ', '.join(unknown))
+        (sources, count_store) = extract(args, workbooks, full=args.full, sites=args.sites)
+        write_observation_store(count_store, create=args.store)
+        print(len(count_store.sites), 'count sites in the count store')
+        _report(args, started, {'command': args.command, 'workbooks': workbooks, 'jobs': args.jobs,
+                                'reader': args.reader, 'full': args.full,
+                                'sites': sorted(args.sites) if args.sites else None})
+        return
+
+    # The other stages start from the count store saved by the last extract
+    from supertue.store import COUNT_STORE_FILE, CountStore
+    count_store = CountStore.load()
+    if not count_store.sites:
+        parser.error('no count store in ' + COUNT_STORE_FILE + ', run extract first')
+    settings = {'command': args.command}
+
+    manifest = None
+    if args.command == 'summarise':
+        unknown = sorted((args.sites or set()) - set(count_store.sites))
+        if unknown:
+            parser.error('no count site ' + ', '.join(unknown))
+        manifest = summarise(count_store, args.full, args.sites, args.years)
+        manifest.report()
+        settings.update({'full': args.full, 'sites': sorted(args.sites) if args.sites else None,
+                         'years': sorted(args.years) if args.years else None})
+    elif args.command == 'locations':
+        print('Wrote', locations(count_store))
+    elif args.command == 'rollup':
+        print('Wrote', len(rollup(count_store, args.full)), 'all sites tables')
+        settings['full'] = args.full
+    elif args.command == 'geojson':
+        print('Wrote', geojson(count_store))
+    _report(args, started, settings, manifest)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+# Bike Count Data Cleaner - library modules
+# Used by super_tue_cleaner.py to scrape the Moreland Super Tuesday Excel Data
+# On behalf of Moreland City Council Transport Unit
+# Github Usersname: MorelandTransport
+# -----------------------------
+#
+# layout.py     Where the workbook keeps its data (sheets, count block rows, movement columns)
+# discover.py   Finds the count site sheets and the populated count blocks of each sheet
+# blocks.py     Reads a count block as a 2-D array
+# aggregate.py  Sums the turning movements of a count into directional totals
+# extract.py    Reads the count site worksheets into records of store.Site and store.Count objects
+# batch.py      Finds the workbooks of a batch, and their order of precedence
+# store.py      CountStore, every site and count of a workbook, indexed by site, date, year and gender
+# xlsx_reader.py Streams one .xlsx worksheet at a time, an alternative to xlrd
+# output.py     Writes those records to the ./script_output/ directory tree
+# rollup.py     All sites tables (riders by site and year, gender split, growth) in ./script_output/allsites_summary/
+# growth.py     Growth trends of each site, kept up to date a count at a time (GrowthEngine)
+# geo.py        MGA Zone 55 to longitude / latitude, and the GeoJSON map layer of the count sites
+# synthetic.py  Writes synthetic workbooks with the Super Tuesday layout, for benchmarks/
+# columnar.py   Optional columnar store of every observation, partitioned by year
+# service.py    Local HTTP query service (JSON) over the saved stores, with an LRU answer cache
+# watch.py      Watch mode, polls the workbooks and runs the cleaner again when they change
+# instrument.py Stage timers, counters and progress messages (--profile, --report, --quiet)
+# manifest.py   Remembers each worksheet's content hash and outputs, so unchanged sheets are skipped
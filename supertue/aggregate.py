@@ -0,0 +1,85 @@
+# Bike Count Data Cleaner - movement aggregation
+# Sum the turning movements of a count into the 7am - 9am directional totals.
+#
+# Counts and totals are integer arrays, each with a boolean NA mask of the same shape (valid, False where NA).
+# NA is only turned into text when the .csv files are written (see output.na_text).
+# -----------------------------
+
+from __future__ import print_function
+
+import numpy as np
+
+from supertue.layout import MOVEMENTS
+
+
+# Where each movement enters (from) and leaves (to) the intersection, in MOVEMENTS order
+MOVEMENT_DIRECTIONS = [
+    ('north_turn_left',  'north', 'east'),
+    ('north_through',    'north', 'south'),
+    ('north_turn_right', 'north', 'west'),
+    ('east_turn_left',   'east',  'south'),
+    ('east_through',     'east',  'west'),
+    ('east_turn_right',  'east',  'north'),
+    ('south_turn_left',  'south', 'west'),
+    ('south_through',    'south', 'north'),
+    ('south_turn_right', 'south', 'east'),
+    ('west_turn_left',   'west',  'north'),
+    ('west_through',     'west',  'east'),
+    ('west_turn_right',  'west',  'south'),
+    ]
+
+# The totals reported in each count summary
+DIRECTIONS = ['total', 'from_north', 'from_east', 'from_south', 'from_west',
+              'to_north', 'to_east', 'to_south', 'to_west']
+
+
+def _direction_matrix():
+    # (movement, direction) matrix, 1 where the movement counts towards the direction total
+    matrix = np.zeros((len(MOVEMENTS), len(DIRECTIONS)), dtype=np.int32)
+    for (turn, approach, departure) in MOVEMENT_DIRECTIONS:
+        m = MOVEMENTS.index(turn)
+        matrix[m, DIRECTIONS.index('total')] = 1
+        matrix[m, DIRECTIONS.index('from_' + approach)] = 1
+        matrix[m, DIRECTIONS.index('to_' + departure)] = 1
+    return matrix
+
+DIRECTION_MATRIX = _direction_matrix()
+
+
+def na_sum(values, valid, axis=None):
+    """
+    Sum of the values that are not NA, along axis.
+    Returns (values, valid): a sum is NA only if every value that makes it up is NA.
+    """
+    return np.where(valid, values, 0).sum(axis=axis), valid.any(axis=axis)
+
+
+class MovementAggregator(object):
+    """
+    Directional totals of one count.
+    counts and valid are the (gender, bin, movement) array and NA mask returned by blocks.read_observations
+    Every total is the sum of the movements that are not NA,
+    a total is only NA if every movement that makes it up is NA.
+    """
+
+    def __init__(self, counts, valid, genders=None):
+        self.genders = genders
+        # One matrix product gives every direction total for each gender and bin
+        self.totals = np.dot(np.where(valid, counts, 0), DIRECTION_MATRIX)
+        # and the number of movements that were not NA in each of those totals
+        self.nvalid = np.dot(valid.astype(np.int32), DIRECTION_MATRIX)
+
+    def _sum(self, axis):
+        return na_sum(self.totals, self.nvalid > 0, axis)
+
+    def direction_totals(self):
+        # (values, valid) of each direction in DIRECTIONS, shape (direction,)
+        return self._sum((0, 1))
+
+    def bin_totals(self):
+        # (values, valid) of each 15min bin, all genders, shape (bin, direction)
+        return self._sum(0)
+
+    def gender_totals(self):
+        # (values, valid) of each gender, all bins, shape (gender, direction)
+        return self._sum(1)
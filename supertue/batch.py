@@ -0,0 +1,53 @@
+# Bike Count Data Cleaner - batches of workbooks
+# A new workbook arrives every year, and the older workbooks repeat many of its counts
+# (including the historic Super Tuesday counts). The cleaner can read a batch of workbooks
+# into one merged set of outputs, see store.merge_stores()
+#
+# Precedence: workbooks are ranked in the order they are given, the workbooks found in a
+# directory or matching a glob are ranked by file name. Where several workbooks hold a count
+# for the same count site and count date, the count is taken from the last ranked workbook.
+# -----------------------------
+
+import glob
+import os
+
+
+# The count store of each workbook, so an unchanged workbook is not scraped again
+WORKBOOK_STORE_DIR = "./script_output/workbook_stores/"
+
+WORKBOOK_EXTENSIONS = ('.xls', '.xlsx')
+
+# Workbook readers
+#   xlrd      reads .xls and .xlsx files, but loads every sheet of an .xlsx file when it is opened
+#   stream    .xlsx files only, parses one worksheet at a time (see xlsx_reader.py)
+READERS = ('xlrd', 'stream')
+
+
+def is_workbook(path):
+    # Excel workbooks, but not the lock files Excel leaves beside an open workbook
+    name = os.path.basename(path)
+    return name.lower().endswith(WORKBOOK_EXTENSIONS) and not name.startswith('~$')
+
+
+def find_workbooks(paths):
+    """
+    Workbooks named by a list of files, directories and glob patterns, in order of precedence (lowest first).
+    A workbook named more than once is ranked by its last mention.
+    """
+    workbooks = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(os.path.join(path, name) for name in os.listdir(path) if is_workbook(name))
+        elif os.path.exists(path):
+            matches = [path]
+        else:
+            matches = sorted(match for match in glob.glob(path) if is_workbook(match))
+        for match in matches:
+            if match in workbooks:
+                workbooks.remove(match)
+            workbooks.append(match)
+    return workbooks
+
+
+def workbook_store_path(inputfilename):
+    return WORKBOOK_STORE_DIR + os.path.basename(inputfilename) + '.pkl'
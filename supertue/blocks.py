@@ -0,0 +1,81 @@
+# Bike Count Data Cleaner - count block reader
+# Read a count block as a 2-D array, rather than one sheet.cell() call per observation.
+# -----------------------------
+
+from __future__ import print_function
+
+import numpy as np
+
+from xlrd import XL_CELL_EMPTY, XL_CELL_TEXT, XL_CELL_NUMBER, XL_CELL_DATE, XL_CELL_BOOLEAN
+
+from supertue import instrument
+from supertue.layout import MOVEMENTS, MALE_MOVEMENTS, OBS_ROW_OFFSET, OBS_BINS, OBS_TIME_COL, OBS_LAST_COL
+
+
+# Cell types that hold a count of bike riders.
+# Everything else (empty or blank cells, error cells and text that is not a whole number, such as 'NA') is NA.
+NUMERIC_TYPES = (XL_CELL_NUMBER, XL_CELL_DATE, XL_CELL_BOOLEAN)
+
+# Worksheet column of each movement (in MOVEMENTS order) for male or NA gender riders.
+MOVEMENT_COLS = np.array([dict(MALE_MOVEMENTS)[turn] for turn in MOVEMENTS])
+
+
+def _is_integer_text(text):
+    # Some counts have been typed in as text, e.g. u' 12'
+    if text[:1] in ('+', '-'):
+        text = text[1:]
+    return text.isdigit()
+
+
+def read_block(sheet, first_row, nrows, first_col, ncols):
+    """
+    Read a rectangular region of a worksheet with one row slice per row.
+    Returns (values, valid)
+    values  an integer matrix of the region
+    valid   a boolean matrix, False where the cell does not hold a number (i.e. NA)
+    Cells are classified by their cell type, rows past the end of the sheet are NA.
+    """
+    last_col = first_col + ncols
+    types = np.full((nrows, ncols), XL_CELL_EMPTY, dtype=np.int8)
+    cells = np.zeros((nrows, ncols), dtype=object)
+
+    for i, rowx in enumerate(range(first_row, min(first_row + nrows, sheet.nrows))):
+        row_types = sheet.row_types(rowx, first_col, last_col)
+        width = len(row_types)
+        types[i, :width] = row_types
+        cells[i, :width] = sheet.row_values(rowx, first_col, last_col)
+
+    instrument.count('cells_read', nrows * ncols)
+    valid = np.isin(types, NUMERIC_TYPES)
+    values = np.zeros((nrows, ncols), dtype=np.int32)
+    # Counts are whole numbers, a decimal is truncated as int() would
+    values[valid] = cells[valid].astype(np.float64)
+
+    for i, j in zip(*np.nonzero(types == XL_CELL_TEXT)):
+        text = cells[i, j].strip()
+        if _is_integer_text(text):
+            values[i, j] = int(text)
+            valid[i, j] = True
+
+    return values, valid
+
+
+def read_observations(sheet, count_row, genders):
+    """
+    Read the eight 15 minute observation rows of the count block starting at count_row.
+    Returns (start_times, counts, valid)
+    start_times     the excel format start time of each bin (first column of the block)
+    counts, valid   integer array and NA mask, shape (gender, bin, movement), movements in MOVEMENTS order
+    """
+    first_row = count_row + OBS_ROW_OFFSET
+    start_times = sheet.col_values(OBS_TIME_COL, first_row, first_row + OBS_BINS)
+
+    values, valid = read_block(sheet, first_row, OBS_BINS, 0, OBS_LAST_COL + 1)
+
+    # The movments of female cyclists are recorded in the column after the male (or NA gender) riders
+    cols = [MOVEMENT_COLS + 1 if gender == 'F' else MOVEMENT_COLS for gender in genders]
+    counts = np.stack([values[:, gender_cols] for gender_cols in cols])
+    counts_valid = np.stack([valid[:, gender_cols] for gender_cols in cols])
+    instrument.count('na_cells', counts_valid.size - int(counts_valid.sum()))
+
+    return start_times, counts, counts_valid
@@ -0,0 +1,272 @@
+# Bike Count Data Cleaner - columnar observation store
+# Every count observation in one compact store, as an alternative to globbing and
+# re-parsing the hundreds of .csv files in ./script_output/count_observations/
+# It also holds the location details and the 7am - 9am totals of every count, so the query service
+# answers from the store alone.
+#
+# The store is a directory of numpy .npy files, partitioned by count year:
+#   index.json                    site dictionary and location details, the rows of each site in each
+#                                 partition and in the count table, and the generation
+#   gen-*/year=YYYY/site_id.npy   site, as a position in the index's site list
+#   gen-*/year=YYYY/time.npy      start time of the 15min bin (datetime64[m])
+#   gen-*/year=YYYY/bin_duration.npy
+#   gen-*/year=YYYY/gender.npy    position in GENDERS
+#   gen-*/year=YYYY/counts.npy    (row, movement) observations, movements in MOVEMENTS order
+#   gen-*/year=YYYY/valid.npy     (row, movement) validity bitmap (np.packbits), a 0 bit is NA
+#   gen-*/counts/*.npy            one row per count (COUNT_COLUMNS), historic counts included
+# Rows of a partition, and of the count table, are grouped by site, so one site or one year is read
+# (memory mapped) without touching the rest of the store.
+#
+# Each write makes a new generation directory, and index.json (replaced in one step) points to it,
+# so a reader always finds a whole store. The previous generation is kept for readers that opened
+# it before the swap, older ones are removed.
+# -----------------------------
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from supertue.aggregate import DIRECTIONS
+from supertue.layout import MOVEMENTS
+from supertue.output import atomic_write
+
+
+STORE_DIR = "./script_output/observation_store/"
+
+# Bump this when the layout of the store changes
+STORE_VERSION = 3
+
+GENDERS = ['F', 'M', 'NA']
+
+COLUMNS = ['site_id', 'time', 'bin_duration', 'gender', 'counts', 'valid']
+
+# Columns of the count table: the count's start (datetime64[s]), its genders ('F,M', '' for a count
+# without observations) and its 7am - 9am totals in aggregate.DIRECTIONS order, with their NA mask
+COUNT_COLUMNS = ['site_id', 'count_date', 'time', 'bin_duration', 'genders', 'legacy', 'summary', 'summary_valid']
+
+
+def _partition_dir(generation_dir, year):
+    return os.path.join(generation_dir, 'year=' + str(year))
+
+
+def _read_index(store_dir):
+    with open(os.path.join(store_dir, 'index.json')) as index_file:
+        return json.load(index_file)
+
+
+def block_columns(site_id, count):
+    """
+    Columns of one 15min count (a store.Count).
+    Rows are in the same order as the count's observation .csv file: by gender, then time.
+    """
+    ngenders, nbins = count.counts.shape[:2]
+    nrows = ngenders * nbins
+    return {'site_id': np.full(nrows, site_id, dtype=np.uint16),
+            'time': np.tile(np.array(count.times, dtype='datetime64[m]'), ngenders),
+            'bin_duration': np.full(nrows, count.bin_duration, dtype=np.int16),
+            'gender': np.repeat([GENDERS.index(gender) for gender in count.genders], nbins).astype(np.uint8),
+            'counts': count.counts.reshape(nrows, len(MOVEMENTS)).astype(np.int32),
+            'valid': np.packbits(count.valid.reshape(nrows, len(MOVEMENTS)), axis=1)}
+
+
+def count_columns(site_id, counts):
+    # The count table rows of a site's counts (store.Count)
+    shape = (len(counts), len(DIRECTIONS))
+    return {'site_id': np.full(len(counts), site_id, dtype=np.uint16),
+            'count_date': np.array([str(count.count_date) for count in counts], dtype='datetime64[D]'),
+            'time': np.array([count.time for count in counts], dtype='datetime64[s]'),
+            'bin_duration': np.array([count.bin_duration for count in counts], dtype=np.int16),
+            'genders': np.array([','.join(count.genders) for count in counts], dtype='U8'),
+            'legacy': np.array([count.legacy for count in counts], dtype=bool),
+            'summary': np.array([count.summary for count in counts], dtype=np.int32).reshape(shape),
+            'summary_valid': np.array([count.summary_valid for count in counts], dtype=bool).reshape(shape)}
+
+
+class ObservationStore(object):
+    """
+    Reader for the columnar observation store.
+    load(site=..., year=...) returns the matching observations as a dictionary of columns:
+        countsite, time, bin_duration, gender, counts (int32, row x movement) and valid (bool, row x movement)
+    site_counts(site) returns the rows of a site's counts in the count table (COUNT_COLUMNS).
+    locations holds the location details of every site (store.LOCATION_FIELDS), in worksheet order.
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        index = _read_index(store_dir)
+        self.generation_dir = os.path.join(store_dir, index['generation'])
+        self.sites = index['sites']
+        self.hashes = index['hashes']
+        self.partitions = index['partitions']
+        self.locations = index['locations']
+        self.count_rows = index['counts']
+        self._site_ids = dict((site, site_id) for (site_id, site) in enumerate(self.sites))
+        self._arrays = {}
+        self._counts = None
+
+    @staticmethod
+    def exists(store_dir=STORE_DIR):
+        index_path = os.path.join(store_dir, 'index.json')
+        if not os.path.exists(index_path):
+            return False
+        return _read_index(store_dir).get('version') == STORE_VERSION
+
+    def years(self):
+        return sorted(int(year) for year in self.partitions)
+
+    def site_counts(self, site):
+        """
+        The counts of a site (COUNT_COLUMNS, in worksheet then block order), read from the memory mapped count table.
+        """
+        if self._counts is None:
+            counts_dir = os.path.join(self.generation_dir, 'counts')
+            self._counts = dict((column, np.load(os.path.join(counts_dir, column + '.npy'), mmap_mode='r'))
+                                for column in COUNT_COLUMNS)
+        (start, stop) = self.count_rows.get(str(self._site_ids.get(site)), (0, 0))
+        return dict((column, np.array(array[start:stop])) for (column, array) in self._counts.items())
+
+    def _partition(self, year):
+        # Memory map a partition's columns, nothing is read until the rows are sliced
+        if year not in self._arrays:
+            partition_dir = _partition_dir(self.generation_dir, year)
+            self._arrays[year] = dict((column, np.load(os.path.join(partition_dir, column + '.npy'), mmap_mode='r'))
+                                      for column in COLUMNS)
+        return self._arrays[year]
+
+    def _site_rows(self, site=None, year=None):
+        # (year, start row, stop row) of every part of the store to be read
+        years = [year] if year is not None else self.years()
+        for year in years:
+            partition = self.partitions.get(str(year))
+            if partition is None:
+                continue
+            if site is None:
+                yield year, 0, partition['rows']
+            elif site in self._site_ids and str(self._site_ids[site]) in partition['sites']:
+                start, stop = partition['sites'][str(self._site_ids[site])]
+                yield year, start, stop
+
+    def load_columns(self, site=None, year=None):
+        # The stored (encoded) columns of the matching rows
+        parts = [dict((column, np.array(array[start:stop])) for (column, array) in self._partition(year).items())
+                 for (year, start, stop) in self._site_rows(site, year)]
+        if not parts:
+            return {'site_id': np.zeros(0, dtype=np.uint16),
+                    'time': np.zeros(0, dtype='datetime64[m]'),
+                    'bin_duration': np.zeros(0, dtype=np.int16),
+                    'gender': np.zeros(0, dtype=np.uint8),
+                    'counts': np.zeros((0, len(MOVEMENTS)), dtype=np.int32),
+                    'valid': np.zeros((0, 2), dtype=np.uint8)}
+        return dict((column, np.concatenate([part[column] for part in parts])) for column in COLUMNS)
+
+    def load(self, site=None, year=None):
+        """
+        Observations of one site, one year, one site in one year or (with no arguments) the whole store.
+        """
+        columns = self.load_columns(site, year)
+        valid = np.unpackbits(columns['valid'], axis=1)[:, :len(MOVEMENTS)].astype(bool)
+        return {'countsite': np.array(self.sites, dtype=object)[columns['site_id'].astype(np.intp)],
+                'time': columns['time'],
+                'bin_duration': columns['bin_duration'],
+                'gender': np.array(GENDERS, dtype=object)[columns['gender'].astype(np.intp)],
+                'counts': columns['counts'],
+                'valid': valid}
+
+    def to_dataframe(self, site=None, year=None):
+        """
+        The observations in the layout of the count observation .csv files, NA as NaN.
+        Needs pandas.
+        """
+        import pandas as pd
+
+        observations = self.load(site, year)
+        df = pd.DataFrame({'countsite': observations['countsite'],
+                           'time': observations['time'],
+                           'bin_duration': observations['bin_duration'],
+                           'counting': 'bicycle riders',
+                           'gender': observations['gender']},
+                          columns=['countsite', 'time', 'bin_duration', 'counting', 'gender'])
+        counts = np.where(observations['valid'], observations['counts'], np.nan)
+        for m, turn in enumerate(MOVEMENTS):
+            df[turn] = counts[:, m]
+        return df
+
+
+def write_store(count_store, store_dir=STORE_DIR):
+    """
+    Write the observations of every 15min count in a store.CountStore.
+    The store's sheet hashes are saved so a later run can tell if the store is up to date.
+    The new store is written as a new generation, and swapped in by replacing index.json when complete.
+    """
+    # Columns by year, still keyed by site name
+    by_year = {}
+    for count in count_store.counts:
+        if not count.legacy:
+            by_year.setdefault(count.year, []).append((count.countsite, block_columns(0, count)))
+
+    # Dictionary encode the site names
+    sites = sorted(count_store.sites)
+    site_ids = dict((site, site_id) for (site_id, site) in enumerate(sites))
+
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+    index_path = os.path.join(store_dir, 'index.json')
+    previous_generation = _read_index(store_dir).get('generation') if os.path.exists(index_path) else None
+    generation_dir = tempfile.mkdtemp(prefix='gen-', dir=store_dir)
+    generation = os.path.basename(generation_dir)
+    # mkdtemp makes the directory private to its owner, the store is read by others (e.g. the query service)
+    os.chmod(generation_dir, 0o755)
+
+    partitions = {}
+    for year in sorted(by_year):
+        # Group the rows of each site together, keeping each site's rows in their extracted order
+        parts = sorted(by_year[year], key=lambda part: site_ids[part[0]])
+        partition = {'rows': 0, 'sites': {}}
+        for (site, columns) in parts:
+            columns['site_id'] = np.full(len(columns['time']), site_ids[site], dtype=np.uint16)
+            start = partition['rows']
+            partition['rows'] += len(columns['time'])
+            previous = partition['sites'].get(str(site_ids[site]), (start, start))
+            partition['sites'][str(site_ids[site])] = (previous[0], partition['rows'])
+        partitions[str(year)] = partition
+
+        partition_dir = _partition_dir(generation_dir, year)
+        os.makedirs(partition_dir)
+        for column in COLUMNS:
+            np.save(os.path.join(partition_dir, column + '.npy'),
+                    np.concatenate([columns[column] for (site, columns) in parts]))
+
+    # The count table, a site's rows together
+    count_parts = [count_columns(site_ids[site], count_store.select(site=site)) for site in sites]
+    count_rows = {}
+    start = 0
+    for (site, columns) in zip(sites, count_parts):
+        count_rows[str(site_ids[site])] = (start, start + len(columns['site_id']))
+        start += len(columns['site_id'])
+    counts_dir = os.path.join(generation_dir, 'counts')
+    os.makedirs(counts_dir)
+    for column in COUNT_COLUMNS:
+        np.save(os.path.join(counts_dir, column + '.npy'),
+                np.concatenate([part[column] for part in count_parts + [count_columns(0, [])]]))
+
+    # Swap the new store in
+    atomic_write(index_path,
+                 json.dumps({'version': STORE_VERSION,
+                             'generation': generation,
+                             'movements': MOVEMENTS,
+                             'genders': GENDERS,
+                             'sites': sites,
+                             'locations': [site.location() for site in count_store.sites.values()],
+                             'counts': count_rows,
+                             'hashes': count_store.hashes,
+                             'partitions': partitions}, indent=1, sort_keys=True))
+
+    # Remove older generations, and unfinished ones left by an interrupted run
+    for name in os.listdir(store_dir):
+        if name not in (generation, previous_generation) and name.startswith('gen-'):
+            shutil.rmtree(os.path.join(store_dir, name))
@@ -0,0 +1,136 @@
+# Bike Count Data Cleaner - layout discovery
+# Find the populated count blocks of a worksheet, rather than probing every row of layout.COUNT_ROWS.
+#
+#   python -m supertue.discover workbook.xlsx      print the index of every count site sheet
+#
+# A count block is found by its anchor cell in the block's first row:
+#  * a 15min count has its Count Date in column C (an excel date, no earlier than MIN_COUNT_DATE)
+#    and its gender split flag (Y/N) one row down in column O
+#  * a historic Super Tuesday count has its Count Year in column N, and nothing in Count Date
+# Anchors are looked for from FIRST_BLOCK_ROW to the last row of the sheet, so a sheet may have
+# any number of blocks, at any spacing. The search is made in the same pass over the sheet's rows
+# as its content hash, so each sheet is only read once.
+#
+# The index of a sheet is a list of (count_row, kind), kind one of BLOCK_KINDS.
+# -----------------------------
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import json
+import zipfile
+
+from supertue.layout import (BLOCK_GENDERED, BLOCK_LEGACY, BLOCK_UNGENDERED, COUNT_DATE_COL, COUNT_YEAR_COL,
+                             FIRST_BLOCK_ROW, FIRST_DATA_SHEET, GENDER_SPLIT_COL, LEGACY_ROW_OFFSET,
+                             MIN_COUNT_DATE, OBS_BINS, OBS_ROW_OFFSET)
+from supertue.xlsx_reader import worksheets
+
+
+def _number(value):
+    # The value of a cell as a number, None if it is not one (a number typed in as text counts)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _anchor(values):
+    # The kind of block anchored on a row (15min counts are told apart by their gender split later), or None
+    count_date = _number(values[COUNT_DATE_COL]) if len(values) > COUNT_DATE_COL else None
+    if count_date is not None:
+        return BLOCK_UNGENDERED if count_date >= MIN_COUNT_DATE else None
+    count_year = _number(values[COUNT_YEAR_COL]) if len(values) > COUNT_YEAR_COL else None
+    # The earliest Super Tuesday count was conducted in 2005, a smaller value is not a count year
+    if count_year is not None and int(count_year) > 2000:
+        return BLOCK_LEGACY
+    return None
+
+
+def _gender_split(sheet, count_row):
+    try:
+        return sheet.cell(count_row + 1, GENDER_SPLIT_COL).value == 'Y'
+    except IndexError:
+        return False
+
+
+def scan_sheet(sheet):
+    """
+    Content hash of a worksheet (its name, and the type and value of every cell) and the index of its count blocks.
+    Returns (content_hash, blocks), blocks a list of (count_row, kind).
+    """
+    sha = hashlib.sha1()
+    sha.update(json.dumps(sheet.name).encode('utf-8'))
+    blocks = []
+    # The first row that is not inside the last block found
+    free_row = FIRST_BLOCK_ROW
+    for rowx in range(sheet.nrows):
+        values = sheet.row_values(rowx)
+        sha.update(json.dumps([list(sheet.row_types(rowx)), values]).encode('utf-8'))
+        if rowx < free_row:
+            continue
+        kind = _anchor(values)
+        if kind == BLOCK_LEGACY:
+            blocks.append((rowx, kind))
+            free_row = rowx + LEGACY_ROW_OFFSET + 1
+        elif kind is not None:
+            blocks.append((rowx, kind))
+            free_row = rowx + OBS_ROW_OFFSET + OBS_BINS
+
+    # The gender split flag is in the row below the anchor
+    blocks = [(count_row, BLOCK_GENDERED if kind == BLOCK_UNGENDERED and _gender_split(sheet, count_row) else kind)
+              for (count_row, kind) in blocks]
+    return sha.hexdigest(), blocks
+
+
+def find_blocks(sheet):
+    # The index of a worksheet's count blocks, see scan_sheet()
+    return scan_sheet(sheet)[1]
+
+
+def sheet_names(inputfilename):
+    """
+    Names of the worksheets of a workbook, in order, without loading them.
+    """
+    if zipfile.is_zipfile(inputfilename):
+        # .xlsx: the worksheets of the workbook part (not its chartsheets, so the indices are xlrd's)
+        with zipfile.ZipFile(inputfilename) as workbook_zip:
+            return [name for (name, part) in worksheets(workbook_zip)]
+    from xlrd import open_workbook
+    workbook = open_workbook(inputfilename, on_demand=True)
+    try:
+        return workbook.sheet_names()
+    finally:
+        workbook.release_resources()
+
+
+def data_sheets(inputfilename, sites=None):
+    # Every sheet that may hold a count site: from FIRST_DATA_SHEET to the last sheet of the workbook,
+    # or only the sheets of the named count sites
+    names = sheet_names(inputfilename)
+    return [worksheet_num for worksheet_num in range(FIRST_DATA_SHEET, len(names))
+            if sites is None or names[worksheet_num] in sites]
+
+
+def main():
+    from supertue.batch import READERS
+    from supertue.extract import open_source_workbook
+
+    parser = argparse.ArgumentParser(description='Print the count blocks found on each count site sheet')
+    parser.add_argument('workbook')
+    parser.add_argument('--reader', choices=READERS, default='xlrd')
+    args = parser.parse_args()
+
+    workbook = open_source_workbook(args.workbook, args.reader)
+    try:
+        for worksheet_num in data_sheets(args.workbook):
+            sheet = workbook.sheet_by_index(worksheet_num)
+            blocks = find_blocks(sheet)
+            print(worksheet_num, sheet.name, ', '.join('%d %s' % (count_row + 1, kind) for (count_row, kind) in blocks)
+                  or 'no count blocks')
+            workbook.unload_sheet(worksheet_num)
+    finally:
+        workbook.release_resources()
+
+if __name__ == '__main__':
+    main()
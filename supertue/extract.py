@@ -0,0 +1,319 @@
+# Bike Count Data Cleaner - worksheet extraction
+# Scrape one count site worksheet into a plain python record.
+# The record holds everything the output stage needs (location details, the
+# count observations and the 7am - 9am summaries), so worksheets can be
+# scraped in any process and written out by a single writer.
+# -----------------------------
+
+from __future__ import print_function
+
+import collections
+import multiprocessing
+from datetime import date,datetime,time
+from timeit import default_timer
+
+import numpy as np
+from xlrd import open_workbook,xldate_as_tuple
+
+from supertue import instrument
+from supertue.aggregate import MovementAggregator
+from supertue.blocks import read_block, read_observations
+from supertue.discover import data_sheets, find_blocks, scan_sheet
+from supertue.layout import (BIN_DURATION_COL, BLOCK_GENDERED, BLOCK_LEGACY, COUNT_DATE_COL, COUNT_YEAR_COL,
+                             FIRST_TUE, LEGACY_ROW_OFFSET, LEGACY_TOTAL_COLS)
+from supertue.store import Count, CountStore, Site, merge_stores
+from supertue.xlsx_reader import StreamingWorkbook
+
+
+# - functions  -
+def extract_location(sheet):
+    """
+    Collect location information.
+    Each worksheet contains a 'site details block' in (excel) rows 1 to 11
+    Returns the fields of one row of count_location_details.csv
+    """
+    countsite = sheet.name
+
+    # site_description stored in excel cell C1 (pythonic 1,2). A text string that may contain commas
+    site_description = sheet.cell(1,2).value
+    site_description = site_description.replace(',', '')
+
+    # suburb stored in excel cell C2 (pythonic 2,2). A text string without commas
+    suburb = sheet.cell(2,2).value
+
+    # Distance from CBD is stored in excel cell C4 (pythonic 4,2). A decimal number with no more than 2 significant figures.
+    dist_from_cbd = str(sheet.cell(4,2).value)
+
+    #  GIS reference (Coordinate Reference System = GDA 94 MGA Zone 55 http://spatialreference.org/ref/epsg/gda94-mga-zone-55/)
+    # Easting is stored in excel cell H4 (pythonic 3,7). A decimal number with no more than 2 significant figures.
+    easting = str(sheet.cell(3,7).value)
+    # Northing (GDA 94 MGA Zone 55 Coordinate Reference System) is stored in excel cell L4 (pythonic 3,11) . A decimal number with no more than 2 significant figures.
+    northing = str(sheet.cell(3,11).value)
+
+    # Melway Map Grid Reference is stored in excel cell C4 (pythonic 3,2). A sting no longer than 7 characters.
+    # Note: Some spreadsheets may attempt to render a Melway grid reference like "24 E10" as a number in exponential notation.
+    melway_ref = sheet.cell(3,2).value
+
+    # The primary road is stored in excel cell D6 (pythonic 5,3). A string that may contain commas
+    primary_road = sheet.cell(5,3).value
+    primary_road = primary_road.replace(',', '')
+
+    # The secondary road is stored in excel cell M6 (pythonic 5,12). A string that may contain commas
+    secondary_road = sheet.cell(5,12).value
+    secondary_road = secondary_road.replace(',', '')
+
+    return [countsite, site_description, suburb, dist_from_cbd, easting, northing,
+            melway_ref, primary_road, secondary_road]
+
+
+def extract_site(sheet, datemode, worksheet_num=None, blocks=None):
+    """
+    Scrape one count site worksheet.
+    blocks is the index of the sheet's count blocks (see discover.scan_sheet), found here if not given.
+    Returns a dictionary with the site's location details ('site', a store.Site)
+    and a store.Count for each count on the sheet ('counts')
+    """
+    site = Site(worksheet_num, extract_location(sheet))
+    countsite = site.countsite
+    instrument.log(countsite)
+    if blocks is None:
+        blocks = find_blocks(sheet)
+
+    # Counts by date, a later block with the same date replaces an earlier one
+    counts = collections.OrderedDict()
+
+    # Collect details from each count. Only the populated blocks are read.
+    for (count_row, kind) in blocks:
+
+        if kind != BLOCK_LEGACY:
+            #   The Count Date field is (first row of data block, column c)
+            excel_format_count_date = float(sheet.cell(count_row,COUNT_DATE_COL).value)
+
+            # Excel has its own date format, convert to YYYY-MM-DD
+            with instrument.timer('date_conversion'):
+                preformatted_date = xldate_as_tuple(excel_format_count_date,datemode)
+                formatted_date = date(*preformatted_date[0:3])
+
+            # Collect details specific to an given count date.
+            # Collect bin duration. Stored in second row, colunn K. An integer.
+            try:
+                bin_duration = int(sheet.cell(count_row+1,BIN_DURATION_COL).value)
+            except:
+                # Values should be either 15 or 120. Data source contains errors.
+                # Some bin_duration fields that should contain the value 15 have been left blank.
+                # Specify bin_duration as 15 if data is missing
+                bin_duration = 15
+
+            # Gender split. Stored in second row, column O. A Booleen string, either Y or N (see discover.py)
+            # A full data block has bin_duration = "15", gender_split = "Y"
+            # There are no counts that have have a gender count without a 15min breakdown
+            # However, a few 15min counts do not have gender breakdowns.
+
+            # Desired Data output order female cyclists, 7:00 to 9:00 a line break, new header row then male cyclists, 7:00 to 9:00
+            if kind == BLOCK_GENDERED:
+                genders = ('F','M')
+            else:
+                genders = ('NA',)
+
+            # Read the whole block of observations at once
+            with instrument.timer('read_block'):
+                start_times, obs, obs_valid = read_observations(sheet, count_row, genders)
+            instrument.count('blocks')
+
+            start_datetimes = []
+            with instrument.timer('date_conversion'):
+                for excel_start_time in start_times:
+                    # Convert start time to YYYY-MM-DD HH:MM:SS format  TODO: Can we change the formating to lose the seconds?
+                    preformatted_start_time	= xldate_as_tuple(excel_start_time,datemode)
+                    formatted_time = time(*preformatted_start_time[3:5])
+                    start_datetimes.append(datetime.combine(formatted_date,formatted_time))
+
+            # ------------------------------------------------------------------------------
+            # Step 2
+            # Sum observations to develop useful information
+            # Also, scrape excel spreadsheet for old super tuesday ( bin_duration = 120 counts ) data.
+            # ------------------------------------------------------------------------------
+
+            # Every directional total (total, from_* and to_*) in one pass over the observations
+            with instrument.timer('aggregate'):
+                summary, summary_valid = MovementAggregator(obs, obs_valid, genders).direction_totals()
+
+            counts[formatted_date] = Count(countsite, formatted_date, min(start_datetimes), bin_duration,
+                                           summary.astype(np.int32), summary_valid,
+                                           genders=genders, times=start_datetimes, counts=obs, valid=obs_valid)
+        # ------------------------------------------------------------------------------
+        # Old Super Tuesday counts
+
+        else:
+            #   Old Super Tuesday counts contain a value in 'Count Year' but nothing in 'Count Date'
+            countyear = int(sheet.cell(count_row,COUNT_YEAR_COL).value)
+            instrument.log('Countyear_test =', countyear, 'Historic Super Tue Data')
+            instrument.count('legacy_blocks')
+
+            #   In a historic super tuesday count results are recorded in the 28th row of the data block:
+            #   7-9am all bicycle movements                                             column C
+            #   7-9am all bicycle movements entering from North, East, South, West      columns G, H, I, J
+            #   7-9am all bicycle movements departing via North, East, South, West      columns K, L, M, N
+            #   A cell that does not hold a number is NA
+            with instrument.timer('read_block'):
+                values, valid = read_block(sheet, count_row+LEGACY_ROW_OFFSET, 1, 0, max(LEGACY_TOTAL_COLS) + 1)
+            summary = values[0, LEGACY_TOTAL_COLS]
+            summary_valid = valid[0, LEGACY_TOTAL_COLS]
+
+            #   Since no count date is specified we will need to add this data.
+            #   Historic counts are keyed on their assumed count date
+            count_date = FIRST_TUE[countyear]
+            counts[count_date] = Count(countsite, count_date, datetime.combine(count_date, time(7,0,0)), 120,
+                                       summary, summary_valid, legacy=True)
+
+        instrument.log(list(counts.values()))
+
+    return {'worksheet_num': worksheet_num,
+            'countsite': countsite,
+            'site': site,
+            'counts': list(counts.values())}
+
+# -  functions end --
+
+
+# Workbook readers, see batch.READERS
+def open_source_workbook(inputfilename, reader='xlrd'):
+    if reader == 'stream':
+        return StreamingWorkbook(inputfilename)
+    return open_workbook(inputfilename, on_demand=True)
+
+
+# Each process in the pool opens its own copy of a workbook (xlrd books can not be pickled).
+# Worksheets are handed out workbook by workbook, so a process only keeps one workbook open at a time.
+_workbook = None
+_workbook_name = None
+_reader = 'xlrd'
+_known_hashes = {}
+
+def _init_worker(known_hashes=None, reader='xlrd', profile=None, quiet=None):
+    global _workbook, _workbook_name, _reader, _known_hashes
+    _workbook = None
+    _workbook_name = None
+    _reader = reader
+    _known_hashes = known_hashes or {}
+    if profile is not None:
+        instrument.configure(profile, quiet)
+
+
+def _open_workbook(inputfilename):
+    global _workbook, _workbook_name
+    if _workbook_name != inputfilename:
+        if _workbook is not None:
+            _workbook.release_resources()
+        with instrument.timer('open_workbook'):
+            _workbook = open_source_workbook(inputfilename, _reader)
+        _workbook_name = inputfilename
+    return _workbook
+
+
+def _extract_worksheet(task):
+    (inputfilename, worksheet_num) = task
+    workbook = _open_workbook(inputfilename)
+    if worksheet_num >= workbook.nsheets:
+        # An older workbook may have fewer count sites
+        return {'stats': instrument.STATS.pop()}
+
+    start = default_timer()
+
+    with instrument.timer('parse_sheet'):
+        sheet = workbook.sheet_by_index(worksheet_num)
+        try:
+            # The content hash and the index of the sheet's count blocks, in one pass over its rows
+            with instrument.timer('scan_sheet'):
+                (content_hash, blocks) = scan_sheet(sheet)
+            if not blocks:
+                # Not a count site, only its statistics go back
+                record = {}
+            # Skip a sheet that is identical to the last run, the saved count store already holds its counts
+            elif _known_hashes.get(inputfilename, {}).get(sheet.name) == content_hash:
+                instrument.count('sheets_unchanged')
+                record = {'workbook': inputfilename,
+                          'worksheet_num': worksheet_num,
+                          'countsite': sheet.name,
+                          'hash': content_hash,
+                          'unchanged': True}
+            else:
+                instrument.count('sheets_parsed')
+                record = extract_site(sheet, workbook.datemode, worksheet_num, blocks)
+                record['workbook'] = inputfilename
+                record['hash'] = content_hash
+                record['unchanged'] = False
+        finally:
+            # Each sheet is only read once, release it so memory does not grow with the workbook
+            workbook.unload_sheet(worksheet_num)
+
+    if instrument.PROFILE and 'countsite' in record:
+        instrument.site_time(record['countsite'], inputfilename, default_timer() - start)
+    # The statistics of this sheet go back with its record, to the main process
+    record['stats'] = instrument.STATS.pop()
+    return record
+
+
+def _site_record(record):
+    # Merge the statistics of a sheet's record, and return the record if the sheet is a count site
+    instrument.STATS.merge(record.pop('stats'))
+    if 'countsite' in record:
+        return record
+    return None
+
+
+def extract_workbooks(inputfilenames, sheet_nums=None, jobs=1, known_hashes=None, reader='xlrd', sites=None):
+    """
+    Generator yielding one site record per worksheet, workbook by workbook, in worksheet order.
+    Every record names the workbook it came from ('workbook').
+    With jobs > 1 the worksheets of every workbook are scraped by one pool of worker processes,
+    the records are still yielded in order so the output is the same as a serial run.
+    known_hashes maps workbook to {count site: content hash (discover.scan_sheet)} of a previous run,
+    a sheet with the same hash is not scraped and its record only has 'unchanged' = True
+    reader is one of READERS
+    sheet_nums are the worksheets to read, by default every sheet from layout.FIRST_DATA_SHEET on,
+    or only the sheets of the count sites named in sites.
+    A sheet without any count blocks is not a count site, and has no record.
+    The instrument statistics of every sheet, count site or not, are added to instrument.STATS
+    """
+    tasks = [(inputfilename, worksheet_num) for inputfilename in inputfilenames
+             for worksheet_num in (data_sheets(inputfilename, sites) if sheet_nums is None else sheet_nums)]
+    if jobs <= 1:
+        _init_worker(known_hashes, reader)
+        try:
+            for task in tasks:
+                record = _site_record(_extract_worksheet(task))
+                if record is not None:
+                    yield record
+        finally:
+            if _workbook is not None:
+                _workbook.release_resources()
+            _init_worker()
+        return
+
+    pool = multiprocessing.Pool(jobs, _init_worker, (known_hashes, reader, instrument.PROFILE, instrument.QUIET))
+    try:
+        # imap hands out worksheets as workers become free, but returns results in submission order
+        for record in pool.imap(_extract_worksheet, tasks):
+            record = _site_record(record)
+            if record is not None:
+                yield record
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def extract_store(inputfilenames, sheet_nums=None, jobs=1, reader='xlrd'):
+    """
+    Scrape a workbook, or a list of workbooks, into an in memory store.CountStore
+    Several workbooks are merged with store.merge_stores(), later workbooks take precedence.
+    """
+    if not isinstance(inputfilenames, (list, tuple)):
+        inputfilenames = [inputfilenames]
+    stores = collections.OrderedDict((inputfilename, CountStore()) for inputfilename in inputfilenames)
+    for record in extract_workbooks(inputfilenames, sheet_nums, jobs=jobs, reader=reader):
+        stores[record['workbook']].add_record(record)
+    return merge_stores(list(stores.values()))
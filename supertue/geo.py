@@ -0,0 +1,184 @@
+# Bike Count Data Cleaner - GeoJSON export
+# Count site locations for web maps, written to ./script_output/count_locations/count_location_details.json
+# Previously built by hand in the 'map point converter' notebook (with pyproj), with the same definitions:
+#  * Easting and northing (GDA 94 MGA Zone 55) are converted to longitude and latitude, rounded to 4 decimal places.
+#    GDA 94 and WGS 84 differ by less than a metre, the web maps' WGS 84 coordinates are taken as GDA 94.
+#  * Sites without an easting, and sites further south than Wilsons Promontory (junk coordinates), are left out.
+#  * Each site's riders in every count year and its growth (see rollup.py) are attached as properties,
+#    sites without a 15min count are left out. NaN is written as null.
+# -----------------------------
+
+from __future__ import division, print_function
+
+import collections
+import json
+import math
+
+import numpy as np
+
+from supertue.output import GIS_DIR, make_temp_file, replace_file
+from supertue.growth import GROWTH_FIELDS, GrowthEngine, _round
+from supertue.rollup import Rollup
+
+
+GEOJSON_FILE = GIS_DIR + "count_location_details.json"
+
+# GRS 80 ellipsoid, of GDA 94
+SEMI_MAJOR_AXIS = 6378137.0
+FLATTENING = 1 / 298.257222101
+
+# Map Grid of Australia: a transverse Mercator projection in 6 degree zones
+MGA_ZONE = 55
+MGA_SCALE_FACTOR = 0.9996
+MGA_FALSE_EASTING = 500000.0
+MGA_FALSE_NORTHING = 10000000.0
+
+# Any latitude further south than Wilsons Promontory (38.9333 S) is junk
+SOUTHERN_LIMIT = -39
+
+# Properties of each site, as named by the notebook
+LOCATION_PROPERTIES = ['countsite', 'site_description', 'dist_from_cbd', 'primary_road', 'secondary_road']
+GROWTH_PROPERTIES = collections.OrderedDict([
+    ('Most recent count year', 'Most_recent_count_year'),
+    ('Most recent count value', 'Most_recent_count_value'),
+    ('annual increase', 'Annual_increase'),
+    ('growth rate', 'Growth_rate'),
+    ('Number of times counted', 'Number_of_times_counted'),
+    ('rvalue', 'rvalue')])
+
+
+def mga_to_wgs84(easting, northing, zone=MGA_ZONE):
+    """
+    Convert MGA easting and northing arrays to (longitude, latitude) arrays in degrees.
+    Every point is converted at once, with Krueger's series for the transverse Mercator projection
+    (Karney 2011, accurate to well under a millimetre within the zone).
+    """
+    easting = np.asarray(easting, dtype=float)
+    northing = np.asarray(northing, dtype=float)
+
+    n = FLATTENING / (2 - FLATTENING)
+    e = math.sqrt(FLATTENING * (2 - FLATTENING))
+    # Rectifying radius, and the coefficients of the inverse series
+    rectifying_radius = SEMI_MAJOR_AXIS / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+    beta = [n / 2 - 2 * n ** 2 / 3 + 37 * n ** 3 / 96 - n ** 4 / 360,
+            n ** 2 / 48 + n ** 3 / 15 - 437 * n ** 4 / 1440,
+            17 * n ** 3 / 480 - 37 * n ** 4 / 840,
+            4397 * n ** 4 / 161280]
+
+    xi_prime = (northing - MGA_FALSE_NORTHING) / (MGA_SCALE_FACTOR * rectifying_radius)
+    eta_prime = (easting - MGA_FALSE_EASTING) / (MGA_SCALE_FACTOR * rectifying_radius)
+    xi = xi_prime.copy()
+    eta = eta_prime.copy()
+    for (j, beta_j) in enumerate(beta, 1):
+        xi -= beta_j * np.sin(2 * j * xi_prime) * np.cosh(2 * j * eta_prime)
+        eta -= beta_j * np.cos(2 * j * xi_prime) * np.sinh(2 * j * eta_prime)
+
+    # Conformal latitude, then the latitude by Newton's method on its tangent
+    tau_prime = np.sin(xi) / np.sqrt(np.sinh(eta) ** 2 + np.cos(xi) ** 2)
+    tau = tau_prime.copy()
+    for _ in range(5):
+        sigma = np.sinh(e * np.arctanh(e * tau / np.sqrt(1 + tau ** 2)))
+        tau_i = tau * np.sqrt(1 + sigma ** 2) - sigma * np.sqrt(1 + tau ** 2)
+        tau += ((tau_prime - tau_i) / np.sqrt(1 + tau_i ** 2)
+                * (1 + (1 - e ** 2) * tau ** 2) / ((1 - e ** 2) * np.sqrt(1 + tau ** 2)))
+
+    central_meridian = 6 * zone - 183
+    longitude = central_meridian + np.degrees(np.arctan2(np.sinh(eta), np.cos(xi)))
+    latitude = np.degrees(np.arctan(tau))
+    return longitude, latitude
+
+
+def _number(text):
+    # A location field as a number, NaN if it is blank or not a number
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def json_value(value):
+    # numpy numbers as python numbers, NaN as null
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def json_column(column):
+    # As a growth table column read back by pandas: whole numbers as integers, unless the column has a missing value
+    if not np.isnan(column).any() and (column == np.round(column)).all():
+        return [int(value) for value in column]
+    return [json_value(float(value)) for value in column]
+
+
+def site_points(count_store):
+    """
+    Longitude and latitude of every site in a store.CountStore with good coordinates.
+    Returns an ordered dictionary of countsite: (longitude, latitude), in worksheet order.
+    """
+    countsites = list(count_store.sites)
+    easting = np.array([_number(site.easting) for site in count_store.sites.values()])
+    northing = np.array([_number(site.northing) for site in count_store.sites.values()])
+
+    # No point for a site without coordinates
+    located = ~np.isnan(easting) & ~np.isnan(northing)
+    longitude, latitude = mga_to_wgs84(easting[located], northing[located])
+    longitude = _round(longitude, 4)
+    latitude = _round(latitude, 4)
+    countsites = [countsite for (countsite, ok) in zip(countsites, located) if ok]
+
+    return collections.OrderedDict((countsite, (lon, lat))
+                                   for (countsite, lon, lat) in zip(countsites, longitude, latitude)
+                                   if lat >= SOUTHERN_LIMIT)
+
+
+def write_geojson(count_store, filename=GEOJSON_FILE, riders='allriders', growth=None):
+    """
+    Write a GeoJSON FeatureCollection of the count sites, a point with the site's location details,
+    riders in each count year and growth. The features are streamed to the file one at a time.
+    growth is a growth.GrowthEngine that is up to date with the store, one is built if it is not given.
+    Returns the path written.
+    """
+    rollup = Rollup(count_store)
+    site_ids = dict((countsite, i) for (i, countsite) in enumerate(rollup.sites))
+    values = rollup.riders(riders)
+    if growth is None:
+        growth = GrowthEngine()
+        growth.update(count_store)
+    growth = growth.growth(riders, rollup.sites)
+    growth_columns = dict((GROWTH_PROPERTIES[field], json_column(growth[field])) for field in GROWTH_FIELDS)
+
+    # Streamed to a temporary file, which replaces the layer when it is complete
+    temp_path = make_temp_file(filename)
+    with open(temp_path, "w") as output_file:
+        output_file.write('{"type": "FeatureCollection", "features": [')
+        separator = '\n'
+        for (countsite, (longitude, latitude)) in site_points(count_store).items():
+            if countsite not in site_ids:
+                # No 15min count, so no riders or growth
+                continue
+            i = site_ids[countsite]
+            site = count_store.sites[countsite]
+
+            properties = collections.OrderedDict()
+            for field in LOCATION_PROPERTIES:
+                properties[field] = getattr(site, field)
+            dist_from_cbd = _number(site.dist_from_cbd)
+            properties['dist_from_cbd'] = site.dist_from_cbd if np.isnan(dist_from_cbd) else dist_from_cbd
+            for name in GROWTH_PROPERTIES.values():
+                properties[name] = growth_columns[name][i]
+            for (y, year) in enumerate(rollup.years):
+                properties[str(year)] = json_value(float(values[i, y]))
+
+            feature = collections.OrderedDict([
+                ('type', 'Feature'),
+                ('geometry', {'type': 'Point', 'coordinates': [float(longitude), float(latitude)]}),
+                ('properties', properties)])
+            output_file.write(separator + json.dumps(feature))
+            separator = ',\n'
+        output_file.write('\n]}\n')
+    replace_file(temp_path, filename)
+    return filename
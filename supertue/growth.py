@@ -0,0 +1,289 @@
+# Bike Count Data Cleaner - growth trends
+# The growth in riders at each count site: a linear fit of riders against count year, as scipy.stats.linregress.
+#
+# A fit only needs the sums n, sum x, sum y, sum xy, sum x^2 and sum y^2 of its (count year, riders) points.
+# GrowthEngine keeps those sums for every series of every site, and is saved between runs
+# (./script_output/growth_store.pkl). The engine keeps the content hash of each site's sheet (as the
+# manifest does), so a run only looks at the sites whose sheets changed, and of those only the sums of
+# the changed (site, year) points are updated, the rest of the history is not fitted again.
+# The sums are kept as integers (riders and years are whole numbers), so they are exact however
+# many points are added and taken away.
+#
+# Series of each site: allriders, female and male (as the rollup.py tables) and the 7am - 9am total
+# from and to each direction (all riders). A direction total that is NA is left out of its series.
+# -----------------------------
+
+from __future__ import division, print_function
+
+import collections
+import os
+import pickle
+
+import numpy as np
+
+from supertue.aggregate import DIRECTIONS
+from supertue.output import make_temp_file, replace_file
+
+
+GROWTH_STORE_FILE = "./script_output/growth_store.pkl"
+
+# Bump this when GrowthEngine changes, so an old saved engine is rebuilt
+GROWTH_STORE_VERSION = 2
+
+MINIMUM_COUNTS_FOR_GROWTH_ESTIMATE = 3
+R_VALUE_THRESHOLD = 0.5
+
+# Riders of each table, and the genders counted towards them
+RIDERS = collections.OrderedDict([('allriders', ('F', 'M', 'NA')),
+                                  ('female', ('F',)),
+                                  ('male', ('M',))])
+
+# Every series of a site
+SERIES = list(RIDERS) + DIRECTIONS[1:]
+
+GROWTH_FIELDS = ['Most recent count year', 'Number of times counted', 'Most recent count value',
+                 'annual increase', 'growth rate', 'rvalue']
+
+# Columns of the sums of each series
+SUMS = ['n', 'x', 'y', 'xy', 'xx', 'yy']
+
+
+def _round(values, decimals=0):
+    # Round half away from zero, as python 2's round() did in the notebooks (np.round rounds half to even)
+    scale = 10.0 ** decimals
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+def point_sums(year, values, valid):
+    # The SUMS of a (count year, riders) point of each series, 0 where the series has no value.
+    # Also of many points at once, given a column of years.
+    v = valid.astype(np.int64)
+    y = np.where(valid, values, 0).astype(np.int64)
+    x = np.asarray(year, dtype=np.int64)
+    return np.stack([v, v * x, y, x * y, v * x * x, y * y], axis=-1)
+
+
+def fit_growth(sums, latest_year, latest_value):
+    """
+    Growth from the SUMS of each site (shape (site, 6)), and the most recent count year and value of each site
+    (NaN where the site has no points). Returns a dictionary of GROWTH_FIELDS: site arrays, NaN where there is no value.
+    """
+    (n, sx, sy, sxy, sxx, syy) = [sums[:, k] for k in range(len(SUMS))]
+    # n times the sums of squares about the means, exact
+    ssxm = (n * sxx - sx * sx).astype(float)
+    ssym = (n * syy - sy * sy).astype(float)
+    ssxym = (n * sxy - sx * sy).astype(float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = ssxym / ssxm
+        # linregress reports r = 0 when either variable is constant
+        rvalue = np.where((ssxm == 0) | (ssym == 0), 0.0, ssxym / np.sqrt(ssxm * ssym))
+
+        fitted = n >= MINIMUM_COUNTS_FOR_GROWTH_ESTIMATE
+        annual_increase = np.where(fitted, _round(slope), np.nan)
+        rvalue = np.where(fitted, _round(np.clip(rvalue, -1, 1), 3), np.nan)
+        growth_rate = np.where(fitted & (np.abs(rvalue) >= R_VALUE_THRESHOLD) & (latest_value != 0),
+                               _round(annual_increase / latest_value * 100, 2), np.nan)
+
+    return collections.OrderedDict(zip(GROWTH_FIELDS, [latest_year, n.astype(float), latest_value,
+                                                       annual_increase, growth_rate, rvalue]))
+
+
+def count_points(counts):
+    """
+    The riders of a list of 15min store.Counts in each of SERIES.
+    Returns (values, valid), arrays of (count, series). NA observations are left out of the riders,
+    a count without a gender split counts as 0 female and 0 male riders.
+    """
+    genders = list(RIDERS['allriders'])
+    by_gender = np.zeros((len(counts), len(genders)), dtype=np.int64)
+    for (i, count) in enumerate(counts):
+        by_gender[i, [genders.index(gender) for gender in count.genders]] = \
+            np.where(count.valid, count.counts, 0).sum(axis=(1, 2))
+
+    riders = np.stack([by_gender[:, [genders.index(gender) for gender in RIDERS[name]]].sum(axis=1)
+                       for name in RIDERS], axis=-1)
+    # The totals from and to each direction
+    shape = (len(counts), len(DIRECTIONS) - 1)
+    summary = np.array([count.summary[1:] for count in counts], dtype=np.int64).reshape(shape)
+    summary_valid = np.array([count.summary_valid[1:] for count in counts], dtype=bool).reshape(shape)
+    values = np.concatenate([riders, summary], axis=1)
+    valid = np.concatenate([np.ones(riders.shape, dtype=bool), summary_valid], axis=1)
+    return values, valid
+
+
+def growth_points(count_store, sites=None):
+    # {countsite: {year: (values, valid)}} of the latest 15min count of each site (default every site) in each year
+    if sites is None:
+        counts = count_store.counts
+    else:
+        counts = [count for countsite in sites for count in count_store.select(site=countsite)]
+    latest = {}
+    for count in sorted(counts, key=lambda count: count.count_date):
+        if not count.legacy:
+            latest[(count.countsite, count.year)] = count
+    (values, valid) = count_points(list(latest.values()))
+    points = {}
+    for (i, (countsite, year)) in enumerate(latest):
+        points.setdefault(countsite, {})[year] = (values[i], valid[i])
+    return points
+
+
+class GrowthEngine(object):
+    """
+    The growth of every series (SERIES) of every count site, updated a point at a time.
+    points  {countsite: {year: (values, valid)}}, the riders of each series in each count year
+    sums    {countsite: int array (series, SUMS)}, the sums of those points
+    latest  {countsite: int array (series, 2)}, the most recent count year (0 if none) and its riders
+    hashes  {countsite: content hash} of the count store the engine was last updated with
+    """
+
+    def __init__(self):
+        self.points = {}
+        self.sums = {}
+        self.latest = {}
+        self.hashes = {}
+
+    @property
+    def sites(self):
+        return sorted(self.sums)
+
+    def _find_latest(self, countsite):
+        # Look through a site's own points, after its latest point was changed or removed
+        latest = np.zeros((len(SERIES), 2), dtype=np.int64)
+        for (year, (values, valid)) in sorted(self.points[countsite].items()):
+            latest[valid] = np.stack([np.full(len(SERIES), year, dtype=np.int64), values], axis=-1)[valid]
+        self.latest[countsite] = latest
+
+    def set_point(self, countsite, year, values, valid):
+        """
+        Add a site's riders in a count year, or replace them. Returns False if they have not changed.
+        """
+        site_points = self.points.setdefault(countsite, {})
+        old = site_points.get(year)
+        if old is not None and np.array_equal(old[0], values) and np.array_equal(old[1], valid):
+            return False
+        if countsite not in self.sums:
+            self.sums[countsite] = np.zeros((len(SERIES), len(SUMS)), dtype=np.int64)
+            self.latest[countsite] = np.zeros((len(SERIES), 2), dtype=np.int64)
+        if old is not None:
+            self.sums[countsite] -= point_sums(year, *old)
+        self.sums[countsite] += point_sums(year, values, valid)
+        site_points[year] = (values, valid)
+
+        latest = self.latest[countsite]
+        if old is not None and (latest[:, 0] == year).any():
+            self._find_latest(countsite)
+        else:
+            # A new count year: the most recent count of each series it has a value for, unless a later year is known
+            newer = valid & (year >= latest[:, 0])
+            latest[newer, 0] = year
+            latest[newer, 1] = values[newer]
+        return True
+
+    def remove_point(self, countsite, year):
+        (values, valid) = self.points[countsite].pop(year)
+        self.sums[countsite] -= point_sums(year, values, valid)
+        if not self.points[countsite]:
+            del self.points[countsite], self.sums[countsite], self.latest[countsite]
+        elif (self.latest[countsite][:, 0] == year).any():
+            self._find_latest(countsite)
+
+    def add_sites(self, points):
+        """
+        Add sites new to the engine, {countsite: {year: (values, valid)}}, summing every point at once.
+        """
+        rows = [(countsite, year, values, valid) for (countsite, site_points) in sorted(points.items())
+                for (year, (values, valid)) in sorted(site_points.items())]
+        if not rows:
+            return
+        sites = [countsite for (countsite, site_points) in sorted(points.items()) if site_points]
+        starts = np.cumsum([0] + [len(points[countsite]) for countsite in sites[:-1]])
+        years = np.array([row[1] for row in rows], dtype=np.int64)
+        values = np.array([row[2] for row in rows], dtype=np.int64)
+        valid = np.array([row[3] for row in rows], dtype=bool)
+
+        sums = np.add.reduceat(point_sums(years[:, np.newaxis], values, valid), starts, axis=0)
+        # The last point (in year order) of each site with a value in each series
+        last = np.maximum.reduceat(np.where(valid, np.arange(len(rows))[:, np.newaxis], -1), starts, axis=0)
+        latest = np.stack([years[last], values[last, np.arange(len(SERIES))]], axis=-1)
+        latest[last < 0] = 0
+
+        for (i, countsite) in enumerate(sites):
+            self.points[countsite] = dict(points[countsite])
+            self.sums[countsite] = sums[i]
+            self.latest[countsite] = latest[i]
+
+    def update(self, count_store):
+        """
+        Bring the engine up to date with the counts of a store.CountStore.
+        Only the sites whose content hash (CountStore.hashes) has changed are looked at, the sites the
+        manifest reports as changed, added or removed, and of those only the (site, year) points that
+        were added, changed or removed are applied.
+        Returns the number of points applied.
+        """
+        hashes = count_store.hashes
+        changed = [countsite for countsite in count_store.sites
+                   if hashes.get(countsite) is None or self.hashes.get(countsite) != hashes[countsite]]
+        applied = 0
+        for countsite in [countsite for countsite in self.points if countsite not in count_store.sites]:
+            applied += len(self.points[countsite])
+            del self.points[countsite], self.sums[countsite], self.latest[countsite]
+
+        # Every site at once on the first update, otherwise the changed sites
+        points = growth_points(count_store, None if not self.points else changed)
+        new = dict((countsite, site_points) for (countsite, site_points) in points.items()
+                   if countsite not in self.points)
+        self.add_sites(new)
+        applied += sum(len(site_points) for site_points in new.values())
+        for countsite in changed:
+            if countsite in new:
+                continue
+            site_points = points.get(countsite, {})
+            for year in sorted(self.points.get(countsite, {})):
+                if year not in site_points:
+                    self.remove_point(countsite, year)
+                    applied += 1
+            for (year, (values, valid)) in sorted(site_points.items()):
+                if self.set_point(countsite, year, values, valid):
+                    applied += 1
+
+        self.hashes = dict((countsite, hashes[countsite]) for countsite in count_store.sites if countsite in hashes)
+        return applied
+
+    def growth(self, series='allriders', sites=None):
+        """
+        Growth of one series at each site (default every site, sorted), from the sums alone.
+        Returns a dictionary of GROWTH_FIELDS: site arrays, NaN where there is no value.
+        """
+        sites = self.sites if sites is None else sites
+        s = SERIES.index(series)
+        sums = np.array([self.sums[countsite][s] for countsite in sites], dtype=np.int64).reshape(-1, len(SUMS))
+        latest = np.array([self.latest[countsite][s] for countsite in sites], dtype=np.int64).reshape(-1, 2)
+        counted = latest[:, 0] > 0
+        return fit_growth(sums, np.where(counted, latest[:, 0], np.nan), np.where(counted, latest[:, 1], np.nan))
+
+    def save(self, path=GROWTH_STORE_FILE):
+        # Written to a temporary file first, an interrupted run leaves the previous engine in place
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = make_temp_file(path)
+        with open(temp_path, 'wb') as store_file:
+            pickle.dump((GROWTH_STORE_VERSION, self.points, self.sums, self.latest, self.hashes), store_file,
+                        pickle.HIGHEST_PROTOCOL)
+        replace_file(temp_path, path)
+
+    @classmethod
+    def load(cls, path=GROWTH_STORE_FILE):
+        """
+        The engine saved by the cleaner's last run.
+        An empty engine if there is none, or it was saved by an older version of the cleaner.
+        """
+        engine = cls()
+        if os.path.exists(path):
+            with open(path, 'rb') as store_file:
+                saved = pickle.load(store_file)
+            if saved[0] == GROWTH_STORE_VERSION:
+                (_, engine.points, engine.sums, engine.latest, engine.hashes) = saved
+        return engine
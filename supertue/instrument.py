@@ -0,0 +1,167 @@
+# Bike Count Data Cleaner - run instrumentation
+# Stage timers, counters and progress messages of a run of the cleaner.
+#
+#   with instrument.timer('aggregate'):     time a stage (only when profiling is switched on)
+#   instrument.count('na_cells', n)         add to a counter
+#   instrument.log(countsite)               progress message, silent in quiet mode
+#
+# Each process keeps its own STATS. A worker hands the statistics of each worksheet back
+# with the worksheet's record (see extract._extract_worksheet), and they are merged into the
+# main process's STATS, so the report covers every worksheet whichever process scraped it.
+# -----------------------------
+
+from __future__ import print_function
+
+import collections
+import json
+import time
+from timeit import default_timer
+
+
+# Stage timers are only read when profiling, counters are always kept
+PROFILE = False
+
+# Quiet mode: no progress messages (the site name and counts of every sheet).
+# A library user sees none, the cleaner's command line switches them on unless given --quiet.
+QUIET = True
+
+# Timers of the report, in the order of a run
+TIMERS = ['open_workbook', 'scan_sheet', 'parse_sheet', 'read_block', 'date_conversion', 'aggregate',
+          'merge', 'write', 'write_files', 'rollup', 'geojson', 'store']
+
+COUNTERS = ['sheets_parsed', 'sheets_unchanged', 'blocks', 'legacy_blocks',
+            'cells_read', 'na_cells', 'growth_points', 'files_written', 'bytes_written']
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.name, default_timer() - self.start)
+        return False
+
+
+class Stats(object):
+    """
+    Seconds and calls of each timer, the counters and the parse time of each site.
+    """
+
+    def __init__(self):
+        self.seconds = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.counters = collections.defaultdict(int)
+        self.sites = collections.OrderedDict()
+
+    def add_time(self, name, seconds, calls=1):
+        self.seconds[name] += seconds
+        self.calls[name] += calls
+
+    def to_dict(self):
+        return {'seconds': dict(self.seconds), 'calls': dict(self.calls),
+                'counters': dict(self.counters), 'sites': list(self.sites.items())}
+
+    def merge(self, stats):
+        # Add the statistics (to_dict()) of another process
+        for (name, seconds) in stats['seconds'].items():
+            self.add_time(name, seconds, stats['calls'].get(name, 0))
+        for (name, value) in stats['counters'].items():
+            self.counters[name] += value
+        for (countsite, site_stats) in stats['sites']:
+            self.sites[countsite] = site_stats
+
+    def pop(self):
+        # Statistics gathered since the last pop(), which are cleared
+        stats = self.to_dict()
+        self.__init__()
+        return stats
+
+STATS = Stats()
+
+
+def configure(profile=False, quiet=True):
+    global PROFILE, QUIET
+    PROFILE = profile
+    QUIET = quiet
+
+
+def timer(name):
+    if not PROFILE:
+        return NULL_TIMER
+    return _Timer(STATS, name)
+
+
+def count(name, value=1):
+    STATS.counters[name] += value
+
+
+def site_time(countsite, workbook, seconds):
+    # Parse time of one site, to find the slowest sheets
+    STATS.sites[countsite] = {'workbook': workbook, 'seconds': round(seconds, 4)}
+
+
+def log(*args):
+    if not QUIET:
+        print(*args)
+
+
+def report(started, seconds, settings=None, manifest=None, top=10):
+    """
+    The run report: settings, stage timers, counters and the slowest sites
+    """
+    timers = collections.OrderedDict()
+    for name in TIMERS + sorted(set(STATS.seconds) - set(TIMERS)):
+        if name in STATS.calls:
+            timers[name] = {'seconds': round(STATS.seconds[name], 4), 'calls': STATS.calls[name]}
+    counters = collections.OrderedDict((name, STATS.counters.get(name, 0)) for name in COUNTERS)
+    counters.update(sorted((name, value) for (name, value) in STATS.counters.items() if name not in COUNTERS))
+    slowest = sorted(STATS.sites.items(), key=lambda item: -item[1]['seconds'])[:top]
+
+    run = collections.OrderedDict([
+        ('started', time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started))),
+        ('seconds', round(seconds, 3)),
+        ('settings', settings or {}),
+        ('timers', timers),
+        ('counters', counters),
+        ('slowest_sites', [collections.OrderedDict([('countsite', countsite)] + sorted(site_stats.items()))
+                           for (countsite, site_stats) in slowest])])
+    if manifest is not None:
+        run['sites'] = collections.OrderedDict([('unchanged', len(manifest.unchanged)),
+                                                ('changed', len(manifest.changed)),
+                                                ('added', len(manifest.added)),
+                                                ('removed', len(manifest.removed))])
+    return run
+
+
+def print_report(run):
+    print('Run took %.2f seconds' % run['seconds'])
+    if run['timers']:
+        print('  %-16s %10s %8s' % ('stage', 'seconds', 'calls'))
+        for (name, timer_stats) in run['timers'].items():
+            print('  %-16s %10.3f %8d' % (name, timer_stats['seconds'], timer_stats['calls']))
+    print('  ' + ', '.join('%s %d' % (name, value) for (name, value) in run['counters'].items()))
+    if run['slowest_sites']:
+        print('  Slowest sheets: ' + ', '.join('%s %.3fs' % (site['countsite'], site['seconds'])
+                                                for site in run['slowest_sites']))
+
+
+def save_report(run, path):
+    with open(path, 'w') as report_file:
+        json.dump(run, report_file, indent=1, separators=(',', ': '))
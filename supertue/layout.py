@@ -0,0 +1,74 @@
+# Bike Count Data Cleaner - worksheet layout
+# Where the Super Tuesday workbook keeps its data.
+# All row and column numbers are pythonic (zero based), excel names are given in the comments.
+# -----------------------------
+
+from datetime import date
+
+
+# Source file is a multiple worksheet excel file. One count site per sheet, mulitple counts on each sheet.
+# Count observations are recorded on work sheets (pythonic)6 'BW-CityLinkBrunswickRd' to 100 'MerriCrkTrailWestRingRdTrail'
+# of the 2017 workbook. The sheets before FIRST_DATA_SHEET summarise the counts, every sheet after it is a count site
+# (see discover.data_sheets).
+FIRST_DATA_SHEET = 6
+
+# The counts are recorded in blocks commencing on (excel)rows  93, 125, 157, 189, 221, 253, 285
+# of the 2017 workbook. The rows above hold the site details and the sheet's own summary.
+# The blocks of a sheet are found by their anchor cells (see discover.py), from FIRST_BLOCK_ROW down.
+COUNT_ROWS = (92, 124, 156, 188, 221, 253, 285)
+FIRST_BLOCK_ROW = COUNT_ROWS[0]
+
+# Anchor cells, in the first row of a block: Count Date in column C, or the Count Year of a historic count in column N
+COUNT_DATE_COL = 2
+COUNT_YEAR_COL = 13
+# An excel date no earlier than 1 January 2000, smaller numbers are not count dates
+MIN_COUNT_DATE = 36526
+
+# Second row of a 15min count block: bin duration in column K, gender split flag (Y/N) in column O
+BIN_DURATION_COL = 10
+GENDER_SPLIT_COL = 14
+
+# A historic Super Tuesday count has its 7am - 9am totals 27 rows below the Count Year
+LEGACY_ROW_OFFSET = 27
+
+# and the column of each total, in aggregate.DIRECTIONS order: total (C), from north, east, south, west (G - J)
+# and to north, east, south, west (K - N)
+LEGACY_TOTAL_COLS = [2, 6, 7, 8, 9, 10, 11, 12, 13]
+
+# Kinds of count block
+BLOCK_GENDERED = '15min gendered'   # 15min observations of female and male riders
+BLOCK_UNGENDERED = '15min'          # 15min observations, without a gender split
+BLOCK_LEGACY = 'legacy'             # historic Super Tuesday count, 120min totals only
+BLOCK_KINDS = (BLOCK_GENDERED, BLOCK_UNGENDERED, BLOCK_LEGACY)
+
+# Data in a full block has movement observations recorded in the sixth to thirteen rows,
+# one row for each of the eight 15min bins in the 7 - 9 am observation period.
+OBS_ROW_OFFSET = 5
+OBS_BINS = 8
+
+# The first column of an observation row contains the start time, the movements are in columns C to Z
+OBS_TIME_COL = 0
+OBS_LAST_COL = 25
+
+# Column order of the movements in each count observation file
+MOVEMENTS = ['north_turn_left', 'north_through', 'north_turn_right',
+             'east_turn_left', 'east_through', 'east_turn_right',
+             'south_turn_left', 'south_through', 'south_turn_right',
+             'west_turn_left', 'west_through', 'west_turn_right']
+
+# The movements of male cyclists (or NA gender) are recorded in columns C, E, G, I, K, M, O, Q, S, U, W, Y
+# The movments of female cyclists are recorded in next column (i,e columns D, F, H, J, L, N, P, R, T, V, X, Z)
+MALE_MOVEMENTS = [
+                ('north_turn_right', 2), ('north_through', 4), ('north_turn_left',6),\
+                ('east_turn_right',8),('east_through',10),('east_turn_left',12),\
+                ('south_turn_right',14),('south_through',16),('south_turn_left',18),\
+                ('west_turn_right',20),('west_through',22),('west_turn_left',24)\
+                ]
+
+#   Count assumed to occur on First tuesday of March.
+#   First Tuesday: 1 March 2005; 7 March 2006; 6 March 2007; 4 March 2008; 3 March 2009;
+FIRST_TUE = {
+    2005 : date(2005, 3, 1), 2006 : date(2006, 3, 7), \
+    2007 : date(2007, 3, 6), 2008 : date(2008, 3, 4), \
+    2009 : date(2009, 3, 3)
+            }
@@ -0,0 +1,118 @@
+# Bike Count Data Cleaner - run manifest
+# Remember what each worksheet looked like, and which files it produced, the last time the cleaner ran.
+# Worksheets that have not changed since are not scraped or written again.
+# -----------------------------
+
+from __future__ import print_function
+
+import json
+import os
+
+from supertue.output import make_temp_file, replace_file
+
+
+MANIFEST_FILE = "./script_output/manifest.json"
+
+# Bump this when the cleaner's output changes, so the next run rebuilds every sheet
+MANIFEST_VERSION = 1
+
+
+def remove_output(path):
+    # Remove an output file, and the count date / count site directories if that leaves them empty
+    if os.path.exists(path):
+        os.remove(path)
+    directory = os.path.dirname(path)
+    for _ in range(2):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+class Manifest(object):
+    """
+    The manifest has one entry per count site (worksheet name):
+        worksheet_num   position of the sheet in the workbook
+        hash            content hash of the sheet (discover.scan_sheet)
+        location        the site's row of count_location_details.csv
+        outputs         every file written for the site
+    """
+
+    def __init__(self, path=MANIFEST_FILE, full=False):
+        self.path = path
+        self.sheets = {}
+        self.changed = []
+        self.added = []
+        self.unchanged = []
+        self.removed = []
+
+        if not full and os.path.exists(path):
+            with open(path) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get('version') == MANIFEST_VERSION:
+                self.sheets = manifest['sheets']
+        self.previous = set(self.sheets)
+
+    def known_hashes(self):
+        # Hashes of the sheets that can be skipped, provided their content has not changed.
+        # A sheet with a missing output file is always scraped again.
+        return dict((countsite, entry['hash']) for (countsite, entry) in self.sheets.items()
+                    if all(os.path.exists(path) for path in entry['outputs']))
+
+    def location(self, countsite):
+        return self.sheets[countsite]['location']
+
+    def keep(self, record):
+        self.sheets[record['countsite']]['worksheet_num'] = record['worksheet_num']
+        self.unchanged.append(record['countsite'])
+
+    def update(self, record, outputs):
+        # Record the files written for a new or changed sheet, and remove any it no longer produces
+        countsite = record['countsite']
+        if countsite in self.sheets:
+            self.changed.append(countsite)
+            for path in set(self.sheets[countsite]['outputs']) - set(outputs):
+                remove_output(path)
+        else:
+            self.added.append(countsite)
+
+        self.sheets[countsite] = {'worksheet_num': record['worksheet_num'],
+                                  'hash': record['hash'],
+                                  'location': record['site'].location(),
+                                  'outputs': outputs}
+
+    def add_outputs(self, record, outputs):
+        # Files rewritten for part of a site (summarise --years). They are added to the site's earlier files,
+        # and its hash is forgotten so the next run writes the whole site again
+        countsite = record['countsite']
+        entry = self.sheets.get(countsite, {'outputs': []})
+        (self.changed if countsite in self.sheets else self.added).append(countsite)
+        self.sheets[countsite] = {'worksheet_num': record['worksheet_num'],
+                                  'hash': None,
+                                  'location': record['site'].location(),
+                                  'outputs': sorted(set(entry['outputs']) | set(outputs))}
+
+    def finish(self):
+        # Sites that were in the manifest but not in this run's workbook: remove their files
+        seen = set(self.unchanged + self.changed + self.added)
+        for countsite in sorted(self.previous - seen):
+            for path in self.sheets[countsite]['outputs']:
+                remove_output(path)
+            del self.sheets[countsite]
+            self.removed.append(countsite)
+
+    def report(self):
+        print(len(self.unchanged), 'sheets unchanged,', len(self.changed), 'changed,',
+              len(self.added), 'added,', len(self.removed), 'removed')
+        for (label, countsites) in (('Changed', self.changed), ('Added', self.added), ('Removed', self.removed)):
+            if countsites and self.previous:
+                print(' ' + label + ':', ', '.join(countsites))
+
+    def save(self):
+        # Write to a temporary file first, an interrupted run leaves the previous manifest in place
+        temp_path = make_temp_file(self.path)
+        with open(temp_path, 'w') as manifest_file:
+            json.dump({'version': MANIFEST_VERSION, 'sheets': self.sheets},
+                      manifest_file, indent=1, sort_keys=True)
+        replace_file(temp_path, self.path)
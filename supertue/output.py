@@ -0,0 +1,244 @@
+# Bike Count Data Cleaner - output stage
+# Write the site records produced by extract.py to the ./script_output/ directory tree.
+# Files are rendered in the scraping thread and written by a writer thread (see _FileWriter).
+# -----------------------------
+
+from __future__ import print_function
+
+import os
+import tempfile
+import threading
+from timeit import default_timer
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+from supertue import instrument
+from supertue.aggregate import DIRECTIONS
+
+
+# Directory for script output files
+RESULTS_DIR = "./script_output/count_observations/"
+
+# Directory for location information
+GIS_DIR = "./script_output/count_locations/"
+
+# Directory for summaries
+SUMMARY_DIR = "./script_output/summaries/"
+
+LOCATION_HEADER = 'countsite, site_description, suburb, \
+dist_from_cbd, easting, northing, melway_ref, primary_road, secondary_road'
+
+OBSERVATION_HEADER = 'countsite, time, bin_duration, counting, gender, north_turn_left, north_through, north_turn_right, east_turn_left, east_through, east_turn_right, south_turn_left, south_through, south_turn_right, west_turn_left, west_through, west_turn_right'
+
+COUNTING = 'bicycle riders'
+
+# Site records waiting for the writer thread, before scraping waits for the disk
+WRITE_QUEUE_SIZE = 16
+
+SUMMARY_FIELDS = ['countsite', 'dist_from_cbd', 'time', 'bin_duration', 'counting', 'gender', 'total', \
+                  'from_north', 'from_east', 'from_south', 'from_west', \
+                  'to_north', 'to_east', 'to_south', 'to_west']
+
+# The permissions a new file gets, mkstemp makes its file readable by its owner only
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def na_text(values, valid):
+    # The .csv text of an integer array and its NA mask: each value as a string, 'NA' where not valid
+    return np.where(valid, np.asarray(values).astype(str), 'NA')
+
+
+def replace_file(temp_path, path):
+    # Move a finished temporary file over path. Atomic where the system allows it, a reader sees the old or the new file.
+    if hasattr(os, 'replace'):
+        os.replace(temp_path, path)
+        return
+    try:
+        # python 2: os.rename replaces a file atomically on posix systems, but not on Windows
+        os.rename(temp_path, path)
+    except OSError:
+        os.remove(path)
+        os.rename(temp_path, path)
+
+
+def make_temp_file(path):
+    # A new temporary file beside path, to be moved over it with replace_file(). Its name is unique,
+    # so writers of the same file, or a file left by an interrupted run, never get in each other's way.
+    (fd, temp_path) = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                       dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    os.chmod(temp_path, 0o666 & ~_UMASK)
+    return temp_path
+
+
+def atomic_write(filename, text):
+    # Write a file by way of a temporary file, so no one reads it half written
+    temp_path = make_temp_file(filename)
+    try:
+        with open(temp_path, "w") as output_file:
+            output_file.write(text)
+        replace_file(temp_path, filename)
+    except:
+        os.remove(temp_path)
+        raise
+
+
+def render_locations(locations):
+    # count_location_details.csv, one row of location details per count site - potentially useful of GIS mapping.
+    filename = GIS_DIR + "count_location_details.csv"
+    lines = [LOCATION_HEADER] + [", ".join(location) for location in locations]
+    return (filename, '\n'.join(lines) + '\n')
+
+
+def write_locations(locations):
+    # Write count_location_details.csv on its own (the locations stage). Returns the path written.
+    if not os.path.exists(GIS_DIR):
+        os.makedirs(GIS_DIR)
+    (filename, text) = render_locations(locations)
+    atomic_write(filename, text)
+    return filename
+
+
+def make_output_dirs():
+    # Create the output directories (if needed)
+    for directory in (RESULTS_DIR, GIS_DIR, SUMMARY_DIR):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+
+class _FileWriter(threading.Thread):
+    """
+    Writes files handed over by the SiteWriter, so the next sheet is scraped while the last is written.
+    Each batch is a list of (filename, text) pairs, every file written with a single buffered write
+    to a temporary file, which then replaces the file (see atomic_write).
+    The queue is bounded, scraping waits for the disk once WRITE_QUEUE_SIZE batches are waiting.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='SiteWriter')
+        self.daemon = True
+        self.batches = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self.error = None
+        self.files_written = 0
+        self.bytes_written = 0
+        self.seconds = 0.0
+
+    def run(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                break
+            if self.error is not None:
+                # Keep taking batches after an error, so the scraping thread never waits on a full queue
+                continue
+            start = default_timer()
+            try:
+                for (filename, text) in batch:
+                    atomic_write(filename, text)
+                    self.files_written += 1
+                    self.bytes_written += os.path.getsize(filename)
+            except Exception as error:
+                self.error = error
+            self.seconds += default_timer() - start
+
+    def put(self, batch):
+        self.check()
+        self.batches.put(batch)
+
+    def check(self):
+        # Raise the writer thread's error in the scraping thread
+        if self.error is not None:
+            raise self.error
+
+    def finish(self):
+        # Wait for every batch to be written
+        self.batches.put(None)
+        self.join()
+        self.check()
+
+
+class SiteWriter(object):
+    """
+    The single writer for a run of the cleaner.
+    write() renders every file belonging to a site record, hands them to the writer thread and returns their paths.
+    Given years, only the observation files of counts in those years are written (and the site's summary).
+    Location rows are collected in the order the records are handed over,
+    count_location_details.csv is written when the writer is closed.
+    close() returns once every file is written and closed.
+    """
+
+    def __init__(self):
+        make_output_dirs()
+        self.locations = []
+        self.file_writer = _FileWriter()
+        self.file_writer.start()
+
+    def write(self, record, years=None):
+        self.add_location(record['site'].location())
+        with instrument.timer('write'):
+            files = self.render_counts(record, years) + [self.render_summary(record)]
+            self.file_writer.put(files)
+        return [filename for (filename, text) in files]
+
+    def add_location(self, location):
+        self.locations.append(location)
+
+    def render_counts(self, record, years=None):
+        # One file per 15min count, saved in /[Sheet_Name]/[Count_Date_YYYY_MM_DD]
+        countsite = record['countsite']
+        files = []
+        for count in record['counts']:
+            if count.legacy or (years is not None and count.year not in years):
+                continue
+            str_formatted_date = str(count.count_date)
+            # Create directory (if needed) here rather than in the writer thread, so the directory is
+            # there before the manifest removes the site's old files (and any directories they leave empty)
+            savepoint = RESULTS_DIR + countsite + "/" + str_formatted_date + "/"
+            if not os.path.exists(savepoint):
+                os.makedirs(savepoint)
+            filename = savepoint + countsite + str_formatted_date + ".csv"
+            lines = [OBSERVATION_HEADER]
+            # Observation data (how many people made what turn), the whole block at once
+            observations = na_text(count.counts, count.valid)
+            for (g, gender) in enumerate(count.genders):
+                for (b, start_datetime) in enumerate(count.times):
+                    # Specify that you are counting bicycles, other counts condcuted by Council record a mix of bicycles and pedestrians.
+                    row = [countsite, str(start_datetime), str(count.bin_duration), COUNTING, gender]
+                    lines.append(", ".join(row + list(observations[g, b])))
+            files.append((filename, '\n'.join(lines) + '\n'))
+        return files
+
+    def render_summary(self, record):
+        # Summarised counts, one file for each count site
+        # [countdate 07:00:00][bin_duration = 120][gender = NA][total][from north][from east]\
+        # [from south][from west][to north][to east][to south][to west]
+        site = record['site']
+        filename = SUMMARY_DIR + record['countsite'] + "_summary7am-9am.csv"
+        # Every field is followed by ', ', including the last
+        lines = [''.join(field + ', ' for field in SUMMARY_FIELDS)]
+        for count in record['counts']:
+            countsummary = {'countsite': count.countsite,
+                            'dist_from_cbd': site.dist_from_cbd,
+                            'time': count.time,
+                            'bin_duration': 120, # Hard coded, it would be better if it were summed from consituent rows.
+                            'counting': COUNTING,
+                            'gender': 'NA'}
+            countsummary.update(zip(DIRECTIONS, na_text(count.summary, count.summary_valid)))
+            lines.append(''.join(str(countsummary[field]) + ', ' for field in SUMMARY_FIELDS))
+        return (filename, '\n'.join(lines) + '\n')
+
+    def close(self):
+        # Create a file for count details
+        self.file_writer.put([render_locations(self.locations)])
+        with instrument.timer('write'):
+            self.file_writer.finish()
+        instrument.count('files_written', self.file_writer.files_written)
+        instrument.count('bytes_written', self.file_writer.bytes_written)
+        if instrument.PROFILE:
+            instrument.STATS.add_time('write_files', self.file_writer.seconds)
@@ -0,0 +1,180 @@
+# Bike Count Data Cleaner - all sites rollup
+# Tables comparing every count site across the count years, written to ./script_output/allsites_summary/
+#   allmoves{allriders,female,male}7to9year.csv     7am - 9am riders (all movements), count site x count year
+#   allmoves{allriders,female,male}7to9yeargrowth.csv   most recent count and the growth in riders over the years
+#   {from,to}_{north,east,south,west}7to9yeargrowth.csv  the same growth, of all riders from or to each direction
+#   gendersplit.csv                                 female riders as a percentage of riders, count site x count year
+# Previously built by hand in the 'Gender split by Count year' and 'Multiple Site Data Analysis' notebooks,
+# with the same definitions:
+#  * Only 15min counts are included, historic Super Tuesday counts have no observations.
+#  * A count without a gender split counts towards allriders, and as 0 female and 0 male riders.
+#  * NA observations are left out of the sums.
+#  * Growth is a linear fit of riders against count year, for sites counted at least
+#    MINIMUM_COUNTS_FOR_GROWTH_ESTIMATE times.  The growth rate is only given when |r| >= R_VALUE_THRESHOLD.
+#    The cleaner keeps the fits up to date between runs with a growth.GrowthEngine.
+# The .pkl copies (pandas DataFrames, as saved by the notebooks) are only written when pandas is installed.
+# -----------------------------
+
+from __future__ import division, print_function
+
+import collections
+import os
+
+import numpy as np
+
+from supertue.growth import GROWTH_FIELDS, RIDERS, SERIES, GrowthEngine, _round
+from supertue.output import atomic_write, make_temp_file, replace_file
+
+
+# Directory for the all sites tables
+ALLSITES_DIR = "./script_output/allsites_summary/"
+
+GENDERS = ['F', 'M', 'NA']
+
+
+class Rollup(object):
+    """
+    Riders at every count site in every count year, from a store.CountStore.
+    sites (sorted) and years index the rows and columns of every matrix.
+    counted is True where a site was counted in a year. If a site was counted more
+    than once in a year the latest count is used.
+    """
+
+    def __init__(self, count_store):
+        # The latest 15min count of each site in each year
+        latest = {}
+        for count in sorted(count_store.counts, key=lambda count: count.count_date):
+            if not count.legacy:
+                latest[(count.countsite, count.year)] = count
+
+        self.sites = sorted(set(countsite for (countsite, year) in latest))
+        self.years = sorted(set(year for (countsite, year) in latest))
+        site_ids = dict((countsite, i) for (i, countsite) in enumerate(self.sites))
+        year_ids = dict((year, i) for (i, year) in enumerate(self.years))
+
+        self.counted = np.zeros((len(self.sites), len(self.years)), dtype=bool)
+        # One row per (count, gender): where it goes in the matrices, and its observations
+        cells = []
+        observations = []
+        for ((countsite, year), count) in latest.items():
+            self.counted[site_ids[countsite], year_ids[year]] = True
+            for (g, gender) in enumerate(count.genders):
+                cells.append((GENDERS.index(gender), site_ids[countsite], year_ids[year]))
+                observations.append(np.where(count.valid[g], count.counts[g], 0))
+
+        # Sum every count's observations in one pass, then scatter the totals into (gender, site, year)
+        self.by_gender = np.zeros((len(GENDERS), len(self.sites), len(self.years)))
+        if cells:
+            totals = np.array([block.sum() for block in observations], dtype=float)
+            cells = np.array(cells, dtype=np.intp)
+            np.add.at(self.by_gender, (cells[:, 0], cells[:, 1], cells[:, 2]), totals)
+
+    def riders(self, riders='allriders'):
+        # (site, year) riders, NaN where the site was not counted
+        values = self.by_gender[[GENDERS.index(gender) for gender in RIDERS[riders]]].sum(axis=0)
+        return np.where(self.counted, values, np.nan)
+
+    def gender_split(self):
+        # Female riders as a percentage of female and male riders, rounded to 2 decimal places.
+        # NaN where the site was not counted, None where no riders were counted by gender
+        female = self.riders('female')
+        gendered = female + self.riders('male')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            split = _round(female / gendered * 100, 2)
+        split = split.astype(object)
+        split[self.counted & (gendered == 0)] = None
+        return split
+
+
+def _format_float(value):
+    # As pandas writes a float column: shortest repr, nothing for NaN
+    if value is None:
+        return 'NaN'
+    if np.isnan(value):
+        return ''
+    return repr(float(value))
+
+
+def _whole_numbers(column):
+    # True if a float column has no missing value and no fractions
+    return not np.isnan(column).any() and (column == np.round(column)).all()
+
+
+def _downcast(column):
+    # As pd.to_numeric(downcast='integer'), without the overhead of pandas: a column of whole numbers
+    # as the smallest integer type that holds it
+    if len(column) and _whole_numbers(column):
+        for dtype in (np.int8, np.int16, np.int32, np.int64):
+            if np.iinfo(dtype).min <= column.min() and column.max() <= np.iinfo(dtype).max:
+                return column.astype(dtype)
+    return column
+
+
+def _format_column(column):
+    # As a growth table column after pd.to_numeric(downcast='integer'): whole numbers
+    # without a decimal point, unless the column has a missing value
+    if _whole_numbers(column):
+        return ['%d' % value for value in column]
+    return [_format_float(value) for value in column]
+
+
+def _write_csv(filename, header, sites, columns):
+    lines = [','.join([''] + [str(field) for field in header])]
+    lines += [','.join([countsite] + [column[i] for column in columns]) for (i, countsite) in enumerate(sites)]
+    atomic_write(filename, '\n'.join(lines) + '\n')
+
+
+def _write_pickle(filename, sites, header, columns):
+    # The DataFrame saved by the notebooks, skipped if pandas is not installed
+    try:
+        import pandas as pd
+    except ImportError:
+        return None
+    if header == GROWTH_FIELDS:
+        columns = [_downcast(column) for column in columns]
+    df = pd.DataFrame(collections.OrderedDict(zip(header, columns)), index=sites, columns=header)
+    temp_path = make_temp_file(filename)
+    df.to_pickle(temp_path)
+    replace_file(temp_path, filename)
+    return filename
+
+
+def write_rollup(count_store, directory=ALLSITES_DIR, growth=None):
+    """
+    Write the all sites tables for the counts in a store.CountStore.
+    growth is a growth.GrowthEngine that is up to date with the store, one is built if it is not given.
+    Returns the paths written.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    rollup = Rollup(count_store)
+    if growth is None:
+        growth = GrowthEngine()
+        growth.update(count_store)
+    outputs = []
+
+    split = rollup.gender_split()
+    filename = directory + "gendersplit.csv"
+    _write_csv(filename, rollup.years, rollup.sites,
+               [[_format_float(value) for value in split[:, y]] for y in range(len(rollup.years))])
+    outputs.append(filename)
+
+    for riders in RIDERS:
+        filename = directory + 'allmoves' + riders + '7to9year'
+        values = rollup.riders(riders)
+        year_columns = [values[:, y] for y in range(len(rollup.years))]
+        _write_csv(filename + '.csv', rollup.years, rollup.sites,
+                   [[_format_float(value) for value in column] for column in year_columns])
+        outputs.append(filename + '.csv')
+        outputs.append(_write_pickle(filename + '.pkl', rollup.sites, rollup.years, year_columns))
+
+    # The growth of every series, from the engine's sums
+    for series in SERIES:
+        filename = directory + ('allmoves' + series if series in RIDERS else series) + '7to9yeargrowth'
+        table = growth.growth(series, rollup.sites)
+        _write_csv(filename + '.csv', GROWTH_FIELDS, rollup.sites,
+                   [_format_column(column) for column in table.values()])
+        outputs.append(filename + '.csv')
+        outputs.append(_write_pickle(filename + '.pkl', rollup.sites, GROWTH_FIELDS, list(table.values())))
+
+    return [path for path in outputs if path is not None]
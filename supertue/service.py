@@ -0,0 +1,316 @@
+# Bike Count Data Cleaner - query service
+# A local, read only HTTP service answering the map front end's queries as JSON,
+# rather than the front end fetching and parsing the .csv files one by one.
+#
+#   python -m supertue.service --port 8000
+#
+#   GET /sites                          location details of every count site
+#   GET /sites/<countsite>              a site's location details, and the 7am - 9am totals of each of its counts
+#   GET /sites/<countsite>/<YYYY-MM-DD> the 15min observations of a site's count on that date
+#   GET /years/<year>                   riders (all, female and male) and gender split at every site counted that year
+#   GET /growth?series=allriders        growth of every site (series: allriders, female, male, from_north ... to_west,
+#                                       see growth.SERIES; riders= is also accepted)
+#
+# Answers come from the memory mapped observation store (written by the cleaner with --store, and kept up
+# to date by every later run), which also holds the location details and 7am - 9am totals of every count,
+# and from the cleaner's growth fits (growth_store.pkl): riders in each count year and the growth of every
+# series, fitted once for each run of the cleaner rather than for each request. Only index.json and the
+# growth fits are read when the stores change, the observations are read a site at a time.
+# Answers are kept in a least recently used cache. Before each request the service checks the
+# saved stores, and when the cleaner has written new ones the stores are reloaded and the cache emptied.
+# Only the standard library (and numpy) is used. Requests are answered in their own threads.
+# -----------------------------
+
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import os
+import re
+import threading
+import traceback
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, unquote, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+    from urlparse import parse_qs, urlparse
+
+import numpy as np
+
+from supertue.aggregate import DIRECTIONS
+from supertue.columnar import STORE_DIR, ObservationStore
+from supertue.geo import GROWTH_PROPERTIES, json_column, json_value
+from supertue.growth import GROWTH_FIELDS, GROWTH_STORE_FILE, RIDERS, SERIES, GrowthEngine, _round
+from supertue.layout import MOVEMENTS
+from supertue.store import LOCATION_FIELDS
+
+
+# Answers kept in the cache
+CACHE_SIZE = 256
+
+
+class QueryError(Exception):
+    # An answer other than 200 OK
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class LRUCache(object):
+    """
+    The maxsize most recently used answers, safe to share between threads.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._items[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _file_signature(path):
+    # Changes whenever the cleaner replaces the file
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+
+def _summary(summary, summary_valid):
+    # The 7am - 9am totals of a count, NA as null
+    return dict((direction, int(total) if valid else None)
+                for (direction, total, valid) in zip(DIRECTIONS, summary, summary_valid))
+
+
+class _Snapshot(object):
+    # The stores as saved by one run of the cleaner. A request uses one snapshot throughout,
+    # even if the stores are reloaded while it is answered.
+    def __init__(self, observation_store, growth):
+        self.observation_store = observation_store
+        self.locations = collections.OrderedDict((location[0], location) for location in observation_store.locations)
+        self.growth = growth
+        self.sites = growth.sites
+        # The growth tables of every series, as written by the rollup
+        self.growth_tables = dict((series, growth.growth(series, self.sites)) for series in SERIES)
+
+
+class QueryService(object):
+    """
+    Answers queries (a path and query string) with JSON, from the stores saved by the cleaner.
+    query() returns (status, body), body as UTF-8 bytes.
+    """
+
+    def __init__(self, store_dir=STORE_DIR, growth_store_path=GROWTH_STORE_FILE, cache_size=CACHE_SIZE):
+        self.store_dir = store_dir
+        self.growth_store_path = growth_store_path
+        self.cache = LRUCache(cache_size)
+        self._signature = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.routes = [(re.compile(r'^/sites/?$'), self.sites),
+                       (re.compile(r'^/sites/([^/]+)/?$'), self.site),
+                       (re.compile(r'^/sites/([^/]+)/(\d{4}-\d{2}-\d{2})/?$'), self.observations),
+                       (re.compile(r'^/years/(\d{4})/?$'), self.year),
+                       (re.compile(r'^/growth/?$'), self.growth)]
+
+    def signature(self):
+        return (_file_signature(os.path.join(self.store_dir, 'index.json')),
+                _file_signature(self.growth_store_path))
+
+    def refresh(self):
+        """
+        Reload the stores (and empty the cache) if the cleaner has written them since they were loaded.
+        Returns the signature and snapshot of the current stores.
+        Raises QueryError if there is no observation store.
+        """
+        signature = self.signature()
+        with self._lock:
+            if signature == self._signature:
+                return signature, self._snapshot
+            if not ObservationStore.exists(self.store_dir):
+                raise QueryError(503, 'no observation store in ' + self.store_dir + ', run the cleaner with --store')
+            self._snapshot = _Snapshot(ObservationStore(self.store_dir), GrowthEngine.load(self.growth_store_path))
+            self._signature = signature
+            self.cache.clear()
+            return signature, self._snapshot
+
+    def query(self, url):
+        try:
+            return self._query(url)
+        except Exception:
+            # A failed request is reported, and still answered
+            traceback.print_exc()
+            return (500, json.dumps({'error': 'internal error'}).encode('utf-8'))
+
+    def _query(self, url):
+        try:
+            (signature, data) = self.refresh()
+        except QueryError as error:
+            return (error.status, json.dumps({'error': str(error)}).encode('utf-8'))
+        # Answers are cached by the stores they came from, an answer to a request that was
+        # under way when the stores were reloaded is never handed out for the new stores
+        key = (signature, url)
+        answer = self.cache.get(key)
+        if answer is None:
+            parsed = urlparse(url)
+            try:
+                for (pattern, route) in self.routes:
+                    match = pattern.match(parsed.path)
+                    if match:
+                        result = route(data, parse_qs(parsed.query), *[unquote(group) for group in match.groups()])
+                        break
+                else:
+                    raise QueryError(404, 'no such query')
+                answer = (200, json.dumps(result).encode('utf-8'))
+                self.cache.put(key, answer)
+            except QueryError as error:
+                answer = (error.status, json.dumps({'error': str(error)}).encode('utf-8'))
+        return answer
+
+    @staticmethod
+    def _site(data, countsite):
+        if countsite not in data.locations:
+            raise QueryError(404, 'no count site ' + countsite)
+        return data.locations[countsite]
+
+    def sites(self, data, params):
+        return [dict(zip(LOCATION_FIELDS, location)) for location in data.locations.values()]
+
+    def site(self, data, params, countsite):
+        location = self._site(data, countsite)
+        columns = data.observation_store.site_counts(countsite)
+        counts = [{'count_date': str(columns['count_date'][i]),
+                   'time': str(columns['time'][i]).replace('T', ' '),
+                   'bin_duration': int(columns['bin_duration'][i]),
+                   'genders': columns['genders'][i].split(',') if columns['genders'][i] else [],
+                   'legacy': bool(columns['legacy'][i]),
+                   'summary': _summary(columns['summary'][i], columns['summary_valid'][i])}
+                  for i in range(len(columns['site_id']))]
+        return {'site': dict(zip(LOCATION_FIELDS, location)), 'counts': counts}
+
+    def observations(self, data, params, countsite, count_date):
+        self._site(data, countsite)
+        try:
+            day = np.datetime64(count_date, 'D')
+        except ValueError:
+            raise QueryError(400, 'no such date ' + count_date)
+        columns = data.observation_store.site_counts(countsite)
+        if not ((columns['count_date'] == day) & ~columns['legacy']).any():
+            raise QueryError(404, 'no 15min count at ' + countsite + ' on ' + count_date)
+
+        # Read from the memory mapped store, only this site's rows of the count year
+        observations = data.observation_store.load(site=countsite, year=int(count_date[:4]))
+        on_date = observations['time'].astype('datetime64[D]') == day
+        rows = [{'time': str(observations['time'][i].astype('datetime64[s]')).replace('T', ' '),
+                 'bin_duration': int(observations['bin_duration'][i]),
+                 'gender': observations['gender'][i],
+                 'counts': [int(n) if ok else None
+                            for (n, ok) in zip(observations['counts'][i], observations['valid'][i])]}
+                for i in np.nonzero(on_date)[0]]
+        return {'countsite': countsite, 'count_date': count_date, 'movements': MOVEMENTS, 'rows': rows}
+
+    def year(self, data, params, year):
+        # The riders of each site counted in the year, from the points of the growth fits
+        points = [(countsite, data.growth.points[countsite][int(year)][0]) for countsite in data.sites
+                  if int(year) in data.growth.points[countsite]]
+        if not points:
+            raise QueryError(404, 'no counts in ' + year)
+        riders = np.array([values[:len(RIDERS)] for (countsite, values) in points], dtype=float)
+        female = riders[:, list(RIDERS).index('female')]
+        gendered = female + riders[:, list(RIDERS).index('male')]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            split = _round(female / gendered * 100, 2)
+        return [dict([('countsite', countsite), ('gender_split', json_value(split[i]) if gendered[i] else None)]
+                     + [(name, json_value(riders[i, r])) for (r, name) in enumerate(RIDERS)])
+                for (i, (countsite, values)) in enumerate(points)]
+
+    def growth(self, data, params):
+        series = params.get('series', params.get('riders', ['allriders']))[0]
+        if series not in SERIES:
+            raise QueryError(400, 'series is one of ' + ', '.join(SERIES))
+        growth = data.growth_tables[series]
+        columns = [json_column(growth[field]) for field in GROWTH_FIELDS]
+        names = [GROWTH_PROPERTIES[field] for field in GROWTH_FIELDS]
+        return [dict([('countsite', countsite)] + list(zip(names, [column[i] for column in columns])))
+                for (i, countsite) in enumerate(data.sites)]
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        (status, body) = self.server.service.query(self.path)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        # The map front end is served from elsewhere
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class QueryServer(ThreadingMixIn, HTTPServer):
+    # One thread per request, so slow clients do not hold up the others
+    daemon_threads = True
+
+    def __init__(self, address, service, quiet=False):
+        HTTPServer.__init__(self, address, QueryHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the cleaned count data as JSON')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default 127.0.0.1, this machine only)')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help='answers kept in the cache (default %d)' % CACHE_SIZE)
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not log each request')
+    args = parser.parse_args()
+
+    service = QueryService(cache_size=args.cache_size)
+    try:
+        (signature, data) = service.refresh()
+    except QueryError as error:
+        parser.error(str(error))
+    server = QueryServer((args.host, args.port), service, args.quiet)
+    print('Serving', len(data.locations), 'count sites on http://%s:%d/' % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
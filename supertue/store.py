@@ -0,0 +1,269 @@
+# Bike Count Data Cleaner - in memory count store
+# The scraped workbook as python objects, indexed by count site, count date, count year and gender.
+# Analysis can query a CountStore directly, rather than globbing and re-reading the .csv output files.
+#
+#   from supertue.extract import extract_store
+#   store = extract_store(inputfilename)
+#   for count in store.select(site='B-SydneyRdBlythSt', gender='F'):
+#       print(count.count_date, count.total('total'))
+#
+# The cleaner also saves the store of its last run, see CountStore.load()
+# -----------------------------
+
+from __future__ import print_function
+
+import collections
+import hashlib
+import os
+import pickle
+
+from supertue.aggregate import DIRECTIONS, MovementAggregator
+from supertue.output import make_temp_file, replace_file
+
+
+COUNT_STORE_FILE = "./script_output/count_store.pkl"
+
+# Bump this when Site, Count or CountStore change, so an old saved store is rebuilt
+COUNT_STORE_VERSION = 4
+
+LOCATION_FIELDS = ['countsite', 'site_description', 'suburb', 'dist_from_cbd', 'easting', 'northing',
+                   'melway_ref', 'primary_road', 'secondary_road']
+
+
+class Site(object):
+    """
+    Location details of a count site (one worksheet), the fields of count_location_details.csv
+    """
+    __slots__ = ['worksheet_num'] + LOCATION_FIELDS
+
+    def __init__(self, worksheet_num, location):
+        self.worksheet_num = worksheet_num
+        for (field, value) in zip(LOCATION_FIELDS, location):
+            setattr(self, field, value)
+
+    def location(self):
+        # The site's row of count_location_details.csv
+        return [getattr(self, field) for field in LOCATION_FIELDS]
+
+    def __repr__(self):
+        return 'Site(%r)' % self.countsite
+
+
+class Count(object):
+    """
+    One count at a count site.
+    A 15min count holds its observations as a (gender, bin, movement) array and NA mask (see blocks.py).
+    A historic Super Tuesday count only has its 7am - 9am totals (legacy = True, counts is None).
+    summary and summary_valid hold the 7am - 9am totals by direction (in aggregate.DIRECTIONS order)
+    and their NA mask, False where the direction was not counted.
+    """
+    __slots__ = ('countsite', 'count_date', 'time', 'bin_duration', 'genders', 'times',
+                 'counts', 'valid', 'summary', 'summary_valid', 'legacy')
+
+    def __init__(self, countsite, count_date, time, bin_duration, summary, summary_valid,
+                 genders=(), times=(), counts=None, valid=None, legacy=False):
+        self.countsite = countsite
+        self.count_date = count_date
+        self.time = time
+        self.bin_duration = bin_duration
+        self.summary = summary
+        self.summary_valid = summary_valid
+        self.genders = tuple(genders)
+        self.times = list(times)
+        self.counts = counts
+        self.valid = valid
+        self.legacy = legacy
+
+    @property
+    def year(self):
+        return self.count_date.year
+
+    def total(self, direction='total'):
+        # A 7am - 9am total (see aggregate.DIRECTIONS), None if NA
+        d = DIRECTIONS.index(direction)
+        return int(self.summary[d]) if self.summary_valid[d] else None
+
+    def aggregator(self):
+        # Directional totals by bin and by gender. Not available for a historic count.
+        if self.legacy:
+            return None
+        return MovementAggregator(self.counts, self.valid, self.genders)
+
+    def rows(self):
+        # (gender, start time, counts, valid) of each observation row, female riders first
+        for (g, gender) in enumerate(self.genders):
+            for (b, start_datetime) in enumerate(self.times):
+                yield gender, start_datetime, self.counts[g, b], self.valid[g, b]
+
+    def __repr__(self):
+        return 'Count(%r, %s, %r)' % (self.countsite, self.count_date,
+                                      dict((direction, self.total(direction)) for direction in DIRECTIONS))
+
+
+def _date_key(count_date):
+    # Dates may be given as a date or a 'YYYY-MM-DD' string
+    return count_date if isinstance(count_date, str) else str(count_date)
+
+
+class CountStore(object):
+    """
+    Every count site and count of a workbook.
+    sites is an ordered dictionary of countsite: Site, in worksheet order.
+    hashes holds the content hash (discover.scan_sheet) of the sheet each site was read from.
+    select() finds counts by site, date, year and gender through the store's indexes.
+    """
+
+    def __init__(self):
+        self.sites = collections.OrderedDict()
+        self.hashes = {}
+        self._counts = collections.OrderedDict()
+        self._indexed = False
+
+    def _index(self):
+        # The indexes are rebuilt on the first query after the store changes
+        if self._indexed:
+            return
+        self._all = [count for counts in self._counts.values() for count in counts]
+        self._by_site = collections.defaultdict(list)
+        self._by_date = collections.defaultdict(list)
+        self._by_year = collections.defaultdict(list)
+        self._by_gender = collections.defaultdict(list)
+        for (position, count) in enumerate(self._all):
+            self._by_site[count.countsite].append(position)
+            self._by_date[str(count.count_date)].append(position)
+            self._by_year[count.year].append(position)
+            # A count without a gender split (or a historic count) is indexed as gender 'NA'
+            for gender in (count.genders or ('NA',)):
+                self._by_gender[gender].append(position)
+        self._indexed = True
+
+    @property
+    def counts(self):
+        # Every count, in worksheet then block order
+        self._index()
+        return self._all
+
+    def add_site(self, site, counts, content_hash=None):
+        # Add a site and its counts, replacing the site if it is already in the store
+        if site.countsite not in self.sites:
+            # Keep the sites in worksheet order
+            later = [countsite for countsite in self.sites
+                     if self.sites[countsite].worksheet_num > site.worksheet_num]
+            self.sites[site.countsite] = site
+            self._counts[site.countsite] = []
+            for countsite in later:
+                self.sites[countsite] = self.sites.pop(countsite)
+                self._counts[countsite] = self._counts.pop(countsite)
+        self.sites[site.countsite] = site
+        self._counts[site.countsite] = list(counts)
+        if content_hash is not None:
+            self.hashes[site.countsite] = content_hash
+        self._indexed = False
+
+    def add_record(self, record):
+        # Add an extracted site record (see extract.extract_site)
+        self.add_site(record['site'], record['counts'], record.get('hash'))
+
+    def remove_site(self, countsite):
+        self.sites.pop(countsite, None)
+        self._counts.pop(countsite, None)
+        self.hashes.pop(countsite, None)
+        self._indexed = False
+
+    def select(self, site=None, date=None, year=None, gender=None):
+        """
+        Counts matching every given filter, in worksheet then block order.
+        gender is 'F', 'M' or 'NA' (counts without a gender split).
+        """
+        self._index()
+        matches = None
+        for (index, key) in ((self._by_site, site), (self._by_date, date), (self._by_year, year),
+                             (self._by_gender, gender)):
+            if key is None:
+                continue
+            if index is self._by_date:
+                key = _date_key(key)
+            positions = set(index.get(key, ()))
+            matches = positions if matches is None else matches & positions
+        if matches is None:
+            return list(self._all)
+        return [self._all[position] for position in sorted(matches)]
+
+    def years(self):
+        self._index()
+        return sorted(self._by_year)
+
+    def dates(self):
+        self._index()
+        return sorted(self._by_date)
+
+    def to_dataframe(self, site=None, date=None, year=None, gender=None):
+        """
+        Observations of the selected 15min counts in the layout of the count observation .csv files, NA as NaN.
+        Needs pandas.
+        """
+        import numpy as np
+        import pandas as pd
+        from supertue.layout import MOVEMENTS
+
+        rows = []
+        for count in self.select(site, date, year, gender):
+            for (row_gender, start_datetime, counts, valid) in count.rows():
+                if gender is None or row_gender == gender:
+                    rows.append([count.countsite, start_datetime, count.bin_duration, 'bicycle riders', row_gender]
+                                + list(np.where(valid, counts, np.nan)))
+        return pd.DataFrame(rows, columns=['countsite', 'time', 'bin_duration', 'counting', 'gender'] + MOVEMENTS)
+
+    def save(self, path=COUNT_STORE_FILE):
+        # Written to a temporary file first, an interrupted run leaves the previous store in place
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = make_temp_file(path)
+        with open(temp_path, 'wb') as store_file:
+            pickle.dump((COUNT_STORE_VERSION, self.sites, self._counts, self.hashes),
+                        store_file, pickle.HIGHEST_PROTOCOL)
+        replace_file(temp_path, path)
+
+    @classmethod
+    def load(cls, path=COUNT_STORE_FILE):
+        """
+        The store saved by the cleaner's last run.
+        An empty store if there is none, or it was saved by an older version of the cleaner.
+        """
+        store = cls()
+        if os.path.exists(path):
+            with open(path, 'rb') as store_file:
+                saved = pickle.load(store_file)
+            if saved[0] == COUNT_STORE_VERSION:
+                (_, store.sites, store._counts, store.hashes) = saved
+        return store
+
+
+def merge_stores(stores):
+    """
+    Merge the CountStores of several workbooks into one, stores listed in order of precedence (lowest first).
+    A count (count site and count date) found in more than one workbook is taken from the
+    workbook with the highest precedence, as are the location details of a site.
+    Sites and counts follow the order of the highest precedence workbook, counts only found in
+    older workbooks come after them.
+    The hash of a site combines the hashes of its sheet in every workbook.
+    """
+    merged = CountStore()
+    site_hashes = collections.defaultdict(list)
+    for store in reversed(stores):
+        for (countsite, site) in store.sites.items():
+            if countsite not in merged.sites:
+                merged.sites[countsite] = site
+                merged._counts[countsite] = []
+            dates = set(str(count.count_date) for count in merged._counts[countsite])
+            merged._counts[countsite].extend(count for count in store._counts[countsite]
+                                             if str(count.count_date) not in dates)
+            site_hashes[countsite].append(store.hashes.get(countsite, ''))
+
+    for (countsite, hashes) in site_hashes.items():
+        if len(hashes) == 1:
+            merged.hashes[countsite] = hashes[0]
+        else:
+            merged.hashes[countsite] = hashlib.sha1(' '.join(hashes).encode('utf-8')).hexdigest()
+    return merged
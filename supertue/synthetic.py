@@ -0,0 +1,203 @@
+# Bike Count Data Cleaner - synthetic workbooks
+# Build an .xlsx workbook with the layout of the Super Tuesday workbook (see layout.py) and random counts,
+# for benchmarks and for trying the cleaner out without the council's workbook.
+#
+#   python -m supertue.synthetic synthetic.xlsx --sites 95 --blocks 4
+#
+# Every data sheet has the site details block (cells C2 to M6), then count blocks starting on COUNT_ROWS:
+#  * 15min counts: count date in column C, bin duration in K, gender split flag (Y/N) in O,
+#    eight rows of observations with the start time in column A and male (or NA gender) / female
+#    movement column pairs in C to Z
+#  * historic Super Tuesday counts: count year in column N, 7am - 9am totals 27 rows down in C and G to N
+# -----------------------------
+
+from __future__ import print_function
+
+import argparse
+import random
+import zipfile
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+from supertue.layout import COUNT_ROWS, FIRST_DATA_SHEET, FIRST_TUE, MALE_MOVEMENTS, OBS_BINS, OBS_ROW_OFFSET, OBS_TIME_COL
+
+
+CONTENT_TYPES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                 '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                 '<Default Extension="xml" ContentType="application/xml"/>'
+                 '<Override PartName="/xl/workbook.xml" '
+                 'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                 '<Override PartName="/xl/sharedStrings.xml" '
+                 'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+                 '%s</Types>')
+SHEET_CONTENT_TYPE = ('<Override PartName="/xl/worksheets/sheet%d.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>')
+PACKAGE_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                '<Relationship Id="rId1" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+                'Target="xl/workbook.xml"/></Relationships>')
+WORKBOOK = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets>%s</sheets></workbook>')
+WORKBOOK_RELS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                 '%s<Relationship Id="rIdStrings" '
+                 'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+                 'Target="sharedStrings.xml"/></Relationships>')
+SHEET_REL = ('<Relationship Id="rId%d" '
+             'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+             'Target="worksheets/sheet%d.xml"/>')
+WORKSHEET = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+             '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+             '<sheetData>%s</sheetData></worksheet>')
+SHARED_STRINGS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                  '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">%s</sst>')
+
+# Excel stores dates as days since 30 December 1899
+EXCEL_EPOCH = date(1899, 12, 30)
+
+
+def _column_letters(col):
+    letters = ''
+    col += 1
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def _first_tuesday(year):
+    first = date(year, 3, 1)
+    return first + timedelta(days=(1 - first.weekday()) % 7)
+
+
+def site_cells(rnd, site_num, blocks=4, legacy_blocks=1, na_density=0.1, gender_split=0.75):
+    """
+    {(row, col): value} of one count site sheet, rows and columns pythonic.
+    blocks count blocks (at most len(COUNT_ROWS)), the last legacy_blocks of them historic Super Tuesday counts.
+    na_density is the share of observations recorded as 'NA',
+    gender_split the share of 15min counts with a female / male split.
+    """
+    cells = {(1, 2): 'Synthetic site %d, north east corner' % site_num,
+             (2, 2): rnd.choice(['Brunswick', 'Coburg', 'Fawkner', 'Glenroy']),
+             (3, 2): '%d %s%d' % (rnd.randint(1, 50), rnd.choice('ABCDEFGHJK'), rnd.randint(1, 12)),
+             (3, 7): round(318000 + rnd.uniform(0, 8000), 2),
+             (3, 11): round(5813000 + rnd.uniform(0, 12000), 2),
+             (4, 2): round(rnd.uniform(3, 15), 1),
+             (5, 3): 'Synthetic Road %d' % site_num,
+             (5, 12): 'Cross Street, %d' % site_num}
+
+    blocks = min(blocks, len(COUNT_ROWS))
+    legacy_blocks = min(legacy_blocks, blocks, len(FIRST_TUE))
+    dated_blocks = blocks - legacy_blocks
+    legacy_years = sorted(FIRST_TUE)[-legacy_blocks:] if legacy_blocks else []
+
+    for (k, count_row) in enumerate(COUNT_ROWS[:blocks]):
+        if k >= dated_blocks:
+            # Historic Super Tuesday count: the count year, and the 7am - 9am totals
+            cells[(count_row, 13)] = legacy_years[k - dated_blocks]
+            directions = [rnd.randint(0, 400) for _ in range(8)]
+            cells[(count_row + 27, 2)] = sum(directions[:4])
+            for (col, total) in zip(range(6, 14), directions):
+                cells[(count_row + 27, col)] = total
+            continue
+
+        # 15min count, one count every second year from 2010
+        count_date = _first_tuesday(2010 + 2 * k)
+        cells[(count_row, 2)] = float((count_date - EXCEL_EPOCH).days)
+        cells[(count_row, 20)] = 'Counter, %d' % rnd.randint(1, 20)
+        cells[(count_row + 1, 10)] = 15
+        split = rnd.random() < gender_split
+        cells[(count_row + 1, 14)] = 'Y' if split else 'N'
+
+        for b in range(OBS_BINS):
+            obs_row = count_row + OBS_ROW_OFFSET + b
+            cells[(obs_row, OBS_TIME_COL)] = (7 * 60 + 15 * b) / 1440.0
+            for (turn, col) in MALE_MOVEMENTS:
+                for gender_col in ((col, col + 1) if split else (col,)):
+                    cells[(obs_row, gender_col)] = 'NA' if rnd.random() < na_density else rnd.randint(0, 30)
+    return cells
+
+
+def _worksheet_xml(cells, shared_strings):
+    rows = {}
+    for ((row, col), value) in cells.items():
+        rows.setdefault(row, []).append((col, value))
+
+    xml = []
+    for row in sorted(rows):
+        xml.append('<row r="%d">' % (row + 1))
+        for (col, value) in sorted(rows[row]):
+            ref = '%s%d' % (_column_letters(col), row + 1)
+            if isinstance(value, str):
+                if value not in shared_strings:
+                    shared_strings[value] = len(shared_strings)
+                xml.append('<c r="%s" t="s"><v>%d</v></c>' % (ref, shared_strings[value]))
+            else:
+                xml.append('<c r="%s"><v>%r</v></c>' % (ref, value))
+        xml.append('</row>')
+    return WORKSHEET % ''.join(xml)
+
+
+def _write(workbook, name, data):
+    # A fixed timestamp, so the same workbook is written byte for byte every time
+    member = zipfile.ZipInfo(name, date_time=(2017, 3, 7, 7, 0, 0))
+    member.compress_type = zipfile.ZIP_DEFLATED
+    workbook.writestr(member, data)
+
+
+def make_workbook(path, sites=95, blocks=4, legacy_blocks=1, na_density=0.1, gender_split=0.75, seed=1):
+    """
+    Write a synthetic workbook to path, with the count site sheets placed after
+    the same number of leading (summary) sheets as the Super Tuesday workbook.
+    Returns the worksheet numbers of the count sites.
+    The same arguments (and version of python) always give the same workbook.
+    """
+    rnd = random.Random(seed)
+    first_sheet = FIRST_DATA_SHEET
+    sheets = [('Summary %d' % i, {(0, 0): 'Summary sheet'}) for i in range(first_sheet)]
+    sheets += [('S-SyntheticSite%d' % i, site_cells(rnd, i, blocks, legacy_blocks, na_density, gender_split))
+               for i in range(sites)]
+
+    shared_strings = {}
+    workbook = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+    try:
+        for (n, (name, cells)) in enumerate(sheets, 1):
+            _write(workbook, 'xl/worksheets/sheet%d.xml' % n, _worksheet_xml(cells, shared_strings))
+
+        _write(workbook, '[Content_Types].xml',
+                          CONTENT_TYPES % ''.join(SHEET_CONTENT_TYPE % n for n in range(1, len(sheets) + 1)))
+        _write(workbook, '_rels/.rels', PACKAGE_RELS)
+        _write(workbook, 'xl/workbook.xml', WORKBOOK % ''.join(
+            '<sheet name="%s" sheetId="%d" r:id="rId%d"/>' % (escape(name), n, n)
+            for (n, (name, cells)) in enumerate(sheets, 1)))
+        _write(workbook, 'xl/_rels/workbook.xml.rels',
+                          WORKBOOK_RELS % ''.join(SHEET_REL % (n, n) for n in range(1, len(sheets) + 1)))
+        strings = sorted(shared_strings, key=shared_strings.get)
+        _write(workbook, 'xl/sharedStrings.xml',
+                          SHARED_STRINGS % ''.join('<si><t>%s</t></si>' % escape(s) for s in strings))
+    finally:
+        workbook.close()
+    return list(range(first_sheet, first_sheet + sites))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic Super Tuesday workbook')
+    parser.add_argument('path', help='.xlsx file to write')
+    parser.add_argument('--sites', type=int, default=95, help='count site sheets (default 95)')
+    parser.add_argument('--blocks', type=int, default=4,
+                        help='count blocks per sheet, at most %d (default 4)' % len(COUNT_ROWS))
+    parser.add_argument('--legacy-blocks', type=int, default=1,
+                        help='how many of the blocks are historic Super Tuesday counts (default 1)')
+    parser.add_argument('--na-density', type=float, default=0.1, help='share of NA observations (default 0.1)')
+    parser.add_argument('--gender-split', type=float, default=0.75,
+                        help='share of 15min counts split by gender (default 0.75)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    make_workbook(args.path, args.sites, args.blocks, args.legacy_blocks, args.na_density, args.gender_split, args.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Bike Count Data Cleaner - watch mode
+# Keep the cleaner running while the workbooks are edited, and clean them again whenever they change.
+#
+#   python super_tue_cleaner.py --watch [--interval SECONDS] [workbook ...]
+#
+# The workbooks are polled for a change in their modification time or size, which works on any
+# operating system and file system (including network drives). The workbooks, directories and glob
+# patterns are looked up again on each poll, so a workbook added to a watched directory is picked up.
+# A workbook that is still being saved is left until it has stopped changing for one poll.
+# -----------------------------
+
+from __future__ import print_function
+
+import collections
+import os
+import time
+import traceback
+
+from supertue.batch import find_workbooks
+
+
+# Seconds between polls
+WATCH_INTERVAL = 2.0
+
+
+def file_signature(path):
+    # (modification time, size) of a file, None if it is not there
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def workbook_signatures(paths):
+    # The file signature of every workbook named by a list of files, directories and glob patterns, in order
+    return collections.OrderedDict((workbook, file_signature(workbook)) for workbook in find_workbooks(paths))
+
+
+def watch(paths, run, interval=WATCH_INTERVAL):
+    """
+    Call run(workbooks) with the workbooks named by paths, then again each time they change.
+    A failed run (e.g. a workbook saved half way) is reported, and tried again when the workbooks next change.
+    Runs until interrupted.
+    """
+    done = None
+    previous = None
+    try:
+        while True:
+            signatures = workbook_signatures(paths)
+            # Wait for the workbooks to settle, unless this is the first run
+            settled = done is None or signatures == previous
+            if signatures and signatures != done and settled:
+                try:
+                    run(list(signatures))
+                except Exception:
+                    traceback.print_exc()
+                    print('Run failed, waiting for the workbooks to change')
+                done = signatures
+                print('Watching', len(signatures), 'workbooks for changes, Ctrl-C to stop')
+            previous = signatures
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,330 @@
+# Bike Count Data Cleaner - streaming .xlsx reader
+# An alternative to xlrd for .xlsx workbooks.
+# xlrd reads every sheet of an .xlsx file into memory when the workbook is opened.
+# This reader only parses a worksheet's XML when that sheet is asked for, streaming it
+# out of the zip file, and only keeps one worksheet in memory at a time.
+#
+# Sheets offer the parts of the xlrd Sheet interface used by the cleaner:
+# name, nrows, ncols, cell(), cell_value(), row_values(), row_types() and col_values()
+# Cell types and sheet indices are the same as xlrd's: a number in a date format is a date cell,
+# and only worksheets are sheets (chartsheets and dialog sheets are skipped).
+# -----------------------------
+
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+try:
+    unichr
+except NameError:
+    unichr = chr
+
+
+# Cell types, the same values as xlrd.XL_CELL_*
+XL_CELL_EMPTY = 0
+XL_CELL_TEXT = 1
+XL_CELL_NUMBER = 2
+XL_CELL_DATE = 3
+XL_CELL_BOOLEAN = 4
+XL_CELL_ERROR = 5
+
+# Excel error cells, stored by xlrd as an error code
+ERROR_CODES = {'#NULL!': 0x00, '#DIV/0!': 0x07, '#VALUE!': 0x0F, '#REF!': 0x17,
+               '#NAME?': 0x1D, '#NUM!': 0x24, '#N/A': 0x2A}
+
+CELL_REF = re.compile(r'([A-Z]+)([0-9]+)')
+
+# Text is stripped of XML whitespace unless it has xml:space="preserve", as xlrd does
+XML_WHITESPACE = '\t\n \r'
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+ESCAPED_CHAR = re.compile(r'_x([0-9A-Fa-f]{4})_')
+
+# Built in number formats that xlrd takes as dates in an .xlsx file
+BUILTIN_DATE_FORMATS = set(range(14, 23)) | set(range(45, 48))
+
+# Format codes that are never dates, and the characters that make a date or a number format (as xlrd)
+NON_DATE_FORMATS = ('0.00E+00', '##0.0E+0', 'General', 'GENERAL', 'general', '@')
+DATE_CHARS = 'ymdhsYMDHS'
+NUMBER_CHARS = '0#?'
+
+
+def _tag(element):
+    # Element tag without its namespace (transitional and strict .xlsx files use different namespaces)
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _attrib(element, name):
+    # Attribute value regardless of namespace (e.g. r:id)
+    for key in element.attrib:
+        if key.rsplit('}', 1)[-1] == name:
+            return element.attrib[key]
+    return None
+
+
+def _cooked_text(element):
+    # The text of a <t> or <v> element as xlrd reads it: stripped unless xml:space="preserve", with
+    # the _xHHHH_ escapes of characters XML can not hold replaced
+    text = element.text or u''
+    if element.get(XML_SPACE) != 'preserve':
+        text = text.strip(XML_WHITESPACE)
+    return ESCAPED_CHAR.sub(lambda match: unichr(int(match.group(1), 16)), text)
+
+
+def _text(element):
+    # The text of a shared string or inline string: every <t> except phonetic (<rPh>) runs
+    parts = []
+    for child in element:
+        if _tag(child) == 't':
+            parts.append(_cooked_text(child))
+        elif _tag(child) == 'r':
+            parts.extend(_cooked_text(t) for t in child if _tag(t) == 't')
+    return u''.join(parts)
+
+
+def _column_index(letters):
+    col = 0
+    for letter in letters:
+        col = col * 26 + ord(letter) - ord('A') + 1
+    return col - 1
+
+
+def is_date_format(format_code):
+    """
+    Whether a number format shows a date, by xlrd's rule (formatting.is_date_format_string):
+    quoted text, escaped characters and [bracketed] parts are ignored, then a format is a date
+    format if it has more of y, m, d, h and s than of 0, # and ?.
+    """
+    reduced = []
+    state = 0
+    for c in format_code:
+        if state == 0:
+            if c == '"':
+                state = 1
+            elif c in '\\_*':
+                state = 2
+            elif c not in '$-+/(): ':
+                reduced.append(c)
+        elif state == 1:
+            if c == '"':
+                state = 0
+        else:
+            state = 0
+    reduced = re.sub(r'\[[^]]*\]', '', ''.join(reduced))
+    if reduced in NON_DATE_FORMATS:
+        return False
+    date_count = sum(1 for c in reduced if c in DATE_CHARS)
+    number_count = sum(1 for c in reduced if c in NUMBER_CHARS)
+    return date_count > number_count
+
+
+def _relationships(zip_file):
+    # (type, part) of each relationship of the workbook part, by relationship id
+    relationships = {}
+    rels = ET.fromstring(zip_file.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels:
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join('xl', target))
+        relationships[rel.get('Id')] = (rel.get('Type', '').rsplit('/', 1)[-1], target)
+    return relationships
+
+
+def worksheets(zip_file):
+    """
+    (name, part) of every worksheet of an .xlsx workbook, in workbook order.
+    Chartsheets and dialog sheets are left out, as xlrd leaves them out.
+    """
+    relationships = _relationships(zip_file)
+    workbook = ET.fromstring(zip_file.read('xl/workbook.xml'))
+    sheets = []
+    for element in workbook.iter():
+        if _tag(element) == 'sheet':
+            (rel_type, target) = relationships[_attrib(element, 'id')]
+            if rel_type == 'worksheet':
+                sheets.append((element.get('name'), target))
+    return sheets
+
+
+def date_styles(zip_file):
+    """
+    The cell styles (indices into cellXfs of styles.xml) with a date number format.
+    """
+    parts = [target for (rel_type, target) in _relationships(zip_file).values() if rel_type == 'styles']
+    if not parts or parts[0] not in zip_file.namelist():
+        return set()
+    styles = ET.fromstring(zip_file.read(parts[0]))
+    date_formats = set(BUILTIN_DATE_FORMATS)
+    date_xfs = set()
+    for element in styles:
+        if _tag(element) == 'numFmts':
+            for numFmt in element:
+                if is_date_format(numFmt.get('formatCode', '')):
+                    date_formats.add(int(numFmt.get('numFmtId')))
+                else:
+                    date_formats.discard(int(numFmt.get('numFmtId')))
+        elif _tag(element) == 'cellXfs':
+            for (xfx, xf) in enumerate(child for child in element if _tag(child) == 'xf'):
+                if int(xf.get('numFmtId', '0')) in date_formats:
+                    date_xfs.add(xfx)
+    return date_xfs
+
+
+class Cell(object):
+    __slots__ = ('ctype', 'value')
+
+    def __init__(self, ctype, value):
+        self.ctype = ctype
+        self.value = value
+
+
+class StreamingSheet(object):
+    """
+    One worksheet, read from the worksheet's XML with iterparse.
+    Rows are padded to the width of the sheet, as xlrd does.
+    """
+
+    def __init__(self, name, xml_file, shared_strings, date_xfs=()):
+        self.name = name
+        rows = {}
+        ncols = 0
+
+        rowx = -1
+        for event, element in ET.iterparse(xml_file):
+            if _tag(element) != 'row':
+                continue
+            r = element.get('r')
+            rowx = int(r) - 1 if r else rowx + 1
+
+            row = {}
+            colx = -1
+            for c in element:
+                if _tag(c) != 'c':
+                    continue
+                ref = c.get('r')
+                colx = _column_index(CELL_REF.match(ref).group(1)) if ref else colx + 1
+                cell = self._parse_cell(c, shared_strings, date_xfs)
+                if cell is not None:
+                    row[colx] = cell
+            if row:
+                rows[rowx] = row
+                ncols = max(ncols, max(row) + 1)
+            # Release the parsed XML as we go, only the cell values are kept
+            element.clear()
+
+        self.nrows = max(rows) + 1 if rows else 0
+        self.ncols = ncols
+        self._types = []
+        self._values = []
+        for rowx in range(self.nrows):
+            row = rows.get(rowx, {})
+            self._types.append([row[colx].ctype if colx in row else XL_CELL_EMPTY for colx in range(ncols)])
+            self._values.append([row[colx].value if colx in row else '' for colx in range(ncols)])
+
+    @staticmethod
+    def _parse_cell(c, shared_strings, date_xfs):
+        # None for a cell xlrd leaves empty, such as a blank or an empty string
+        cell_type = c.get('t', 'n')
+        value = None
+        for child in c:
+            if _tag(child) == 'v':
+                value = _cooked_text(child) if cell_type == 'str' else child.text
+            elif _tag(child) == 'is':
+                value = _text(child)
+
+        if cell_type == 'str':
+            return Cell(XL_CELL_TEXT, value or u'')
+        if cell_type == 'e':
+            return Cell(XL_CELL_ERROR, ERROR_CODES.get(value, 0x2A))
+        if not value:
+            return None
+        if cell_type == 's':
+            return Cell(XL_CELL_TEXT, shared_strings[int(value)])
+        if cell_type == 'inlineStr':
+            return Cell(XL_CELL_TEXT, value)
+        if cell_type == 'b':
+            return Cell(XL_CELL_BOOLEAN, int(value))
+        # A number is a date if its cell style has a date format
+        if int(c.get('s', '0')) in date_xfs:
+            return Cell(XL_CELL_DATE, float(value))
+        return Cell(XL_CELL_NUMBER, float(value))
+
+    def cell(self, rowx, colx):
+        if colx >= self.ncols:
+            # Raise the same error as xlrd for a cell outside the sheet
+            raise IndexError('list index out of range')
+        return Cell(self._types[rowx][colx], self._values[rowx][colx])
+
+    def cell_value(self, rowx, colx):
+        return self.cell(rowx, colx).value
+
+    def row_types(self, rowx, start_colx=0, end_colx=None):
+        return self._types[rowx][start_colx:end_colx]
+
+    def row_values(self, rowx, start_colx=0, end_colx=None):
+        return self._values[rowx][start_colx:end_colx]
+
+    def col_values(self, colx, start_rowx=0, end_rowx=None):
+        return [row[colx] for row in self._values[start_rowx:end_rowx]]
+
+
+class StreamingWorkbook(object):
+    """
+    An .xlsx workbook that parses worksheets on demand.
+    Only the workbook's sheet list, cell styles and shared strings are read when it is opened.
+    sheet_by_index() parses that sheet and releases the previously loaded one.
+    """
+
+    def __init__(self, filename):
+        self.zip_file = zipfile.ZipFile(filename)
+        names = set(self.zip_file.namelist())
+
+        self.datemode = 0
+        workbook = ET.fromstring(self.zip_file.read('xl/workbook.xml'))
+        for element in workbook.iter():
+            if _tag(element) == 'workbookPr':
+                # Workbooks created on a Mac may count dates from 1904
+                if element.get('date1904') in ('1', 'true'):
+                    self.datemode = 1
+        sheets = worksheets(self.zip_file)
+        self._sheet_names = [name for (name, path) in sheets]
+        self._sheet_paths = [path for (name, path) in sheets]
+        self._date_xfs = date_styles(self.zip_file)
+        self.nsheets = len(self._sheet_names)
+
+        self._shared_strings = []
+        if 'xl/sharedStrings.xml' in names:
+            for event, element in ET.iterparse(self.zip_file.open('xl/sharedStrings.xml')):
+                if _tag(element) == 'si':
+                    self._shared_strings.append(_text(element))
+                    element.clear()
+
+        self._loaded = (None, None)
+
+    def sheet_names(self):
+        return list(self._sheet_names)
+
+    def sheet_by_index(self, sheetx):
+        if self._loaded[0] != sheetx:
+            # Drop the previous sheet before parsing the next, so only one is ever held in memory
+            self._loaded = (None, None)
+            xml_file = self.zip_file.open(self._sheet_paths[sheetx])
+            try:
+                sheet = StreamingSheet(self._sheet_names[sheetx], xml_file, self._shared_strings, self._date_xfs)
+            finally:
+                xml_file.close()
+            self._loaded = (sheetx, sheet)
+        return self._loaded[1]
+
+    def sheet_by_name(self, name):
+        return self.sheet_by_index(self._sheet_names.index(name))
+
+    def unload_sheet(self, sheetx):
+        if self._loaded[0] == sheetx:
+            self._loaded = (None, None)
+
+    def release_resources(self):
+        self._loaded = (None, None)
+        self.zip_file.close()
@@ -0,0 +1,22 @@
+import pytest
+
+from tests.workbooks import synthetic_workbook
+
+
+@pytest.fixture(scope='session')
+def workbook(tmp_path_factory):
+    # A small synthetic workbook: 4 count sites, each with three 15min counts and a historic count
+    return synthetic_workbook(tmp_path_factory.mktemp('workbook') / 'synthetic.xlsx')
+
+
+@pytest.fixture
+def cleaner(tmp_path, monkeypatch, capsys):
+    # Run the cleaner (super_tue_cleaner.main) in an empty directory, each run returns what it printed
+    import super_tue_cleaner
+
+    monkeypatch.chdir(tmp_path)
+
+    def run(*args):
+        super_tue_cleaner.main(list(args))
+        return capsys.readouterr().out
+    return run
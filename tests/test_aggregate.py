@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from supertue.aggregate import DIRECTION_MATRIX, DIRECTIONS, MOVEMENT_DIRECTIONS, MovementAggregator, na_sum
+from supertue.extract import extract_store
+from supertue.layout import MOVEMENTS
+
+
+def _totals(values, valid):
+    return dict(zip(DIRECTIONS, [int(value) if ok else None for (value, ok) in zip(values, valid)]))
+
+
+def test_na_sum():
+    values = np.array([[1, 2, 3], [4, 5, 6]])
+    valid = np.array([[True, False, True], [False, False, True]])
+    (sums, sums_valid) = na_sum(values, valid, axis=1)
+    assert sums.tolist() == [4, 6]
+    assert sums_valid.tolist() == [True, True]
+    (sums, sums_valid) = na_sum(values, valid, axis=0)
+    assert sums.tolist() == [1, 0, 9]
+    assert sums_valid.tolist() == [True, False, True]
+
+
+def test_direction_matrix():
+    # Every movement counts towards the total, the direction it comes from and the one it goes to
+    assert DIRECTION_MATRIX.sum(axis=1).tolist() == [3] * len(MOVEMENTS)
+    for (turn, approach, departure) in MOVEMENT_DIRECTIONS:
+        counts = np.zeros((1, 1, len(MOVEMENTS)), dtype=np.int32)
+        counts[0, 0, MOVEMENTS.index(turn)] = 5
+        totals = _totals(*MovementAggregator(counts, np.ones(counts.shape, dtype=bool)).direction_totals())
+        expected = dict((direction, 0) for direction in DIRECTIONS)
+        expected.update({'total': 5, 'from_' + approach: 5, 'to_' + departure: 5})
+        assert totals == expected
+        assert approach != departure
+
+
+def test_na_movements_are_left_out():
+    counts = np.arange(2 * 8 * len(MOVEMENTS), dtype=np.int32).reshape(2, 8, len(MOVEMENTS))
+    valid = np.ones(counts.shape, dtype=bool)
+    north = [MOVEMENTS.index(turn) for turn in MOVEMENTS if turn.startswith('north')]
+    # Nothing came from the north in the first bin, and nothing at all from the north in the second
+    valid[:, 0, north] = False
+    valid[:, 1, :] = False
+    valid[1, 1, north] = True
+    aggregator = MovementAggregator(counts, valid, ('F', 'M'))
+
+    (values, bins_valid) = aggregator.bin_totals()
+    assert _totals(values[0], bins_valid[0])['from_north'] is None
+    assert _totals(values[0], bins_valid[0])['total'] == int(np.where(valid, counts, 0)[:, 0].sum())
+    assert _totals(values[1], bins_valid[1])['from_east'] is None
+    assert _totals(values[1], bins_valid[1])['from_north'] == int(counts[1, 1, north].sum())
+
+    (values, genders_valid) = aggregator.gender_totals()
+    for g in range(2):
+        assert _totals(values[g], genders_valid[g])['total'] == int(np.where(valid[g], counts[g], 0).sum())
+
+    totals = _totals(*aggregator.direction_totals())
+    assert totals['total'] == int(np.where(valid, counts, 0).sum())
+    assert totals['total'] == sum(totals['from_' + d] for d in ('north', 'east', 'south', 'west'))
+    assert totals['total'] == sum(totals['to_' + d] for d in ('north', 'east', 'south', 'west'))
+
+
+def test_every_movement_na():
+    counts = np.ones((1, 8, len(MOVEMENTS)), dtype=np.int32)
+    totals = _totals(*MovementAggregator(counts, np.zeros(counts.shape, dtype=bool)).direction_totals())
+    assert totals == dict((direction, None) for direction in DIRECTIONS)
+
+
+def test_count_summaries(workbook):
+    # The 7am - 9am totals of each scraped count, against a movement by movement sum
+    counts = [count for count in extract_store(workbook).counts if not count.legacy]
+    assert counts
+    for count in counts:
+        totals = dict((direction, 0) for direction in DIRECTIONS)
+        counted = set()
+        for (turn, approach, departure) in MOVEMENT_DIRECTIONS:
+            m = MOVEMENTS.index(turn)
+            observed = count.valid[:, :, m]
+            if observed.any():
+                riders = int(count.counts[:, :, m][observed].sum())
+                for direction in ('total', 'from_' + approach, 'to_' + departure):
+                    totals[direction] += riders
+                    counted.add(direction)
+        for direction in DIRECTIONS:
+            assert count.total(direction) == (totals[direction] if direction in counted else None)
+
+
+@pytest.mark.parametrize('genders', [('NA',), ('F', 'M')])
+def test_aggregator_keeps_genders(genders):
+    counts = np.ones((len(genders), 8, len(MOVEMENTS)), dtype=np.int32)
+    aggregator = MovementAggregator(counts, np.ones(counts.shape, dtype=bool), genders)
+    assert aggregator.genders == genders
+    assert aggregator.gender_totals()[0].shape == (len(genders), len(DIRECTIONS))
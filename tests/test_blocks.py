@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from supertue.batch import READERS
+from supertue.blocks import read_block, read_observations
+from supertue.extract import open_source_workbook
+from supertue.layout import COUNT_ROWS, FIRST_DATA_SHEET, MOVEMENTS, OBS_BINS
+from tests.workbooks import rewrite_workbook, set_cells, sheet_part, synthetic_workbook
+
+
+# Cells C98:J99 of the first count site, the first observation rows of its first count block
+CELLS = {'C98': '<c r="C98"><v>12</v></c>',
+         'D98': '<c r="D98"><v>12.7</v></c>',
+         'E98': '<c r="E98" t="inlineStr"><is><t>NA</t></is></c>',
+         'F98': '<c r="F98" t="inlineStr"><is><t> 12</t></is></c>',
+         'G98': '<c r="G98" t="inlineStr"><is><t>+3</t></is></c>',
+         'H98': '<c r="H98" t="inlineStr"><is><t>-2</t></is></c>',
+         'I98': '<c r="I98" t="inlineStr"><is><t>1.5</t></is></c>',
+         'J98': '<c r="J98" t="b"><v>1</v></c>',
+         'C99': '<c r="C99" t="e"><v>#N/A</v></c>',
+         'D99': '<c r="D99" s="3"/>',
+         'E99': '<c r="E99" s="1"><v>3</v></c>',
+         'F99': '<c r="F99" t="str"><f>"7"</f><v>7</v></c>',
+         'G99': '<c r="G99" t="inlineStr"><is><t></t></is></c>',
+         'H99': '<c r="H99"><v>0</v></c>',
+         'I99': '<c r="I99" t="e"><v>#DIV/0!</v></c>',
+         'J99': '<c r="J99" t="b"><v>0</v></c>'}
+
+VALUES = [[12, 12, 0, 12, 3, -2, 0, 1],
+          [0, 0, 3, 7, 0, 0, 0, 0]]
+VALID = [[True, True, False, True, True, True, False, True],
+         [False, False, True, True, False, True, False, True]]
+
+
+@pytest.fixture(scope='module')
+def cells_workbook(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('blocks')
+    source = synthetic_workbook(directory / 'source.xlsx', na_density=0, gender_split=1.0)
+    return rewrite_workbook(source, directory / 'cells.xlsx', {sheet_part(FIRST_DATA_SHEET): set_cells(CELLS)},
+                            styles=True)
+
+
+@pytest.mark.parametrize('reader', READERS)
+def test_read_block_classifies_cells(cells_workbook, reader):
+    workbook = open_source_workbook(cells_workbook, reader)
+    try:
+        (values, valid) = read_block(workbook.sheet_by_index(FIRST_DATA_SHEET), 97, 2, 2, 8)
+    finally:
+        workbook.release_resources()
+    assert valid.tolist() == VALID
+    assert np.where(valid, values, 0).tolist() == VALUES
+
+
+@pytest.mark.parametrize('reader', READERS)
+def test_read_block_past_the_end_of_the_sheet(workbook, reader):
+    book = open_source_workbook(workbook, reader)
+    try:
+        sheet = book.sheet_by_index(FIRST_DATA_SHEET)
+        (values, valid) = read_block(sheet, sheet.nrows - 1, 3, 0, 4)
+    finally:
+        book.release_resources()
+    assert values.shape == valid.shape == (3, 4)
+    assert not valid[1:].any()
+    assert not values[1:].any()
+
+
+@pytest.mark.parametrize('reader', READERS)
+def test_read_observations_splits_genders(tmp_path, reader):
+    path = synthetic_workbook(tmp_path / 'split.xlsx', sites=1, na_density=0, gender_split=1.0)
+    book = open_source_workbook(path, reader)
+    try:
+        sheet = book.sheet_by_index(FIRST_DATA_SHEET)
+        (start_times, counts, valid) = read_observations(sheet, COUNT_ROWS[0], ('F', 'M'))
+        (values, _) = read_block(sheet, COUNT_ROWS[0] + 5, OBS_BINS, 0, 26)
+    finally:
+        book.release_resources()
+    assert counts.shape == (2, OBS_BINS, len(MOVEMENTS))
+    assert valid.all()
+    assert start_times[0] == pytest.approx(7 / 24.0)
+    # north_turn_right is recorded in column C (male) and D (female)
+    north_turn_right = MOVEMENTS.index('north_turn_right')
+    assert counts[0, :, north_turn_right].tolist() == values[:, 3].tolist()
+    assert counts[1, :, north_turn_right].tolist() == values[:, 2].tolist()
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from supertue.geo import mga_to_wgs84
+
+
+def _degrees(degrees, minutes, seconds):
+    sign = -1 if degrees < 0 else 1
+    return sign * (abs(degrees) + minutes / 60.0 + seconds / 3600.0)
+
+
+# (easting, northing, zone, longitude, latitude) of the worked examples of the GDA Technical Manual:
+# Flinders Peak and Buninyong, and the origin of zone 55 (on the equator, on the central meridian)
+REFERENCE_POINTS = [
+    (273741.2966, 5796489.7769, 55, _degrees(144, 25, 29.5244), _degrees(-37, 57, 3.7203)),
+    (758173.7968, 5828674.3407, 54, _degrees(143, 55, 35.3839), _degrees(-37, 39, 10.1561)),
+    (500000.0, 10000000.0, 55, 147.0, 0.0),
+]
+
+
+@pytest.mark.parametrize('easting, northing, zone, longitude, latitude', REFERENCE_POINTS)
+def test_reference_points(easting, northing, zone, longitude, latitude):
+    (lon, lat) = mga_to_wgs84([easting], [northing], zone)
+    # 1e-7 degrees is about a centimetre
+    assert lon[0] == pytest.approx(longitude, abs=1e-7)
+    assert lat[0] == pytest.approx(latitude, abs=1e-7)
+
+
+def test_every_point_at_once():
+    (easting, northing) = (np.array([273741.2966, 320000.0]), np.array([5796489.7769, 5820000.0]))
+    (lon, lat) = mga_to_wgs84(easting, northing)
+    for i in range(2):
+        (one_lon, one_lat) = mga_to_wgs84(easting[i:i + 1], northing[i:i + 1])
+        assert (lon[i], lat[i]) == (one_lon[0], one_lat[0])
+    # Moreland is a little north of Melbourne
+    assert 144.9 < lon[1] < 145.0 and -37.8 < lat[1] < -37.7
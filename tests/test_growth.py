@@ -0,0 +1,109 @@
+import random
+
+import numpy as np
+import pytest
+
+from supertue.extract import extract_store
+from supertue.growth import SERIES, GrowthEngine, growth_points
+from tests.workbooks import synthetic_workbook
+
+
+@pytest.fixture(scope='module')
+def points(tmp_path_factory):
+    # Riders of every site in each of five count years (the historic counts are not fitted)
+    path = synthetic_workbook(tmp_path_factory.mktemp('growth') / 'growth.xlsx', sites=6, blocks=7,
+                              legacy_blocks=2, na_density=0.3)
+    return growth_points(extract_store(path))
+
+
+def _refit(points):
+    engine = GrowthEngine()
+    engine.add_sites(points)
+    return engine
+
+
+def _assert_same_growth(engine, expected):
+    assert engine.sites == expected.sites
+    for countsite in expected.sites:
+        assert engine.sums[countsite].tolist() == expected.sums[countsite].tolist()
+        assert engine.latest[countsite].tolist() == expected.latest[countsite].tolist()
+    for series in SERIES:
+        (growth, expected_growth) = (engine.growth(series), expected.growth(series))
+        for field in expected_growth:
+            np.testing.assert_array_equal(growth[field], expected_growth[field])
+
+
+def test_set_point_matches_a_refit(points):
+    engine = GrowthEngine()
+    rows = [(countsite, year, values, valid) for (countsite, site_points) in points.items()
+            for (year, (values, valid)) in site_points.items()]
+    random.Random(1).shuffle(rows)
+    for (countsite, year, values, valid) in rows:
+        assert engine.set_point(countsite, year, values, valid)
+    _assert_same_growth(engine, _refit(points))
+    # Setting the same riders again changes nothing
+    (countsite, year, values, valid) = rows[0]
+    assert not engine.set_point(countsite, year, values.copy(), valid.copy())
+
+
+def test_changed_and_removed_points_match_a_refit(points):
+    engine = _refit(points)
+    rnd = random.Random(2)
+    expected = dict((countsite, dict(site_points)) for (countsite, site_points) in points.items())
+    for countsite in sorted(points):
+        years = sorted(points[countsite])
+        # Change the riders of the latest and one other year, with one series NA
+        for year in (years[-1], rnd.choice(years)):
+            (values, valid) = expected[countsite][year]
+            (values, valid) = (values + rnd.randint(1, 50), valid.copy())
+            valid[rnd.randrange(len(SERIES))] = not valid.all()
+            engine.set_point(countsite, year, values, valid)
+            expected[countsite][year] = (values, valid)
+        # Remove the latest year, then one more
+        for year in (years[-1], rnd.choice(years[:-1])):
+            engine.remove_point(countsite, year)
+            del expected[countsite][year]
+    _assert_same_growth(engine, _refit(expected))
+
+
+def test_removing_every_point_removes_the_site(points):
+    engine = _refit(points)
+    countsite = sorted(points)[0]
+    for year in sorted(points[countsite]):
+        engine.remove_point(countsite, year)
+    assert countsite not in engine.sites
+    assert engine.sites == sorted(points)[1:]
+
+
+def test_growth_against_a_least_squares_fit(points):
+    engine = _refit(points)
+    growth = engine.growth('allriders')
+    for (i, countsite) in enumerate(engine.sites):
+        years = sorted(points[countsite])
+        riders = [points[countsite][year][0][SERIES.index('allriders')] for year in years]
+        assert growth['Number of times counted'][i] == len(years)
+        assert growth['Most recent count year'][i] == years[-1]
+        assert growth['Most recent count value'][i] == riders[-1]
+        if len(years) >= 3:
+            slope = np.polyfit(years, riders, 1)[0]
+            assert abs(growth['annual increase'][i] - slope) <= 0.5
+            assert growth['rvalue'][i] == pytest.approx(np.corrcoef(years, riders)[0, 1], abs=0.0005)
+        else:
+            assert np.isnan(growth['annual increase'][i])
+
+
+def test_update_matches_a_refit(tmp_path):
+    # One site removed, one unchanged, the others counted differently
+    first = extract_store(synthetic_workbook(tmp_path / 'first.xlsx', sites=4, seed=1))
+    second = extract_store(synthetic_workbook(tmp_path / 'second.xlsx', sites=3, seed=2))
+    second.add_site(first.sites['S-SyntheticSite0'], first.select(site='S-SyntheticSite0'),
+                    first.hashes['S-SyntheticSite0'])
+    engine = GrowthEngine()
+    assert engine.update(first) == 4 * 3
+    assert engine.update(first) == 0
+    # Site 3 removed (3 points), sites 1 and 2 changed (3 points each), site 0 not looked at
+    assert engine.update(second) == 3 + 2 * 3
+    expected = GrowthEngine()
+    expected.update(second)
+    _assert_same_growth(engine, expected)
+    assert engine.hashes == second.hashes
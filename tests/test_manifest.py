@@ -0,0 +1,120 @@
+import json
+import os
+
+import pytest
+
+from supertue.layout import FIRST_DATA_SHEET
+from supertue.manifest import MANIFEST_VERSION, Manifest
+from supertue.store import LOCATION_FIELDS, Site
+from tests.workbooks import rewrite_workbook, set_cells, sheet_part, synthetic_workbook
+
+
+def _record(countsite, content_hash, worksheet_num=FIRST_DATA_SHEET):
+    return {'countsite': countsite, 'worksheet_num': worksheet_num, 'hash': content_hash,
+            'site': Site(worksheet_num, [countsite] + [''] * (len(LOCATION_FIELDS) - 1))}
+
+
+def _outputs(directory, countsite, dates):
+    paths = []
+    for count_date in dates:
+        path = os.path.join(str(directory), countsite, count_date, countsite + count_date + '.csv')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as output:
+            output.write('countsite\n')
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def saved(tmp_path):
+    # A manifest of two sites, as saved by a run
+    path = str(tmp_path / 'manifest.json')
+    manifest = Manifest(path)
+    outputs = {'A': _outputs(tmp_path, 'A', ['2010-03-02', '2012-03-06']),
+               'B': _outputs(tmp_path, 'B', ['2010-03-02'])}
+    for (num, countsite) in enumerate(sorted(outputs)):
+        manifest.update(_record(countsite, 'hash ' + countsite, FIRST_DATA_SHEET + num), outputs[countsite])
+    manifest.finish()
+    manifest.save()
+    assert manifest.added == ['A', 'B']
+    return path, outputs
+
+
+def test_unchanged_sheets_are_skipped(saved):
+    (path, outputs) = saved
+    manifest = Manifest(path)
+    assert manifest.known_hashes() == {'A': 'hash A', 'B': 'hash B'}
+    # A site with a missing output is scraped again
+    os.remove(outputs['A'][1])
+    assert Manifest(path).known_hashes() == {'B': 'hash B'}
+    assert Manifest(path, full=True).known_hashes() == {}
+
+
+def test_an_older_manifest_is_ignored(saved):
+    (path, outputs) = saved
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    manifest['version'] = MANIFEST_VERSION - 1
+    with open(path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    assert Manifest(path).known_hashes() == {}
+
+
+def test_a_changed_sheet_loses_the_outputs_it_no_longer_writes(saved, tmp_path):
+    (path, outputs) = saved
+    manifest = Manifest(path)
+    manifest.update(_record('A', 'new hash'), outputs['A'][:1])
+    manifest.keep(_record('B', 'hash B', FIRST_DATA_SHEET + 1))
+    manifest.finish()
+    assert (manifest.changed, manifest.unchanged, manifest.removed) == (['A'], ['B'], [])
+    assert os.path.exists(outputs['A'][0])
+    # The file is gone, and so is its count date directory
+    assert not os.path.exists(os.path.dirname(outputs['A'][1]))
+    assert os.path.isdir(str(tmp_path / 'A'))
+    manifest.save()
+    assert Manifest(path).known_hashes() == {'A': 'new hash', 'B': 'hash B'}
+
+
+def test_a_removed_sheet_loses_its_outputs(saved, tmp_path):
+    (path, outputs) = saved
+    manifest = Manifest(path)
+    manifest.keep(_record('A', 'hash A'))
+    manifest.finish()
+    assert manifest.removed == ['B']
+    assert not os.path.exists(str(tmp_path / 'B'))
+    assert all(os.path.exists(output) for output in outputs['A'])
+    manifest.save()
+    assert sorted(Manifest(path).sheets) == ['A']
+
+
+def test_partly_written_sites_are_written_in_full_next_time(saved):
+    (path, outputs) = saved
+    manifest = Manifest(path)
+    manifest.add_outputs(_record('A', 'hash A'), outputs['A'][1:])
+    manifest.keep(_record('B', 'hash B', FIRST_DATA_SHEET + 1))
+    manifest.finish()
+    manifest.save()
+    assert Manifest(path).known_hashes() == {'A': None, 'B': 'hash B'}
+    assert Manifest(path).sheets['A']['outputs'] == sorted(outputs['A'])
+
+
+def test_cleaner_reruns(tmp_path, cleaner):
+    workbook = synthetic_workbook(tmp_path / 'counts.xlsx', sites=3)
+    observations = os.path.join('script_output', 'count_observations')
+    assert '0 sheets unchanged, 0 changed, 3 added, 0 removed' in cleaner('-q', workbook)
+    written = sorted(os.listdir(os.path.join(observations, 'S-SyntheticSite1')))
+    assert len(written) == 3
+    assert '3 sheets unchanged, 0 changed, 0 added, 0 removed' in cleaner('-q', workbook)
+
+    # The first count of site 1 is no longer a count: its file goes, the others stay
+    edits = {sheet_part(FIRST_DATA_SHEET + 1): set_cells({'C93': '<c r="C93" t="inlineStr"><is><t>x</t></is></c>'})}
+    rewrite_workbook(workbook, workbook + '.new', edits)
+    os.rename(workbook + '.new', workbook)
+    assert '2 sheets unchanged, 1 changed, 0 added, 0 removed' in cleaner('-q', workbook)
+    assert sorted(os.listdir(os.path.join(observations, 'S-SyntheticSite1'))) == written[1:]
+
+    # Site 2 is no longer in the workbook
+    synthetic_workbook(workbook, sites=2)
+    assert '1 sheets unchanged, 1 changed, 0 added, 1 removed' in cleaner('-q', workbook)
+    assert not os.path.exists(os.path.join(observations, 'S-SyntheticSite2'))
+    assert sorted(os.listdir(observations)) == ['S-SyntheticSite0', 'S-SyntheticSite1']
@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import super_tue_cleaner
+from supertue.columnar import STORE_DIR
+from supertue.extract import extract_store
+from supertue.growth import GROWTH_STORE_FILE, SERIES
+from supertue.service import QueryService
+from tests.workbooks import synthetic_workbook
+
+
+@pytest.fixture(scope='module')
+def run_dir(tmp_path_factory):
+    # The stores of a cleaner run with --store
+    directory = str(tmp_path_factory.mktemp('service'))
+    workbook = synthetic_workbook(os.path.join(directory, 'counts.xlsx'), sites=3, blocks=5)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        super_tue_cleaner.main(['-q', '--store', workbook])
+    finally:
+        os.chdir(cwd)
+    return directory
+
+
+@pytest.fixture(scope='module')
+def store(run_dir):
+    return extract_store(os.path.join(run_dir, 'counts.xlsx'))
+
+
+@pytest.fixture
+def service(run_dir):
+    return QueryService(os.path.join(run_dir, STORE_DIR), os.path.join(run_dir, GROWTH_STORE_FILE))
+
+
+def _get(service, url, status=200):
+    (answer_status, body) = service.query(url)
+    assert answer_status == status, body
+    return json.loads(body.decode('utf-8'))
+
+
+def test_sites(service, store):
+    sites = _get(service, '/sites')
+    assert [site['countsite'] for site in sites] == list(store.sites)
+    assert sites[1]['suburb'] == store.sites['S-SyntheticSite1'].suburb
+
+
+def test_site(service, store):
+    answer = _get(service, '/sites/S-SyntheticSite1')
+    assert answer['site']['countsite'] == 'S-SyntheticSite1'
+    counts = store.select(site='S-SyntheticSite1')
+    assert [count['count_date'] for count in answer['counts']] == [str(count.count_date) for count in counts]
+    for (count, expected) in zip(answer['counts'], counts):
+        assert count['legacy'] == expected.legacy
+        assert count['genders'] == list(expected.genders)
+        assert count['summary'] == dict((direction, expected.total(direction)) for direction in count['summary'])
+
+
+def test_observations(service, store):
+    count = store.select(site='S-SyntheticSite0', date='2010-03-02')[0]
+    answer = _get(service, '/sites/S-SyntheticSite0/2010-03-02')
+    assert answer['count_date'] == '2010-03-02'
+    rows = list(count.rows())
+    assert len(answer['rows']) == len(rows)
+    for (row, (gender, start, counts, valid)) in zip(answer['rows'], rows):
+        assert row['gender'] == gender
+        assert row['time'] == str(start)
+        assert row['counts'] == [int(n) if ok else None for (n, ok) in zip(counts, valid)]
+
+
+def test_year(service, store):
+    answer = _get(service, '/years/2012')
+    assert [site['countsite'] for site in answer] == sorted(store.sites)
+    for site in answer:
+        count = store.select(site=site['countsite'], year=2012)[0]
+        assert site['allriders'] == sum(int(n) for n in count.counts[count.valid])
+        if 'F' in count.genders:
+            assert site['female'] + site['male'] == site['allriders']
+            assert site['gender_split'] == round(100.0 * site['female'] / site['allriders'], 2)
+        else:
+            assert (site['female'], site['male'], site['gender_split']) == (0, 0, None)
+
+
+@pytest.mark.parametrize('series', SERIES)
+def test_growth_of_every_series(service, series):
+    answer = _get(service, '/growth?series=' + series)
+    assert [site['countsite'] for site in answer] == ['S-SyntheticSite0', 'S-SyntheticSite1', 'S-SyntheticSite2']
+    assert all(site['Number_of_times_counted'] == 4 for site in answer)
+    assert all(site['Most_recent_count_year'] == 2016 for site in answer)
+
+
+def test_growth_defaults_to_all_riders(service):
+    assert _get(service, '/growth') == _get(service, '/growth?series=allriders')
+    assert _get(service, '/growth?riders=female') == _get(service, '/growth?series=female')
+
+
+@pytest.mark.parametrize('url, status', [('/sites/Nope', 404),
+                                         ('/sites/Nope/2010-03-02', 404),
+                                         ('/sites/S-SyntheticSite0/2011-03-01', 404),
+                                         ('/sites/S-SyntheticSite0/2009-03-03', 404),
+                                         ('/sites/S-SyntheticSite0/2010-02-30', 400),
+                                         ('/sites/S-SyntheticSite0/2010-13-45', 400),
+                                         ('/years/1999', 404),
+                                         ('/growth?series=bogus', 400),
+                                         ('/nothing', 404)])
+def test_errors(service, url, status):
+    assert 'error' in _get(service, url, status)
+
+
+def test_failed_requests_are_answered(service, capsys):
+    service.routes = [(pattern, lambda data, params: 1 // 0) for (pattern, route) in service.routes]
+    assert _get(service, '/sites', 500) == {'error': 'internal error'}
+    assert 'ZeroDivisionError' in capsys.readouterr().err
+
+
+def test_no_store(tmp_path):
+    service = QueryService(str(tmp_path / 'observation_store'), str(tmp_path / 'growth_store.pkl'))
+    assert 'run the cleaner with --store' in _get(service, '/sites', 503)['error']
+
+
+def test_new_stores_are_picked_up(run_dir, tmp_path, cleaner):
+    # A copy of the stores, then a later run of the cleaner (without --store) without the third site
+    shutil.copytree(os.path.join(run_dir, 'script_output'), str(tmp_path / 'script_output'))
+    service = QueryService(str(tmp_path / STORE_DIR), str(tmp_path / GROWTH_STORE_FILE))
+    assert len(_get(service, '/sites')) == 3
+    assert len(service.cache) == 1
+    cleaner('-q', synthetic_workbook(tmp_path / 'counts.xlsx', sites=2, blocks=5))
+    assert [site['countsite'] for site in _get(service, '/sites')] == ['S-SyntheticSite0', 'S-SyntheticSite1']
+    assert len(_get(service, '/growth')) == 2
+    _get(service, '/sites/S-SyntheticSite2', 404)
@@ -0,0 +1,67 @@
+import hashlib
+
+import pytest
+
+from supertue.extract import extract_store
+from supertue.store import CountStore, merge_stores
+from tests.workbooks import synthetic_workbook
+
+
+@pytest.fixture(scope='module')
+def stores(tmp_path_factory):
+    # An older workbook of four sites with counts in 2010, 2012 and 2014, and a newer one of two sites
+    # with other counts in 2010 and 2012
+    directory = tmp_path_factory.mktemp('merge')
+    older = extract_store(synthetic_workbook(directory / 'older.xlsx', sites=4, blocks=4, seed=1))
+    newer = extract_store(synthetic_workbook(directory / 'newer.xlsx', sites=2, blocks=3, seed=2))
+    return older, newer
+
+
+def _dates(store, countsite):
+    return [str(count.count_date) for count in store.select(site=countsite)]
+
+
+def test_later_stores_take_precedence(stores):
+    (older, newer) = stores
+    merged = merge_stores([older, newer])
+    for countsite in newer.sites:
+        assert merged.sites[countsite] is newer.sites[countsite]
+        counts = merged.select(site=countsite)
+        # The counts of the newer workbook, in its order, then the count only the older workbook has
+        assert counts[:len(newer.select(site=countsite))] == newer.select(site=countsite)
+        assert _dates(merged, countsite) == _dates(newer, countsite) + ['2014-03-04']
+        assert counts[-1] is older.select(site=countsite, date='2014-03-04')[0]
+    # Sites only in the older workbook come after the newer workbook's sites
+    assert list(merged.sites) == list(newer.sites) + [countsite for countsite in older.sites
+                                                      if countsite not in newer.sites]
+    assert merged.select(site='S-SyntheticSite3') == older.select(site='S-SyntheticSite3')
+
+
+def test_precedence_follows_the_order(stores):
+    (older, newer) = stores
+    merged = merge_stores([newer, older])
+    for countsite in newer.sites:
+        assert merged.sites[countsite] is older.sites[countsite]
+        assert merged.select(site=countsite) == older.select(site=countsite)
+
+
+def test_merged_hashes(stores):
+    (older, newer) = stores
+    merged = merge_stores([older, newer])
+    assert merged.hashes['S-SyntheticSite3'] == older.hashes['S-SyntheticSite3']
+    combined = ' '.join([newer.hashes['S-SyntheticSite0'], older.hashes['S-SyntheticSite0']])
+    assert merged.hashes['S-SyntheticSite0'] == hashlib.sha1(combined.encode('utf-8')).hexdigest()
+    assert merge_stores([older]).hashes == older.hashes
+
+
+def test_indexes_of_the_merged_store(stores):
+    merged = merge_stores(list(stores))
+    assert merged.years() == sorted(set(count.year for count in merged.counts))
+    assert all(count.year == 2012 for count in merged.select(year=2012))
+    assert all('F' in count.genders for count in merged.select(gender='F'))
+    assert len(merged.counts) == sum(len(merged.select(site=countsite)) for countsite in merged.sites)
+
+
+def test_merge_nothing():
+    merged = merge_stores([CountStore(), CountStore()])
+    assert not merged.sites and not merged.counts
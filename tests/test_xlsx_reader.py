@@ -0,0 +1,78 @@
+import pytest
+import xlrd
+
+from supertue.discover import data_sheets, scan_sheet, sheet_names
+from supertue.layout import FIRST_DATA_SHEET
+from supertue.xlsx_reader import (XL_CELL_BOOLEAN, XL_CELL_DATE, XL_CELL_EMPTY, XL_CELL_ERROR, XL_CELL_NUMBER,
+                                  XL_CELL_TEXT, StreamingWorkbook, is_date_format)
+from tests.test_blocks import CELLS
+from tests.workbooks import rewrite_workbook, set_cells, sheet_part, synthetic_workbook
+
+
+# Text cells of the third count site: whitespace, escaped characters and rich text
+TEXT_CELLS = {'C98': '<c r="C98" t="inlineStr"><is><t xml:space="preserve"> 5 </t></is></c>',
+              'D98': '<c r="D98" t="inlineStr"><is><t>a_x0009_b</t></is></c>',
+              'E98': '<c r="E98" t="inlineStr"><is><r><t>rich</t></r><r><t xml:space="preserve"> text</t></r>'
+                     '<rPh><t>phonetic</t></rPh></is></c>',
+              'F98': '<c r="F98" t="str"><f>A1</f><v> 6 </v></c>'}
+
+
+@pytest.fixture(scope='module')
+def parity_workbook(tmp_path_factory):
+    # Date styles (the count dates in built in and custom date formats), error cells, a chartsheet first
+    directory = tmp_path_factory.mktemp('parity')
+    source = synthetic_workbook(directory / 'source.xlsx', gender_split=1.0)
+    cells = [CELLS, {'A98': '<c r="A98" s="3"><v>0.3125</v></c>'}, TEXT_CELLS, {}]
+    edits = {}
+    for (k, sheet_cells) in enumerate(cells):
+        if k:
+            sheet_cells = dict(sheet_cells, C93='<c r="C93" s="%d"><v>40238.0</v></c>' % (1 + k % 2))
+        edits[sheet_part(FIRST_DATA_SHEET + k)] = set_cells(sheet_cells)
+    return rewrite_workbook(source, directory / 'parity.xlsx', edits, styles=True, chartsheet=True)
+
+
+def test_sheets_match_xlrd(parity_workbook):
+    expected = xlrd.open_workbook(parity_workbook, on_demand=True)
+    workbook = StreamingWorkbook(parity_workbook)
+    try:
+        assert workbook.sheet_names() == expected.sheet_names()
+        assert workbook.nsheets == expected.nsheets
+        assert 'Chart1' not in workbook.sheet_names()
+        for sheetx in range(expected.nsheets):
+            (sheet, xlrd_sheet) = (workbook.sheet_by_index(sheetx), expected.sheet_by_index(sheetx))
+            assert (sheet.name, sheet.nrows, sheet.ncols) == (xlrd_sheet.name, xlrd_sheet.nrows, xlrd_sheet.ncols)
+            for rowx in range(xlrd_sheet.nrows):
+                assert list(sheet.row_types(rowx)) == list(xlrd_sheet.row_types(rowx))
+                assert sheet.row_values(rowx) == xlrd_sheet.row_values(rowx)
+            assert scan_sheet(sheet) == scan_sheet(xlrd_sheet)
+    finally:
+        workbook.release_resources()
+        expected.release_resources()
+
+
+def test_cell_types(parity_workbook):
+    workbook = StreamingWorkbook(parity_workbook)
+    try:
+        sheet = workbook.sheet_by_index(FIRST_DATA_SHEET)
+        assert sheet.row_types(97, 2, 10) == [XL_CELL_NUMBER, XL_CELL_NUMBER] + [XL_CELL_TEXT] * 5 + [XL_CELL_BOOLEAN]
+        assert sheet.row_types(98, 2, 7) == [XL_CELL_ERROR, XL_CELL_EMPTY, XL_CELL_DATE, XL_CELL_TEXT, XL_CELL_EMPTY]
+        assert sheet.row_values(98, 2, 4) == [0x2A, '']
+        assert workbook.sheet_by_index(FIRST_DATA_SHEET + 2).row_values(97, 2, 6) == [' 5 ', 'a\tb', 'rich text', '6']
+        assert workbook.sheet_by_index(FIRST_DATA_SHEET + 1).cell(92, 2).ctype == XL_CELL_DATE
+        with pytest.raises(IndexError):
+            sheet.cell(0, sheet.ncols)
+    finally:
+        workbook.release_resources()
+
+
+def test_discovery_skips_chartsheets(workbook, parity_workbook):
+    assert sheet_names(parity_workbook) == xlrd.open_workbook(parity_workbook, on_demand=True).sheet_names()
+    assert data_sheets(parity_workbook) == data_sheets(workbook) == list(range(FIRST_DATA_SHEET, FIRST_DATA_SHEET + 4))
+    assert data_sheets(parity_workbook, sites={'S-SyntheticSite2'}) == [FIRST_DATA_SHEET + 2]
+
+
+@pytest.mark.parametrize('format_code, is_date', [('d/mm/yyyy', True), ('h:mm', True), ('[h]:mm:ss', True),
+                                                  ('0.0', False), ('General', False), ('"days" 0', False),
+                                                  ('[Red]0.00', False), ('@', False)])
+def test_is_date_format(format_code, is_date):
+    assert is_date_format(format_code) == is_date
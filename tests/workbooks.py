@@ -0,0 +1,86 @@
+# Bike Count Data Cleaner - test workbooks
+# Synthetic workbooks (see supertue/synthetic.py), and copies of them with cells, styles or sheets changed.
+# -----------------------------
+
+import re
+import zipfile
+
+from supertue.synthetic import make_workbook
+
+
+RELATIONSHIPS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+
+# Cell styles: 0 General, 1 a built in date format (14), 2 a custom date format, 3 a custom number format
+STYLES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+          '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+          '<numFmts count="2"><numFmt numFmtId="164" formatCode="d/mm/yyyy"/>'
+          '<numFmt numFmtId="165" formatCode="0.0"/></numFmts>'
+          '<cellStyleXfs count="1"><xf numFmtId="0"/></cellStyleXfs>'
+          '<cellXfs count="4"><xf numFmtId="0"/><xf numFmtId="14"/><xf numFmtId="164"/><xf numFmtId="165"/></cellXfs>'
+          '</styleSheet>')
+CHARTSHEET = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+              '<chartsheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+              '<sheetViews><sheetView workbookViewId="0"/></sheetViews></chartsheet>')
+
+
+def synthetic_workbook(path, sites=4, blocks=4, legacy_blocks=1, na_density=0.1, gender_split=0.75, seed=1):
+    # A synthetic workbook, returns its path as a string
+    path = str(path)
+    make_workbook(path, sites, blocks, legacy_blocks, na_density, gender_split, seed)
+    return path
+
+
+def sheet_part(worksheet_num):
+    # The worksheet part of a sheet of a synthetic workbook
+    return 'xl/worksheets/sheet%d.xml' % (worksheet_num + 1)
+
+
+def set_cells(cells):
+    """
+    An edit of a worksheet part replacing cells, {excel reference: <c> element}.
+    Only cells the synthetic workbook has written can be replaced.
+    """
+    def edit(xml):
+        for (ref, element) in cells.items():
+            (xml, found) = re.subn(r'<c r="%s"[^>]*?(/>|>.*?</c>)' % ref, lambda match: element, xml, count=1)
+            assert found, ref
+        return xml
+    return edit
+
+
+def rewrite_workbook(src, dst, edits=None, styles=False, chartsheet=False):
+    """
+    Copy a workbook, with edits {part: function(xml) -> xml} applied to its parts.
+    styles adds STYLES, chartsheet adds a chartsheet in front of every worksheet.
+    Returns dst as a string.
+    """
+    edits = dict(edits or {})
+    dst = str(dst)
+    rels = []
+    if styles:
+        rels.append('<Relationship Id="rIdStyles" Type="%sstyles" Target="styles.xml"/>' % RELATIONSHIPS)
+    if chartsheet:
+        rels.append('<Relationship Id="rIdChart" Type="%schartsheet" Target="chartsheets/sheet1.xml"/>'
+                    % RELATIONSHIPS)
+        edits['xl/workbook.xml'] = lambda xml: xml.replace(
+            '<sheets>', '<sheets><sheet name="Chart1" sheetId="999" r:id="rIdChart"/>', 1)
+    if rels:
+        edits['xl/_rels/workbook.xml.rels'] = lambda xml: xml.replace('</Relationships>',
+                                                                      ''.join(rels) + '</Relationships>')
+
+    source = zipfile.ZipFile(str(src))
+    target = zipfile.ZipFile(dst, 'w', zipfile.ZIP_DEFLATED)
+    try:
+        for member in source.infolist():
+            data = source.read(member.filename)
+            if member.filename in edits:
+                data = edits[member.filename](data.decode('utf-8')).encode('utf-8')
+            target.writestr(member, data)
+        if styles:
+            target.writestr('xl/styles.xml', STYLES)
+        if chartsheet:
+            target.writestr('xl/chartsheets/sheet1.xml', CHARTSHEET)
+    finally:
+        source.close()
+        target.close()
+    return dst